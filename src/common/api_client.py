@@ -1,17 +1,22 @@
 import base64
 import json
 import logging
+import random
 import sys
+import threading
 import time
 from datetime import date
 from datetime import datetime
 from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
 from typing import Union
 
 import boto3
 import pandas as pd
 import requests
 from flatten_json import flatten
+from requests.adapters import HTTPAdapter
 
 
 def initialize_log(name) -> logging.Logger:
@@ -33,6 +38,155 @@ def initialize_log(name) -> logging.Logger:
 
 logger = initialize_log("common.APIClient")
 
+# Sessions are cached at module level so that warm Lambda invocations (and
+# consecutive Glue chunks) keep reusing already established connections.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_pooled_session(
+    pool_connections: int = 10, pool_maxsize: int = 10, pool_block: bool = False
+) -> requests.Session:
+    """
+    Returns a keep-alive requests.Session backed by a pooled HTTPAdapter.
+
+    :param pool_connections: Number of per-host connection pools to cache.
+    :param pool_maxsize: Maximum number of connections kept alive per host.
+    :param pool_block: Whether to block when all connections of a host are busy
+        instead of opening (and discarding) extra connections.
+    """
+    key = (pool_connections, pool_maxsize, pool_block)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            logger.info(
+                f"Creating pooled session: pool_connections={pool_connections}, "
+                f"pool_maxsize={pool_maxsize}, pool_block={pool_block}"
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=pool_block,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+    return session
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for API calls.
+
+    429 and 503 responses mean the request was rejected before being processed,
+    so they are retried for any method. Other retryable statuses and connection
+    errors are only retried for idempotent requests, search POSTs included.
+
+    :param max_retries: Maximum number of retries for a single request.
+    :param backoff_factor: Base delay in seconds, doubled on every attempt.
+    :param max_backoff: Upper bound in seconds for a single wait.
+    :param retry_budget: Maximum number of retries shared by all the requests
+        of a client, i.e. per Lambda invocation.
+    :param retry_statuses: HTTP status codes worth retrying.
+    """
+
+    IDEMPOTENT_METHODS = {"get", "head", "options", "put", "delete"}
+    REJECTED_STATUSES = {429, 503}
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_factor: float = 1.0,
+        max_backoff: float = 60.0,
+        retry_budget: int = 50,
+        retry_statuses: tuple = (429, 500, 502, 503, 504),
+    ):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_budget = retry_budget
+        self.retry_statuses = set(retry_statuses)
+        self.retries_used = 0
+        self._lock = threading.Lock()
+
+    def is_idempotent(self, method: str, endpoint: str) -> bool:
+        """
+        Search endpoints only read data, so their POSTs are safe to repeat.
+        """
+        return (
+            method.lower() in self.IDEMPOTENT_METHODS
+            or endpoint.split("?")[0].endswith(":search")
+        )
+
+    def should_retry(
+        self,
+        method: str,
+        endpoint: str,
+        attempt: int,
+        status_code: int = None,
+        idempotent: bool = None,
+    ) -> bool:
+        """
+        Decides whether a failed attempt is retried, consuming the retry budget if so.
+
+        :param attempt: Zero based number of the attempt that failed.
+        :param status_code: The response status, None for connection errors.
+        :param idempotent: Whether the request is safe to repeat, derived from
+            method and endpoint when None.
+        """
+        if attempt >= self.max_retries:
+            return False
+        if idempotent is None:
+            idempotent = self.is_idempotent(method, endpoint)
+        if status_code is not None:
+            if status_code not in self.retry_statuses:
+                return False
+            if status_code not in self.REJECTED_STATUSES and not idempotent:
+                return False
+        elif not idempotent:
+            return False
+
+        with self._lock:
+            if self.retries_used >= self.retry_budget:
+                logger.warning(
+                    f"Retry budget of {self.retry_budget} retries exhausted, giving up."
+                )
+                return False
+            self.retries_used += 1
+        return True
+
+    def get_delay(self, attempt: int, response=None) -> float:
+        """
+        Seconds to wait before the next attempt, honouring the Retry-After header.
+        """
+        if response is not None:
+            retry_after = self.parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_factor * (2**attempt))
+        )
+
+    @staticmethod
+    def parse_retry_after(value) -> Optional[float]:
+        """
+        Parses a Retry-After header given either as seconds or as an HTTP date.
+        """
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
 
 class APIClient:
     """
@@ -50,6 +204,14 @@ class APIClient:
     :param base_url: The API base URL ending with "/"
     :param login_url: (used with OAuth2) Login URL ending with "/"
     :param boto3_session: Pass a custom boto3 session.
+    :param pool_connections: Number of per-host connection pools to keep.
+    :param pool_maxsize: Maximum number of keep-alive connections per host.
+    :param pool_block: Block instead of exceeding pool_maxsize connections per host.
+    :param session: Pass a custom requests session, skips the pooled session cache.
+    :param retry_policy: Pass a custom RetryPolicy, defaults to RetryPolicy().
+    :param max_in_flight: Maximum number of concurrent HTTP calls shared by all
+        threads using this client, unlimited when None.
+    :param timeout: Timeout in seconds of a single request, login included.
     """
 
     def __init__(
@@ -59,9 +221,24 @@ class APIClient:
         secrets_manager: bool = False,
         login_url: str = None,
         boto3_session: boto3.Session = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+        session: requests.Session = None,
+        retry_policy: RetryPolicy = None,
+        max_in_flight: int = None,
+        timeout: float = 300,
     ):
         self.base_url = base_url
         self.login_url = login_url
+        self.session = session or get_pooled_session(
+            pool_connections, pool_maxsize, pool_block
+        )
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.timeout = timeout
+        self.in_flight = (
+            threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        )
         self.auth = self.get_secret(self, auth, secrets_manager, boto3_session)
 
     @staticmethod
@@ -102,7 +279,7 @@ class APIClient:
                     secret_value["password"] += secret_value["security_token"]
                     secret_value.pop("security_token", None)
 
-                # Call login function with 3 retries
+                # Call login function, retrying with the retry policy
                 self.login(secret_value)
 
                 # Sub case: for SalesForce Service Cloud
@@ -119,25 +296,45 @@ class APIClient:
             return secret_value
 
     def login(self, secret_value):
-        max_retries = 3
-        for attempt in range(max_retries):
-            response = requests.post(self.login_url, data=secret_value)
+        """
+        Logs in at login_url. Failed attempts are retried within the retry
+        policy limits and budget, a login being safe to repeat; client errors
+        other than 429 are not retried.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    self.login_url, data=secret_value, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if not self.retry_policy.should_retry(
+                    "post", self.login_url, attempt, idempotent=True
+                ):
+                    raise
+                logger.info(f"Login attempt {attempt + 1}: failed with {error!r}")
+                time.sleep(self.retry_policy.get_delay(attempt))
+                attempt += 1
+                continue
+
             if response.status_code == 200:
                 self.login_payload = self.parse_response(response)
                 logger.info("Login success!")
+                return
+
+            logger.info(
+                f"Login attempt {attempt + 1}: failed with status code {response.status_code}"
+            )
+            if not self.retry_policy.should_retry(
+                "post", self.login_url, attempt, response.status_code, idempotent=True
+            ):
                 break
-            else:
-                logger.info(
-                    f"Login attempt{attempt + 1}: failed with status code {response.status_code}, retrying.."
-                )
-                if attempt < max_retries - 1:  # Only sleep if it's not the last attempt
-                    time.sleep(1)
-        else:
-            # This block executes if all attempts failed
-            e = f"Failed to authinticate after {max_retries} attempts"
-            logger.error(e)
-            raise Exception(e)
-            # TO DO: implementing a backoff strategy
+            time.sleep(self.retry_policy.get_delay(attempt, response))
+            attempt += 1
+
+        e = f"Failed to authenticate after {attempt + 1} attempts"
+        logger.error(e)
+        raise Exception(e)
 
     @staticmethod
     def parse_response(response):
@@ -154,17 +351,24 @@ class APIClient:
         return response
 
     def make_request(
-        self, method, endpoint, json_body=None, query=None, body=None, files=None
+        self,
+        method,
+        endpoint,
+        json_body=None,
+        query=None,
+        body=None,
+        files=None,
+        return_headers=False,
     ):
         methods = {
-            "get": requests.get,
-            "post": requests.post,
-            "put": requests.put,
-            "delete": requests.delete,
+            "get": self.session.get,
+            "post": self.session.post,
+            "put": self.session.put,
+            "delete": self.session.delete,
         }
 
         method = method.lower()
-        request = methods.get(method, requests.get)
+        request = methods.get(method, self.session.get)
 
         request_params = {
             "headers": {
@@ -178,6 +382,7 @@ class APIClient:
             "params": query,
             "data": body,
             "files": files,
+            "timeout": self.timeout,
         }
 
         logger.info(
@@ -186,7 +391,37 @@ class APIClient:
             else f"Calling:{self.base_url}{endpoint}"
         )
 
-        response = request(self.base_url + endpoint, **request_params)
+        attempt = 0
+        while True:
+            try:
+                if self.in_flight is None:
+                    response = request(self.base_url + endpoint, **request_params)
+                else:
+                    with self.in_flight:
+                        response = request(self.base_url + endpoint, **request_params)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if not self.retry_policy.should_retry(method, endpoint, attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                logger.warning(
+                    f"Attempt {attempt + 1} failed with {error!r}, retrying in {delay:.2f}s.."
+                )
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if self.retry_policy.should_retry(
+                method, endpoint, attempt, response.status_code
+            ):
+                delay = self.retry_policy.get_delay(attempt, response)
+                logger.warning(
+                    f"Attempt {attempt + 1} failed with status code {response.status_code}, retrying in {delay:.2f}s.."
+                )
+                time.sleep(delay)
+                attempt += 1
+                continue
+            break
+
         parsed_response = self.parse_response(response)
         try:
             response.raise_for_status()
@@ -197,6 +432,8 @@ class APIClient:
             # fallback to requests exception
             raise error
 
+        if return_headers:
+            return parsed_response, response.headers
         return parsed_response
 
     def get(
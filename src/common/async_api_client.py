@@ -0,0 +1,275 @@
+import asyncio
+import json
+from typing import Union
+
+import aiohttp
+import boto3
+from api_client import APIClient
+from api_client import initialize_log
+from api_client import RetryPolicy
+
+logger = initialize_log("common.AsyncAPIClient")
+
+
+class APIResponseError(aiohttp.ClientResponseError):
+    """
+    Error status of a response, with its parsed body since the response is
+    already released when the error is raised.
+    """
+
+    def __init__(self, response: aiohttp.ClientResponse, body):
+        super().__init__(
+            response.request_info,
+            response.history,
+            status=response.status,
+            message=response.reason or "",
+            headers=response.headers,
+        )
+        self.body = body
+
+
+class AsyncAPIClient(APIClient):
+    """
+    Asyncio variant of APIClient, with the same get/post/put/delete and
+    process_response options.
+
+    Authentication happens once in the constructor with the synchronous client,
+    requests then go through a pooled aiohttp session which must be opened with
+    "async with":
+
+        async with AsyncAPIClient(auth, base_url, max_in_flight=100) as client:
+            pages = await asyncio.gather(*(client.get(...) for ...))
+
+    :param max_in_flight: Maximum number of concurrent requests, also the size of
+        the connection pool.
+    :param limit_per_host: Maximum number of connections per host, 0 for no limit.
+    :param timeout: Total timeout of a single request in seconds.
+    """
+
+    def __init__(
+        self,
+        auth: Union[str, dict],
+        base_url: str = "",
+        secrets_manager: bool = False,
+        login_url: str = None,
+        boto3_session: boto3.Session = None,
+        retry_policy: RetryPolicy = None,
+        max_in_flight: int = 100,
+        limit_per_host: int = 0,
+        timeout: float = 300,
+    ):
+        super().__init__(
+            auth,
+            base_url=base_url,
+            secrets_manager=secrets_manager,
+            login_url=login_url,
+            boto3_session=boto3_session,
+            retry_policy=retry_policy,
+            timeout=timeout,
+        )
+        self.max_in_flight = max_in_flight
+        self.limit_per_host = limit_per_host
+        self.async_session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        # aiohttp sessions are bound to the running event loop
+        self.async_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_in_flight, limit_per_host=self.limit_per_host
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self.async_session is not None:
+            await self.async_session.close()
+            self.async_session = None
+
+    @staticmethod
+    async def parse_async_response(response: aiohttp.ClientResponse):
+        text = await response.text()
+        if "json" not in response.headers.get("Content-Type", ""):
+            logger.warning("Response is not application/json, returning raw response")
+            return text
+
+        try:
+            return json.loads(text)
+        except ValueError:
+            logger.error("Could not convert response to json, returning raw response")
+
+        return text
+
+    @staticmethod
+    def get_form_data(body, files) -> aiohttp.FormData:
+        """
+        Multipart body of a files upload, files given like for requests:
+        {field: file} or {field: (filename, file[, content_type])}
+        """
+        form_data = aiohttp.FormData()
+        for name, value in (body or {}).items():
+            form_data.add_field(name, str(value))
+        for name, file in files.items():
+            if isinstance(file, (tuple, list)):
+                filename, content = file[0], file[1]
+                content_type = file[2] if len(file) > 2 else None
+            else:
+                filename = getattr(file, "name", name)
+                content, content_type = file, None
+            form_data.add_field(
+                name, content, filename=filename, content_type=content_type
+            )
+        return form_data
+
+    async def make_request(
+        self,
+        method,
+        endpoint,
+        json_body=None,
+        query=None,
+        body=None,
+        files=None,
+        return_headers=False,
+    ):
+        if self.async_session is None:
+            raise RuntimeError(
+                "AsyncAPIClient session is not open, use 'async with AsyncAPIClient(...)'."
+            )
+
+        method = method.lower()
+        if method not in ("get", "post", "put", "delete"):
+            method = "get"
+        headers = {
+            "Accept": "application/vnd.mambu.v2+json",
+            "Content-Type": "application/json",
+            "Authorization": self.auth,
+            "apikey": self.auth,
+        }
+        if files:
+            # aiohttp sets the multipart Content-Type with its boundary
+            headers.pop("Content-Type")
+
+        logger.info(
+            f"Calling:{self.base_url}{endpoint}?{query}"
+            if query is not None
+            else f"Calling:{self.base_url}{endpoint}"
+        )
+
+        attempt = 0
+        while True:
+            # a multipart body can only be sent once, it is rebuilt per attempt
+            request_params = {
+                "headers": headers,
+                "json": json_body,
+                "params": query,
+                "data": self.get_form_data(body, files) if files else body,
+            }
+            try:
+                async with self.semaphore:
+                    async with self.async_session.request(
+                        method, self.base_url + endpoint, **request_params
+                    ) as response:
+                        parsed_response = await self.parse_async_response(response)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                if not self.retry_policy.should_retry(method, endpoint, attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                logger.warning(
+                    f"Attempt {attempt + 1} failed with {error!r}, retrying in {delay:.2f}s.."
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            if self.retry_policy.should_retry(
+                method, endpoint, attempt, response.status
+            ):
+                delay = self.retry_policy.get_delay(attempt, response)
+                logger.warning(
+                    f"Attempt {attempt + 1} failed with status code {response.status}, retrying in {delay:.2f}s.."
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            break
+
+        if not response.ok:
+            error = APIResponseError(response, parsed_response)
+            logger.error(f"{error}:  {parsed_response}")
+            raise error
+
+        if return_headers:
+            return parsed_response, response.headers
+        return parsed_response
+
+    async def get(
+        self,
+        endpoint: str,
+        query: str = None,
+        filter_objects: list[str] = [],
+        clean: bool = False,
+        flatten: bool = False,
+        df: bool = False,
+    ):
+        """
+        Perform a GET request to the specified API endpoint.
+        Same parameters and return value as APIClient.get.
+        """
+        if query:
+            query = query.replace(" ", "+")
+
+        response = await self.make_request("get", endpoint, query=query)
+        return self.process_response(response, filter_objects, clean, flatten, df)
+
+    async def post(
+        self,
+        endpoint: str,
+        json_body: dict = None,
+        query: dict = None,
+        body=None,
+        files=None,
+        filter_objects: list[str] = [],
+        clean: bool = False,
+        flatten: bool = False,
+        df: bool = False,
+    ):
+        """
+        Perform a POST request to the specified API endpoint.
+        Same parameters and return value as APIClient.post.
+        """
+        if query:
+            query = query.replace(" ", "+")
+
+        response = await self.make_request(
+            "post", endpoint, json_body=json_body, query=query, body=body, files=files
+        )
+        return self.process_response(response, filter_objects, clean, flatten, df)
+
+    async def put(
+        self,
+        endpoint: str,
+        json_body: dict = None,
+        query: dict = None,
+        body=None,
+        files=None,
+    ):
+        return await self.make_request(
+            "put", endpoint, json_body=json_body, query=query, body=body, files=files
+        )
+
+    async def delete(
+        self,
+        endpoint: str,
+        json_body: dict = None,
+        query: dict = None,
+        body=None,
+        files=None,
+    ):
+        return await self.make_request(
+            "delete", endpoint, json_body=json_body, query=query, body=body, files=files
+        )
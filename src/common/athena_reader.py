@@ -0,0 +1,373 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import awswrangler as wr
+import boto3
+import pandas as pd
+from awswrangler import exceptions
+from state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+# The raw tables are partitioned on the extraction date of their rows
+PARTITION_COLUMN = "date"
+PARTITION_FORMAT = "%Y%m%d"
+
+# Cached results are kept in /tmp, which outlives warm invocations,
+# and in the cache path
+LOCAL_CACHE_DIR = "/tmp/athena_cache"
+TABLE_REFERENCE = re.compile(
+    r'\b(?:FROM|JOIN)\s+"?(\w+)"?\s*\.\s*"?(\w+)"?', re.IGNORECASE
+)
+CURRENT_TIME = re.compile(
+    r"\b(?:current_date|current_time|current_timestamp|localtimestamp|now\s*\()",
+    re.IGNORECASE,
+)
+
+
+def get_unload_path() -> Optional[str]:
+    """
+    A new empty S3 prefix for the Parquet files of one UNLOAD, under the
+    ATHENA_UNLOAD_PATH environment variable, which terraform sets to the
+    Athena results bucket. Without it the prefix is under
+    s3://<S3_META>/mambu_meta/athena_unload. None when neither is set, the
+    query then falls back to the CSV result.
+    """
+    root = os.environ.get("ATHENA_UNLOAD_PATH")
+    if not root and os.environ.get("S3_META"):
+        root = f"s3://{os.environ['S3_META']}/mambu_meta/athena_unload"
+    if not root:
+        return None
+    return f"{root.rstrip('/')}/{uuid.uuid4().hex}/"
+
+
+def to_partition(value) -> str:
+    """
+    The date partition value of a date, datetime or YYYY-MM-DD string
+    """
+    if hasattr(value, "strftime"):
+        return value.strftime(PARTITION_FORMAT)
+    return str(value).replace("-", "")[:8]
+
+
+def partition_predicate(date_from=None, date_to=None) -> Optional[str]:
+    """
+    Predicate on the date partition, bounds included. Rows created on a day
+    are extracted on that day or later, so the rows created since a day only
+    need the partitions since that day. The lower bound starts one day
+    earlier, the creation dates of Mambu and the extraction dates of the
+    partitions are not in the same time zone.
+    """
+    predicates = []
+    if date_from is not None:
+        date_from = pd.Timestamp(date_from) - timedelta(days=1)
+        predicates.append(f"{PARTITION_COLUMN} >= '{to_partition(date_from)}'")
+    if date_to is not None:
+        predicates.append(f"{PARTITION_COLUMN} <= '{to_partition(date_to)}'")
+    return " AND ".join(predicates) or None
+
+
+def select_sql(
+    table: str,
+    columns: List[str] = None,
+    where: str = None,
+    date_from=None,
+    date_to=None,
+    distinct: bool = False,
+    database: str = "datalake_raw",
+) -> str:
+    """
+    Query reading only columns of table, in the date partitions from date_from
+    to date_to
+    :param table: The table to read
+    :param columns: The columns to read, all when None
+    :param where: Optional extra predicate
+    :param date_from: First date partition to read, a date or a YYYY-MM-DD string
+    :param date_to: Last date partition to read
+    :param distinct: Whether to drop duplicated rows
+    :return: The query
+    """
+    select = ", ".join(columns) if columns else "*"
+    predicates = [
+        predicate
+        for predicate in (partition_predicate(date_from, date_to), where)
+        if predicate
+    ]
+    sql = f"SELECT {'DISTINCT ' if distinct else ''}{select}\nFROM {database}.{table}"
+    if predicates:
+        sql += "\nWHERE " + "\n    AND ".join(f"({p})" for p in predicates)
+    return sql
+
+
+def query_athena(
+    sql: str,
+    database: str = "datalake_raw",
+    workgroup: str = "datalake_workgroup",
+    unload: bool = True,
+) -> pd.DataFrame:
+    """
+    Runs a query on Athena. With unload the result is UNLOADed to Parquet in
+    a new prefix, read in parallel and deleted, rather than parsed from the CSV
+    result of the query. UNLOAD does not keep the ORDER BY of the query and
+    does not support timestamps with time zone or repeated column names.
+    An empty UNLOAD is not run again, its typed empty result is read with
+    LIMIT 0.
+    :param sql: The query
+    :param unload: Whether to UNLOAD, the CSV result is used without an unload path
+    :return: Pandas DF
+    """
+    s3_output = get_unload_path() if unload else None
+    if s3_output is not None:
+        logger.info("Unloading Athena query to:  %s", s3_output)
+        try:
+            return wr.athena.read_sql_query(
+                sql=sql,
+                database=database,
+                workgroup=workgroup,
+                ctas_approach=False,
+                unload_approach=True,
+                s3_output=s3_output,
+                keep_files=False,
+                use_threads=True,
+            )
+        except exceptions.EmptyDataFrame:
+            # an empty UNLOAD has no Parquet to take the columns from, they are
+            # read from the metadata of the query with LIMIT 0, which scans nothing
+            logger.info("Empty UNLOAD result, reading its column types only.")
+            wr.s3.delete_objects(s3_output)
+            sql = sql.strip().rstrip(";").rstrip()
+            sql = f"SELECT * FROM (\n{sql}\n) LIMIT 0"
+
+    return wr.athena.read_sql_query(
+        sql=sql,
+        database=database,
+        workgroup=workgroup,
+        ctas_approach=False,
+    )
+
+
+def get_cache_ttl() -> int:
+    """
+    Seconds a cached result is served for, the ATHENA_CACHE_TTL environment
+    variable. 0, the default, disables the cache.
+    """
+    return int(os.environ.get("ATHENA_CACHE_TTL", "0"))
+
+
+def get_cache_path() -> Optional[str]:
+    """
+    Where cached results and table generations are kept, s3://bucket/prefix
+    or a local directory: the ATHENA_CACHE_PATH environment variable, else
+    s3://<S3_META>/mambu_meta/athena_cache. None when neither is set.
+    """
+    path = os.environ.get("ATHENA_CACHE_PATH")
+    if not path and os.environ.get("S3_META"):
+        path = f"s3://{os.environ['S3_META']}/mambu_meta/athena_cache"
+    return path.rstrip("/") if path else None
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    The query without -- comments and with single spaces, so that formatting
+    does not change its cache key
+    """
+    return " ".join(re.sub(r"--[^\n]*", " ", sql).split())
+
+
+def get_tables(sql: str) -> List[Tuple[str, str]]:
+    """
+    The (database, table) read by the query, from its qualified FROM and JOIN
+    """
+    references = TABLE_REFERENCE.findall(sql)
+    return sorted({(database.lower(), table.lower()) for database, table in references})
+
+
+def get_table_generation(database: str, table: str) -> Optional[str]:
+    """
+    The generation of a table, changed by invalidate_tables
+    """
+    generation = get_state_store(get_cache_path()).get(
+        f"generations/{database}.{table}.json"
+    )
+    return generation["generation"] if generation else None
+
+
+def get_recent_partitions(database: str, table: str) -> dict:
+    """
+    The partitions of a table extracted since yesterday, so that tables with
+    years of daily partitions are not listed in full on every cached read.
+    All of them when none is that recent or the table is not partitioned by
+    date.
+    """
+    since = to_partition(date.today() - timedelta(days=1))
+    try:
+        partitions = wr.catalog.get_partitions(
+            database=database,
+            table=table,
+            expression=f"{PARTITION_COLUMN} >= '{since}'",
+        )
+    except Exception as e:
+        logger.info("Listing all the partitions of %s.%s:  %s", database, table, e)
+        partitions = {}
+    return partitions or wr.catalog.get_partitions(database=database, table=table)
+
+
+def get_table_fingerprint(database: str, table: str) -> str:
+    """
+    Fingerprint of the data of a table: the objects with their etags of its
+    latest partition, where the loads of the day land, plus its generation.
+    Writes to older partitions are only seen through invalidate_tables, which
+    every writer of the raw tables calls, or the TTL.
+    """
+    partitions = get_recent_partitions(database, table)
+    if not partitions:
+        raise ValueError(f"{database}.{table} has no partitions to fingerprint")
+    location, values = max(partitions.items(), key=lambda partition: partition[1])
+
+    bucket, _, prefix = location[len("s3://") :].partition("/")
+    paginator = boto3.client("s3").get_paginator("list_objects_v2")
+    objects = sorted(
+        f"{item['Key']}:{item['ETag']}"
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for item in page.get("Contents", [])
+    )
+    generation = get_table_generation(database, table)
+    return "|".join([*values, *objects, str(generation)])
+
+
+def get_cache_key(sql: str, database: str, unload: bool) -> Optional[str]:
+    """
+    Cache key of a query: md5 of the normalized query, the fingerprints of the
+    tables it reads and, when it uses the current time, today's date.
+    None when it reads no qualified table, or a table cannot be fingerprinted.
+    """
+    tables = get_tables(sql)
+    if not tables:
+        return None
+    parts = [normalize_sql(sql), database, str(unload)]
+    if CURRENT_TIME.search(sql):
+        parts.append(date.today().isoformat())
+    try:
+        parts += [get_table_fingerprint(*table) for table in tables]
+    except Exception as e:
+        logger.warning("Not caching the query, fingerprinting failed:  %s", e)
+        return None
+    return hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def read_cached(key: str, ttl: int) -> Optional[pd.DataFrame]:
+    """
+    The cached result of key if it is younger than ttl seconds, from /tmp
+    then from the cache path
+    """
+    local_path = os.path.join(LOCAL_CACHE_DIR, f"{key}.parquet")
+    if os.path.exists(local_path) and time.time() - os.path.getmtime(local_path) < ttl:
+        return pd.read_parquet(local_path)
+
+    path = f"{get_cache_path()}/results/{key}.parquet"
+    if path.startswith("s3://"):
+        objects = wr.s3.describe_objects(path)
+        if path not in objects:
+            return None
+        if time.time() - objects[path]["LastModified"].timestamp() >= ttl:
+            return None
+        df = wr.s3.read_parquet(path)
+    else:
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) >= ttl:
+            return None
+        df = pd.read_parquet(path)
+
+    write_local(df, local_path)
+    return df
+
+
+def write_local(df: pd.DataFrame, path: str) -> None:
+    """
+    Writes df to a local Parquet file, replacing the previous one atomically
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def write_cached(key: str, df: pd.DataFrame) -> None:
+    """
+    Caches the result of key in /tmp and in the cache path
+    """
+    write_local(df, os.path.join(LOCAL_CACHE_DIR, f"{key}.parquet"))
+    path = f"{get_cache_path()}/results/{key}.parquet"
+    if path.startswith("s3://"):
+        wr.s3.to_parquet(df=df, path=path, index=False)
+    else:
+        write_local(df, path)
+
+
+def invalidate_tables(tables: List[str], database: str = "datalake_raw") -> None:
+    """
+    Changes the generation of tables after writing to them, so that no cached
+    result read before the write is served again. Readers may cache even when
+    the writer does not, so only the cache path is required. A failure is only
+    logged, the write itself succeeded.
+    """
+    if get_cache_path() is None:
+        return
+    state_store = get_state_store(get_cache_path())
+    for table in tables:
+        try:
+            state_store.put(
+                f"generations/{database}.{table.lower()}.json",
+                {"generation": uuid.uuid4().hex, "invalidated_at": datetime.utcnow()},
+            )
+        except Exception as e:
+            logger.error("Failed invalidating the cache of %s:  %s", table, e)
+            continue
+        logger.info("Invalidated cached Athena results of %s.%s", database, table)
+
+
+def read_athena(
+    sql: str,
+    database: str = "datalake_raw",
+    workgroup: str = "datalake_workgroup",
+    unload: bool = True,
+    cache_ttl: int = None,
+) -> pd.DataFrame:
+    """
+    Runs a query on Athena with query_athena, unless a result of the same query
+    on the same table data is cached and younger than cache_ttl seconds
+    :param sql: The query
+    :param unload: Whether to UNLOAD, see query_athena
+    :param cache_ttl: Defaults to get_cache_ttl, 0 disables the cache
+    :return: Pandas DF
+    """
+    ttl = get_cache_ttl() if cache_ttl is None else cache_ttl
+    key = None
+    if ttl > 0 and get_cache_path() is not None:
+        key = get_cache_key(sql, database, unload)
+    if key is not None:
+        try:
+            df = read_cached(key, ttl)
+        except Exception as e:
+            logger.warning("Failed reading the cached Athena result:  %s", e)
+            df = None
+        if df is not None:
+            logger.info("Athena result read from the cache:  %s", key)
+            return df
+
+    df = query_athena(sql, database, workgroup, unload)
+    if key is not None:
+        try:
+            write_cached(key, df)
+        except Exception as e:
+            logger.warning("Failed caching the Athena result:  %s", e)
+    return df
@@ -0,0 +1,452 @@
+import logging
+import os
+import re
+from datetime import date
+from typing import List
+from typing import Tuple
+
+import athena_reader
+import awswrangler as wr
+import numpy as np
+import pandas as pd
+from awswrangler import exceptions
+
+logger = logging.getLogger(__name__)
+
+CUSTOM_FIELD_SLOT = re.compile(r"^custom_fields_(\d+)_id$")
+WATERMARK_COLUMN = "last_modified_date"
+
+
+def get_custom_field_slots(columns) -> List[Tuple[str, str]]:
+    """
+    The (custom_fields_N_id, custom_fields_N_value) column pairs, in slot order
+    """
+    slots = []
+    for column in columns:
+        match = CUSTOM_FIELD_SLOT.match(column)
+        value_column = f"custom_fields_{match.group(1)}_value" if match else None
+        if match and value_column in columns:
+            slots.append((int(match.group(1)), column, value_column))
+    return [(id_column, value_column) for _, id_column, value_column in sorted(slots)]
+
+
+def melt_custom_fields(df: pd.DataFrame, slots: List[Tuple[str, str]]) -> pd.DataFrame:
+    """
+    Long form of the custom field slots: one row per row position, field id and value.
+    When a field id is in several slots of a row the last slot wins.
+    """
+    if not slots:
+        return pd.DataFrame(columns=["row", "field_id", "value"])
+
+    id_columns = [id_column for id_column, _ in slots]
+    value_columns = [value_column for _, value_column in slots]
+    # slot major order, so that keep="last" keeps the highest slot
+    long_df = pd.DataFrame(
+        {
+            "row": np.tile(np.arange(len(df)), len(slots)),
+            "field_id": df[id_columns].to_numpy().ravel(order="F"),
+            "value": df[value_columns].to_numpy().ravel(order="F"),
+        }
+    )
+    return long_df.drop_duplicates(["row", "field_id"], keep="last")
+
+
+def pivot_custom_fields(
+    df: pd.DataFrame, empty_id: str = "0", missing_value: str = "None"
+) -> pd.DataFrame:
+    """
+    Replaces the custom_fields_N_id/custom_fields_N_value columns, for any
+    number of slots, with one column per custom field id holding its value.
+    :param df: Flattened records, empty ids must already be filled with empty_id
+    :param empty_id: Id of empty slots, which does not become a column
+    :param missing_value: Value of a custom field which is not set on a row
+    :return: The other columns of df followed by a column per custom field id
+    """
+    slots = get_custom_field_slots(df.columns)
+    long_df = melt_custom_fields(df, slots)
+    long_df = long_df[long_df["field_id"] != empty_id]
+
+    wide_df = (
+        long_df.pivot(index="row", columns="field_id", values="value")
+        .reindex(index=np.arange(len(df)))
+        .fillna(missing_value)
+    )
+    wide_df.columns.name = None
+
+    slot_columns = [column for slot in slots for column in slot]
+    base_df = df.drop(columns=slot_columns)
+    # custom field ids take over base columns of the same name
+    base_df = base_df.drop(columns=[c for c in wide_df.columns if c in base_df])
+    pivoted_df = pd.concat(
+        [base_df.reset_index(drop=True), wide_df.reset_index(drop=True)], axis=1
+    )
+    pivoted_df.index = df.index
+    return pivoted_df
+
+
+def merge_snapshot(
+    snapshot_df: pd.DataFrame,
+    changed_df: pd.DataFrame,
+    key: str = "encoded_key",
+    custom_field_columns: List[str] = (),
+    missing_value: str = "None",
+) -> pd.DataFrame:
+    """
+    Replaces the rows of the snapshot whose key is in changed_df by the changed rows.
+    :param snapshot_df: The current pivoted snapshot, one row per key
+    :param changed_df: The pivoted rows changed since the snapshot
+    :param key: The column identifying a record
+    :param custom_field_columns: Custom field columns, missing values become missing_value
+        when a custom field only exists on one side
+    :return: The merged snapshot
+    """
+    unchanged_df = snapshot_df[~snapshot_df[key].isin(changed_df[key])]
+    merged_df = pd.concat([unchanged_df, changed_df], ignore_index=True)
+    fill_columns = [column for column in custom_field_columns if column in merged_df]
+    merged_df[fill_columns] = merged_df[fill_columns].fillna(missing_value)
+    return merged_df
+
+
+def drop_unset_rows(
+    df: pd.DataFrame, field_ids: List[str], missing_value: str = "None"
+) -> pd.DataFrame:
+    """
+    The rows of df with at least one of field_ids set, like the rows read by
+    custom_fields_sql. Rows whose custom fields were all removed are dropped.
+    """
+    field_columns = [field_id for field_id in field_ids if field_id in df]
+    return df[(df[field_columns] != missing_value).any(axis=1)]
+
+
+def sql_literal(value: str) -> str:
+    """
+    Athena string literal of value
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def custom_fields_sql(
+    table: str,
+    field_ids: List[str],
+    slot_count: int,
+    columns: List[str],
+    database: str = "datalake_raw",
+    empty_id: str = "0",
+    missing_value: str = "None",
+    where: str = None,
+    with_field_only: bool = True,
+) -> str:
+    """
+    Athena query doing pivot_custom_fields server side: the rows of table with
+    at least one of field_ids in a slot, as columns followed by a column per
+    field id. Like pivot_custom_fields the last slot wins, a NULL value of a
+    set slot is empty_id and a field which is not set is missing_value.
+    :param table: The raw table with the custom_fields_N_id/value slot columns
+    :param field_ids: The custom field ids to pivot, other ids are dropped
+    :param slot_count: Number of custom_fields_N slots of the table
+    :param columns: The other columns to select
+    :param where: Optional extra predicate on the rows of table
+    :param with_field_only: Whether to only read the rows with one of field_ids
+    :return: The query, Athena returns the field id columns in lower case
+    """
+    slots = list(range(slot_count))
+    field_list = ", ".join(sql_literal(field_id) for field_id in field_ids)
+
+    pivots = []
+    for field_id in field_ids:
+        literal = sql_literal(field_id)
+        # highest slot first, so that coalesce keeps the last slot
+        cases = "".join(
+            f"\n                CASE WHEN custom_fields_{n}_id = {literal}"
+            f" THEN coalesce(CAST(custom_fields_{n}_value AS varchar),"
+            f" {sql_literal(empty_id)}) END,"
+            for n in reversed(slots)
+        )
+        name = field_id.replace('"', '""')
+        pivots.append(
+            f"coalesce({cases}\n                {sql_literal(missing_value)}\n"
+            f'            ) AS "{name}"'
+        )
+
+    select = "\n       ,".join(columns + pivots)
+    predicates = []
+    if with_field_only:
+        predicates.append(
+            "\n   OR ".join(f"custom_fields_{n}_id IN ({field_list})" for n in slots)
+        )
+    if where:
+        predicates.append(where)
+    sql = f"""
+SELECT  {select}
+FROM {database}.{table}"""
+    if len(predicates) == 1:
+        sql += f"\nWHERE {predicates[0]}"
+    elif predicates:
+        sql += "\nWHERE " + "\n  AND ".join(f"({p})" for p in predicates)
+    return sql
+
+
+def pivot_in_athena() -> bool:
+    """
+    "athena" (default) pivots the custom fields with the generated query,
+    "pandas" reads the slots with the .sql file and pivots them in the Lambda
+    """
+    return os.environ.get("CUSTOM_FIELDS_PIVOT", "athena") != "pandas"
+
+
+def timestamp_literal(value: str) -> str:
+    """
+    Athena TIMESTAMP literal of a timestamp string, in UTC without time zone,
+    so that it is compared as a timestamp rather than as a string
+    """
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return f"TIMESTAMP '{timestamp:%Y-%m-%d %H:%M:%S.%f}'"
+
+
+def get_sql(name: str, entry: dict, watermark: str = None) -> str:
+    """
+    The query of a config entry, see pivot_in_athena. With a watermark every
+    row modified after it is read, also the ones without any of the custom
+    fields anymore, so that their removal is merged into the snapshot.
+    :param name: The config entry name, also the name of the output table
+    :param entry: The config entry
+    :param watermark: Only read rows modified after this last_modified_date
+    :return: The query
+    """
+    if watermark is not None:
+        modified = f"{WATERMARK_COLUMN} > {timestamp_literal(watermark)}"
+        if pivot_in_athena():
+            # rows modified after the watermark were extracted on its day or later
+            return custom_fields_sql(
+                entry["table"],
+                entry["custom_field_ids"],
+                entry["slots"],
+                entry["columns"],
+                where=f"{athena_reader.partition_predicate(watermark)} AND {modified}",
+                with_field_only=False,
+            )
+        slot_columns = [
+            f"custom_fields_{n}_{part}"
+            for n in range(entry["slots"])
+            for part in ("id", "value")
+        ]
+        return athena_reader.select_sql(
+            entry["table"],
+            entry["columns"] + slot_columns,
+            where=modified,
+            date_from=watermark,
+        )
+
+    if pivot_in_athena():
+        return custom_fields_sql(
+            entry["table"],
+            entry["custom_field_ids"],
+            entry["slots"],
+            entry["columns"],
+        )
+
+    today = (date.today()).strftime("%Y%m%d")
+    with open(entry[name], "r") as sql_file:
+        sql = sql_file.read()
+        sql = sql.format(today)
+    return sql
+
+
+def read_athena(sql: str, input_database: str) -> pd.DataFrame:
+    """
+    read_athena-read data using Athena service by providing sql query
+    :param str: the query
+    :param str: athena database
+    :return: Pandas DF
+    """
+
+    logger.info("Reading from Athena... ")
+    try:
+        # the custom fields hold IBANs and account numbers, kept out of the cache
+        df = athena_reader.read_athena(sql, database=input_database, cache_ttl=0)
+    except (
+        exceptions.NoFilesFound,
+        exceptions.InvalidFile,
+        exceptions.InvalidConnection,
+        exceptions.ServiceApiError,
+        exceptions.InvalidDataFrame,
+    ) as e:
+        logger.error("AWS Wrangler Exception occurred:  %s", e.__class__)
+        exit(1)
+    except Exception as e:
+        logger.error("Failed reading from Athena")
+        logger.error("Exception occurred:  %s", e)
+        exit(1)
+    return df
+
+
+def get_mambu_custom_fields(df, field_ids=None):
+    if df.shape[0] != 0:
+        if field_ids is None:
+            df = df.fillna("0").replace("<NA>", "0")
+
+            # one column per custom field id, from every custom_fields_N slot
+            df = pivot_custom_fields(df, empty_id="0", missing_value="None")
+        else:
+            # already pivoted by Athena, which lower cases column names
+            df = df.rename(columns={f.lower(): f for f in field_ids})
+
+        # Define static vars
+        df["date"] = date.today().strftime("%Y%m%d")
+
+        return df
+
+
+def write_to_data_lake(input_df, table_name, dtype, columns_comments):
+    """
+    Writes mambu custom fields data to the data lake
+    :param input_df: the data in the form of a pandas dataframe
+    :param dtype: The Athena types of the table, from data_catalog.schemas
+    :param columns_comments: The column comments, from data_catalog.column_comments
+    :return: The result of the specified action.
+    """
+    logger.info(
+        "Processing Mambu custom fields data for an Athena write:  %s",
+        table_name,
+    )
+
+    path = "s3://" + os.environ["S3_RAW"] + "/" + table_name + "/"
+    logger.info("Uploading to S3 location:  %s", path)
+    try:
+        res = wr.s3.to_parquet(
+            df=input_df,
+            path=path,
+            index=False,
+            dataset=True,
+            database="datalake_raw",
+            table=table_name,
+            mode="overwrite",
+            schema_evolution=True,
+            compression="snappy",
+            partition_cols=["date"],
+            dtype=dtype,
+            glue_table_settings=wr.typing.GlueTableSettings(
+                columns_comments=columns_comments
+            ),
+        )
+        athena_reader.invalidate_tables([table_name])
+        logger.info("Write to Athena complete!")
+
+        return res
+    except Exception as e:
+        logger.error("Exception occurred:  %s", e)
+        return False
+
+
+def read_snapshot(table_name):
+    """
+    Reads the current custom fields snapshot from the data lake
+    :return: Pandas DF, None if there is no snapshot yet
+    """
+    path = "s3://" + os.environ["S3_RAW"] + "/" + table_name + "/"
+    try:
+        df = wr.s3.read_parquet(path=path, dataset=True)
+    except exceptions.NoFilesFound:
+        logger.info("No snapshot found in %s", path)
+        return None
+    return df.drop(columns=["date"], errors="ignore")
+
+
+def update_custom_fields(
+    table_name,
+    entry,
+    dtype,
+    columns_comments,
+    state_store,
+    full_refresh=False,
+    field_ids=None,
+):
+    """
+    Pivots only the rows modified since the last snapshot, keeping the latest
+    version per encoded_key, and merges them into the current snapshot.
+    Without a watermark or with full_refresh every row is read.
+    :return: The result of the data lake write, True when nothing changed
+    """
+    watermark_key = f"watermarks/{table_name}.json"
+    watermark = None if full_refresh else state_store.get(watermark_key)
+    # a snapshot of rows without last_modified_date stores "NaT" or "None"
+    watermark_value = watermark["value"] if watermark else None
+    if str(watermark_value) in ("None", "NaT", "nan"):
+        watermark_value = None
+    logger.info("Reading rows modified after:  %s", watermark_value)
+
+    df = read_athena(get_sql(table_name, entry, watermark_value), "datalake_raw")
+    if df.shape[0] == 0:
+        logger.info("No custom fields changed since the last snapshot.")
+        return True
+
+    new_watermark_value = str(df[WATERMARK_COLUMN].max())
+    df = df.sort_values(WATERMARK_COLUMN).drop_duplicates("encoded_key", keep="last")
+    base_columns = entry["columns"]
+    cf_df = get_mambu_custom_fields(df, field_ids)
+    logger.info("Pivoted %s changed rows.", cf_df.shape[0])
+
+    snapshot_df = read_snapshot(table_name) if watermark_value else None
+    if snapshot_df is not None:
+        # the data catalog lower cases column names
+        snapshot_df = snapshot_df.rename(columns={c.lower(): c for c in cf_df.columns})
+        custom_field_columns = [
+            c
+            for c in set(snapshot_df.columns) | set(cf_df.columns)
+            if c not in base_columns + ["date"]
+        ]
+        cf_df = merge_snapshot(
+            snapshot_df,
+            cf_df.drop(columns=["date"]),
+            "encoded_key",
+            custom_field_columns,
+        )
+        cf_df["date"] = date.today().strftime("%Y%m%d")
+    cf_df = drop_unset_rows(cf_df, entry["custom_field_ids"])
+
+    res = write_to_data_lake(cf_df, table_name, dtype, columns_comments)
+    if res:
+        state_store.put(
+            watermark_key,
+            {
+                "table_name": table_name,
+                "column": WATERMARK_COLUMN,
+                "value": new_watermark_value,
+            },
+        )
+    return res
+
+
+def refresh_custom_fields(
+    table_name, entry, dtype, columns_comments, state_store=None, full_refresh=False
+):
+    """
+    Writes the custom fields table of a config entry: merged incrementally
+    with update_custom_fields when a state store is given, else rebuilt from
+    every row.
+    :return: The result of the data lake write
+    """
+    field_ids = entry["custom_field_ids"] if pivot_in_athena() else None
+    if state_store is not None:
+        return update_custom_fields(
+            table_name,
+            entry,
+            dtype,
+            columns_comments,
+            state_store,
+            full_refresh,
+            field_ids,
+        )
+
+    logger.info("Getting Data Frame Complete. Result:  %s", table_name)
+    df = read_athena(get_sql(table_name, entry), "datalake_raw")
+    logger.info(
+        "Pivotting Data Mambu Custom Fields Complete. Result:  %s",
+        table_name,
+    )
+    cf_df = get_mambu_custom_fields(df, field_ids)
+
+    logger.info("Writing to data lake...")
+    return write_to_data_lake(cf_df, table_name, dtype, columns_comments)
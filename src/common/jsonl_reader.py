@@ -0,0 +1,85 @@
+import json
+import logging
+from typing import Iterator
+from typing import List
+
+import pandas as pd
+from flatten_json import flatten
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # orjson is optional, json is only slower
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+EMPTY_VALUES = ({}, [])
+
+
+def normalize_record(line) -> dict:
+    """
+    Parses a JSONL line to a flattened record, empty dicts or lists become ""
+    since data wrangler cannot write them to parquet in S3.
+    """
+    record = flatten(loads(line))
+    for key, value in record.items():
+        if value in EMPTY_VALUES:
+            record[key] = ""
+    return record
+
+
+def iter_jsonl_chunks(
+    filename: str, chunk_rows: int = 50000, columns: List[str] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads a JSONL file produced with Singer (tap-mambu and target-jsonl)
+    in DataFrames of at most chunk_rows records, so memory stays bounded
+    by the chunk size rather than the file size.
+    :param filename: The JSONL file to read
+    :param chunk_rows: Number of records per DataFrame
+    :param columns: Optional projection, missing columns are added empty
+    :return: An iterator of flattened DataFrames
+    """
+    records = []
+    rows = 0
+    with open(filename, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            records.append(normalize_record(line))
+            if len(records) >= chunk_rows:
+                rows += len(records)
+                yield to_dataframe(records, columns)
+                records = []
+
+    if records or not rows:
+        rows += len(records)
+        yield to_dataframe(records, columns)
+    logger.info("Read %s records from %s", rows, filename)
+
+
+def to_dataframe(records: List[dict], columns: List[str] = None) -> pd.DataFrame:
+    """
+    Builds the DataFrame of a chunk, projected on columns when given.
+    """
+    df = pd.DataFrame(records)
+    if columns is None:
+        return df
+
+    missing = [column for column in columns if column not in df.columns]
+    for column in missing:
+        df[column] = pd.Series(None, index=df.index, dtype=object)
+    return df[columns]
+
+
+def read_jsonl(
+    filename: str, chunk_rows: int = 50000, columns: List[str] = None
+) -> pd.DataFrame:
+    """
+    Reads a whole JSONL file into a single DataFrame, chunk by chunk.
+    """
+    return pd.concat(
+        list(iter_jsonl_chunks(filename, chunk_rows, columns)), ignore_index=True
+    )
@@ -0,0 +1,472 @@
+import json
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+from api_client import APIClient
+from api_client import initialize_log
+
+logger = initialize_log("common.mambu_paging")
+
+# Gap between consecutive time windows, Mambu dates have millisecond precision
+WINDOW_GAP = timedelta(milliseconds=1)
+
+
+def fetch_page(
+    mambu_client: APIClient,
+    endpoint: str,
+    request_type: str,
+    offset: int,
+    limit: int = 1000,
+    extra_params: str = "",
+    body: dict = None,
+    flatten: bool = True,
+) -> list:
+    """
+    Fetch a single page of records starting at the given offset,
+    flattened unless flatten is False.
+    """
+    query = f"detailsLevel=FULL&limit={limit}&offset={offset}&{extra_params}"
+
+    if request_type == "post":
+        page_data = mambu_client.post(
+            endpoint=endpoint,
+            body=body,
+            query=query,
+            clean=True,
+            flatten=flatten,
+        )
+    else:
+        page_data = mambu_client.get(
+            endpoint=endpoint,
+            query=query,
+            clean=True,
+            flatten=flatten,
+        )
+
+    return page_data or []
+
+
+def probe_total_records(
+    mambu_client: APIClient,
+    endpoint: str,
+    request_type: str,
+    extra_params: str = "",
+    body: dict = None,
+) -> Optional[int]:
+    """
+    Probe the total number of records of a request with a single-record page,
+    using the "items-total" header returned by Mambu with paginationDetails=ON.
+
+    Returns:
+        int: The total number of records, None if Mambu did not report it.
+    """
+    query = f"limit=1&offset=0&paginationDetails=ON&{extra_params}"
+    _, headers = mambu_client.make_request(
+        request_type, endpoint, query=query, body=body, return_headers=True
+    )
+    total = headers.get("items-total")
+    if total is None:
+        logger.warning(f"Mambu did not return items-total for {endpoint}.")
+        return None
+    logger.info(f"Probed {total} total records for {endpoint}.")
+    return int(total)
+
+
+def iter_pages(
+    mambu_client: APIClient,
+    endpoint: str,
+    request_type: str,
+    extra_params: str = "",
+    limit: int = 1000,
+    body: dict = None,
+    concurrency: int = 1,
+    flatten: bool = True,
+) -> Iterator[list]:
+    """
+    Yield all pages of an endpoint, in offset order, by walking the offset.
+
+    With concurrency > 1 the total is probed first and the known offsets are
+    fetched over a bounded thread pool. At most 2 * concurrency pages are in
+    flight or buffered at any time, so memory does not grow with the total.
+    If the total cannot be probed, pages are fetched sequentially.
+
+    Args:
+        mambu_client: The client instance used for making API calls.
+        endpoint (str): The API endpoint to query.
+        request_type (str): get or post.
+        extra_params (str): Extra query parameters appended to every page request.
+        limit (int): The maximum number of records to fetch per API call.
+        body (dict): The request payload for post requests.
+        concurrency (int): The maximum number of pages requested in parallel.
+        flatten (bool): Whether to flatten the records of each page.
+
+    Yields:
+        list: The records of each page.
+    """
+    offset = 0
+    accumulated_count = 0
+    received_count = limit
+
+    def get_page(page_offset):
+        return fetch_page(
+            mambu_client,
+            endpoint,
+            request_type,
+            page_offset,
+            limit,
+            extra_params,
+            body,
+            flatten,
+        )
+
+    if concurrency > 1:
+        total = probe_total_records(
+            mambu_client, endpoint, request_type, extra_params, body
+        )
+        if total == 0:
+            return
+        if total:
+            offsets = iter(range(0, total, limit))
+            logger.info(
+                f"Fetching {-(-total // limit)} pages with a concurrency of {concurrency}."
+            )
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                pending = deque(
+                    executor.submit(get_page, page_offset)
+                    for _, page_offset in zip(range(concurrency * 2), offsets)
+                )
+                while pending:
+                    current_page_data = pending.popleft().result()
+                    next_offset = next(offsets, None)
+                    if next_offset is not None:
+                        pending.append(executor.submit(get_page, next_offset))
+
+                    received_count = len(current_page_data)
+                    accumulated_count += received_count
+                    offset += limit
+                    yield current_page_data
+
+            logger.info(f"Accumulated {accumulated_count} record.")
+
+    # Sequential walk, also picks up records added after the total was probed
+    while received_count >= limit:
+        current_page_data = get_page(offset)
+        received_count = len(current_page_data)
+        accumulated_count += received_count
+        logger.info(
+            f"Received {received_count} record, accumulated {accumulated_count} record."
+        )
+        if current_page_data:
+            yield current_page_data
+
+        # Increment the offset for the next page
+        offset += limit
+
+
+def iter_keyset_pages(
+    mambu_client: APIClient,
+    endpoint: str,
+    cdc_field: str,
+    start_date: str,
+    end_date: str,
+    extra_params: str = "",
+    limit: int = 1000,
+    key_field: str = "encodedKey",
+) -> Iterator[list]:
+    """
+    Yield all pages of a search sorted by cdc_field using keyset pagination:
+    instead of growing the offset, the lower bound of the BETWEEN filter is
+    moved to the last seen cdc_field value, keeping per-page latency flat.
+
+    BETWEEN is inclusive, so records sharing the bound value are returned
+    again and skipped by their key_field. Mambu sorts on a single field, so
+    records sharing a value have no stable order: when a whole page shares
+    the bound value, the records with that value are paged sorted by
+    key_field instead, then the lower bound moves past the value.
+
+    Yields:
+        list: The flattened records of each page, without repeats.
+    """
+    lower_bound = start_date
+    boundary_keys = set()
+    accumulated_count = 0
+
+    def record_key(record):
+        return record.get(key_field) or json.dumps(record, sort_keys=True)
+
+    def new_records_of(page_data):
+        new_records = [
+            record for record in page_data if record_key(record) not in boundary_keys
+        ]
+        boundary_keys.update(record_key(record) for record in new_records)
+        return new_records
+
+    while True:
+        current_page_data = fetch_page(
+            mambu_client,
+            endpoint,
+            "post",
+            0,
+            limit,
+            extra_params,
+            create_payload(cdc_field, lower_bound, end_date),
+        )
+        new_records = new_records_of(current_page_data)
+        accumulated_count += len(new_records)
+        logger.info(
+            f"Received {len(new_records)} new record from {lower_bound}, accumulated {accumulated_count} record."
+        )
+        if new_records:
+            yield new_records
+
+        if len(current_page_data) < limit:
+            break
+
+        last_value = current_page_data[-1][cdc_field]
+        if last_value != lower_bound:
+            lower_bound = last_value
+            boundary_keys = {
+                record_key(record)
+                for record in current_page_data
+                if record[cdc_field] == lower_bound
+            }
+            continue
+
+        # The whole page shares the bound value, page its records by key_field
+        offset = 0
+        while True:
+            tied_page_data = fetch_page(
+                mambu_client,
+                endpoint,
+                "post",
+                offset,
+                limit,
+                extra_params,
+                create_payload(cdc_field, lower_bound, lower_bound, key_field),
+            )
+            new_records = new_records_of(tied_page_data)
+            accumulated_count += len(new_records)
+            logger.info(
+                f"Received {len(new_records)} new record at {lower_bound}, accumulated {accumulated_count} record."
+            )
+            if new_records:
+                yield new_records
+            if len(tied_page_data) < limit:
+                break
+            offset += limit
+
+        lower_bound = (
+            datetime.fromisoformat(lower_bound) + WINDOW_GAP
+        ).isoformat(timespec="milliseconds")
+        boundary_keys = set()
+
+
+def fetch_all_pages(
+    mambu_client: APIClient,
+    endpoint: str,
+    request_type: str,
+    extra_params: str = "",
+    limit: int = 1000,
+    body: dict = None,
+    concurrency: int = 1,
+):
+    """
+    Fetch all pages of an endpoint into a single DataFrame, see iter_pages.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing all fetched records.
+    """
+    return pd.DataFrame(
+        [
+            record
+            for page in iter_pages(
+                mambu_client,
+                endpoint,
+                request_type,
+                extra_params,
+                limit,
+                body,
+                concurrency,
+            )
+            for record in page
+        ]
+    )
+
+
+def create_payload(cdc_field, start_date, end_date, sort_field=None):
+    """
+    Constructs the payload for Mambu API requests with filtering and sorting.
+    Results are sorted on sort_field, cdc_field by default.
+    """
+    payload = json.dumps(
+        {
+            "filterCriteria": [
+                {
+                    "field": cdc_field,
+                    "operator": "BETWEEN",
+                    "value": start_date,
+                    "secondValue": end_date,
+                }
+            ],
+            "sortingCriteria": {
+                "field": sort_field or cdc_field,
+                "order": "ASC",
+            },
+        }
+    )
+    logger.info(f"Request payload: {payload}")
+    return payload
+
+
+def create_endpoint_payload(endpoint, cdc_field, start_date, end_date):
+    """
+    Constructs the search payload, handling endpoint specific exceptions.
+    """
+    payload = create_payload(cdc_field, start_date, end_date)
+
+    # Special case for creditarrangements
+    if endpoint == "creditarrangements:search":
+        payload_dict = json.loads(payload)
+        del payload_dict["sortingCriteria"]
+        payload = json.dumps(payload_dict)
+
+    return payload
+
+
+def plan_time_windows(
+    client: APIClient,
+    endpoint: str,
+    cdc_field: str,
+    start_date: datetime,
+    end_date: datetime,
+    target_records: int,
+    extra_params: str = "",
+    min_window: timedelta = timedelta(minutes=1),
+) -> List[Tuple[datetime, datetime, Optional[int]]]:
+    """
+    Split start_date..end_date into consecutive windows of about target_records
+    records each. Windows whose probed count exceeds the target are bisected
+    (down to min_window), then adjacent sparse windows are merged back while
+    their combined count stays within the target. Windows do not overlap, each
+    one ends WINDOW_GAP before the next one starts.
+
+    Returns:
+        list: (window_start, window_end, records_count) tuples in time order.
+            If the count cannot be probed the whole range is returned as one
+            window with a None count.
+    """
+    windows = []
+    to_probe = [(start_date, end_date)]
+    while to_probe:
+        window_start, window_end = to_probe.pop()
+        count = probe_total_records(
+            client,
+            endpoint,
+            "post",
+            extra_params,
+            create_endpoint_payload(
+                endpoint,
+                cdc_field,
+                window_start.isoformat(timespec="milliseconds"),
+                window_end.isoformat(timespec="milliseconds"),
+            ),
+        )
+        if count is None:
+            return [(start_date, end_date, None)]
+
+        if count > target_records and window_end - window_start > min_window:
+            half_seconds = (window_end - window_start).total_seconds() // 2
+            middle = window_start + timedelta(seconds=half_seconds)
+            # BETWEEN includes both bounds, so the left half stops 1ms before
+            # the right half starts and no record is fetched by both.
+            # Pushed in reverse so windows are probed in time order
+            to_probe.append((middle, window_end))
+            to_probe.append((window_start, middle - WINDOW_GAP))
+        else:
+            windows.append((window_start, window_end, count))
+
+    merged_windows = []
+    for window_start, window_end, count in windows:
+        if merged_windows and merged_windows[-1][2] + count <= target_records:
+            merged_windows[-1] = (
+                merged_windows[-1][0],
+                window_end,
+                merged_windows[-1][2] + count,
+            )
+        else:
+            merged_windows.append((window_start, window_end, count))
+
+    logger.info(
+        f"Planned {len(merged_windows)} windows of up to {target_records} records "
+        f"from {len(windows)} probed windows."
+    )
+    return merged_windows
+
+
+def iter_fan_out(
+    scans: list, concurrency: int = 1, queue_pages: int = 2
+) -> Iterator[list]:
+    """
+    Runs independent sub-scans concurrently and yields their pages in the
+    order of scans, so the output does not depend on which finishes first.
+
+    Each scan is a callable returning an iterator of pages. Every scan hands
+    its pages over through a queue of queue_pages pages, a scan ahead of the
+    consumer waits for its queue to drain, so about concurrency * queue_pages
+    pages are held in memory. The number of concurrent HTTP calls is bounded
+    by the client's max_in_flight limiter.
+    """
+    if concurrency <= 1 or len(scans) <= 1:
+        for scan in scans:
+            yield from scan()
+        return
+
+    stop = threading.Event()
+    scan_queues = [queue.Queue(maxsize=queue_pages) for _ in scans]
+
+    def put(pages, item):
+        # Gives up once the consumer stopped, so no scan waits forever
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run_scan(scan, pages):
+        if stop.is_set():
+            return
+        try:
+            for page in scan():
+                if not put(pages, ("page", page)):
+                    return
+        except Exception as e:
+            put(pages, ("error", e))
+            return
+        put(pages, ("done", None))
+
+    # Scans start in order, so the scan being consumed is always running
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(scans))) as executor:
+        try:
+            for scan, pages in zip(scans, scan_queues):
+                executor.submit(run_scan, scan, pages)
+            for pages in scan_queues:
+                while True:
+                    kind, item = pages.get()
+                    if kind == "done":
+                        break
+                    if kind == "error":
+                        raise item
+                    yield item
+        finally:
+            stop.set()
@@ -0,0 +1,91 @@
+import json
+import os
+from typing import Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class LocalStateStore:
+    """
+    Keeps JSON state documents as files under a local directory, for tests and local runs.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the document stored at key, None if there is none.
+        """
+        path = os.path.join(self.root_dir, key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as state_file:
+            return json.load(state_file)
+
+    def put(self, key: str, value: dict) -> None:
+        """
+        Stores the document at key, replacing the previous one atomically.
+        """
+        path = os.path.join(self.root_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as state_file:
+            json.dump(value, state_file, default=str)
+        os.replace(f"{path}.tmp", path)
+
+
+class S3StateStore:
+    """
+    Keeps JSON state documents as objects under an S3 prefix, a PUT replaces
+    the previous document atomically.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.s3_client = s3_client or boto3.client("s3")
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the document stored at key, None if there is none.
+        """
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self.object_key(key)
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def put(self, key: str, value: dict) -> None:
+        """
+        Stores the document at key, replacing the previous one.
+        """
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            Body=json.dumps(value, default=str).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+
+def get_state_store(path: str = None):
+    """
+    Returns the state store at path, either s3://bucket/prefix or a local directory.
+    Defaults to the STATE_STORE_PATH environment variable,
+    else to s3://<S3_META>/mambu_meta/state.
+    """
+    path = path or os.environ.get("STATE_STORE_PATH")
+    if not path:
+        path = f"s3://{os.environ['S3_META']}/mambu_meta/state"
+
+    if path.startswith("s3://"):
+        bucket, _, prefix = path[len("s3://") :].partition("/")
+        return S3StateStore(bucket, prefix)
+    return LocalStateStore(path)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the common modules are imported flat, as in the Lambda packages
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,170 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from email.utils import format_datetime
+
+import pytest
+import requests
+from api_client import APIClient
+from api_client import RetryPolicy
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, payload=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.payload = payload or {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+class FakeSession:
+    """
+    Returns the given responses in order and records the calls made
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("get", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("post", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("put", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("delete", url, **kwargs)
+
+
+JSON = {"Content-Type": "application/json"}
+AUTH = {"username": "user", "password": "secret"}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr("api_client.time.sleep", lambda seconds: None)
+
+
+def test_delay_has_full_jitter_up_to_max_backoff():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+
+    delays = [policy.get_delay(attempt) for attempt in range(10) for _ in range(20)]
+
+    assert all(0 <= delay <= 5 for delay in delays)
+    assert all(0 <= policy.get_delay(1) <= 2 for _ in range(20))
+
+
+def test_retry_after_in_seconds_or_http_date():
+    policy = RetryPolicy(max_backoff=60)
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+
+    assert policy.get_delay(0, FakeResponse(429, {"Retry-After": "7"})) == 7
+    assert policy.get_delay(0, FakeResponse(429, {"Retry-After": "600"})) == 60
+    assert 25 < policy.parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+    assert policy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert policy.parse_retry_after("soon") is None
+    assert policy.parse_retry_after(None) is None
+
+
+def test_only_idempotent_requests_retry_server_errors():
+    policy = RetryPolicy()
+
+    assert policy.should_retry("get", "loans", 0, 500)
+    assert policy.should_retry("post", "loans:search", 0, 502)
+    assert not policy.should_retry("post", "loans", 0, 500)
+    assert not policy.should_retry("post", "loans", 0)
+    assert policy.should_retry("post", "loans", 0, 500, idempotent=True)
+    # rejected before being processed
+    assert policy.should_retry("post", "loans", 0, 429)
+    assert policy.should_retry("post", "loans", 0, 503)
+    assert not policy.should_retry("get", "loans", 0, 404)
+
+
+def test_retries_are_limited_per_request_and_per_client():
+    policy = RetryPolicy(max_retries=2, retry_budget=3)
+
+    assert not policy.should_retry("get", "loans", 2, 500)
+    assert [policy.should_retry("get", "loans", 0, 500) for _ in range(4)] == [
+        True,
+        True,
+        True,
+        False,
+    ]
+    assert policy.retries_used == 3
+
+
+def test_requests_time_out_and_retry():
+    session = FakeSession(
+        requests.Timeout("read timed out"),
+        FakeResponse(200, JSON, {"id": "1"}),
+    )
+    client = APIClient(AUTH, base_url="https://bank/api/", session=session, timeout=5)
+
+    assert client.get("loans/1") == {"id": "1"}
+    assert [call[2]["timeout"] for call in session.calls] == [5, 5]
+
+
+def test_client_errors_are_not_retried():
+    session = FakeSession(FakeResponse(404, JSON, {"errors": []}))
+    client = APIClient(AUTH, base_url="https://bank/api/", session=session)
+
+    with pytest.raises(requests.HTTPError):
+        client.get("loans/1")
+    assert len(session.calls) == 1
+
+
+def login_client(session, retry_policy=None):
+    return APIClient(
+        AUTH,
+        login_url="https://bank/oauth/token",
+        session=session,
+        retry_policy=retry_policy,
+        timeout=5,
+    )
+
+
+def test_login_retries_server_errors_with_the_retry_budget():
+    session = FakeSession(
+        FakeResponse(503),
+        requests.ConnectionError("reset"),
+        FakeResponse(200, JSON, {"access_token": "token"}),
+    )
+    policy = RetryPolicy()
+
+    client = login_client(session, policy)
+
+    assert client.auth == "Bearer token"
+    assert policy.retries_used == 2
+    assert [call[2]["timeout"] for call in session.calls] == [5, 5, 5]
+
+
+def test_login_does_not_retry_client_errors():
+    session = FakeSession(FakeResponse(401), FakeResponse(200))
+
+    with pytest.raises(Exception, match="after 1 attempts"):
+        login_client(session)
+    assert len(session.calls) == 1
+
+
+def test_login_gives_up_when_the_budget_is_exhausted():
+    session = FakeSession(*[FakeResponse(500)] * 3)
+
+    with pytest.raises(Exception, match="after 3 attempts"):
+        login_client(session, RetryPolicy(retry_budget=2))
+    assert len(session.calls) == 3
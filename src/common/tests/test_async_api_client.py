@@ -0,0 +1,110 @@
+import asyncio
+import io
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from api_client import RetryPolicy
+from async_api_client import APIResponseError
+from async_api_client import AsyncAPIClient
+
+AUTH = {"username": "user", "password": "secret"}
+
+
+async def echo(request):
+    """
+    Returns the method, query, JSON body and form fields of a request, with
+    the name of uploaded files
+    """
+    payload = {"method": request.method, "query": dict(request.query)}
+    if request.content_type == "application/json" and request.can_read_body:
+        payload["json"] = await request.json()
+    if request.content_type == "multipart/form-data":
+        form = await request.post()
+        payload["form"] = {
+            name: getattr(field, "filename", field) for name, field in form.items()
+        }
+    return web.json_response(payload)
+
+
+def run_with_server(handler, test, **client_options):
+    """
+    Runs test(client) against a local server answering every request with handler
+    """
+
+    async def main():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        async with TestServer(app) as server:
+            async with AsyncAPIClient(
+                AUTH, base_url=str(server.make_url("/")), **client_options
+            ) as client:
+                return await test(client)
+
+    return asyncio.run(main())
+
+
+def test_methods_and_process_response():
+    async def test(client):
+        return await asyncio.gather(
+            client.get("loans", query="detailsLevel=FULL", filter_objects=["query"]),
+            client.post("loans:search", json_body={"a": 1}, filter_objects=["json"]),
+            client.put("loans/1", json_body={"b": 2}),
+            client.delete("loans/1"),
+        )
+
+    get, post, put, delete = run_with_server(echo, test)
+
+    assert get == {"detailsLevel": "FULL"}
+    assert post == {"a": 1}
+    assert (put["method"], put["json"]) == ("PUT", {"b": 2})
+    assert delete["method"] == "DELETE"
+
+
+def test_files_upload():
+    async def test(client):
+        files = {"file": ("a.txt", io.BytesIO(b"x"))}
+        return await client.post("documents", body={"name": "doc"}, files=files)
+
+    assert run_with_server(echo, test)["form"] == {"name": "doc", "file": "a.txt"}
+
+
+def test_retries_rejected_requests():
+    calls = []
+
+    async def throttled(request):
+        calls.append(request.method)
+        if len(calls) == 1:
+            return web.json_response({}, status=429, headers={"Retry-After": "0"})
+        return await echo(request)
+
+    async def test(client):
+        return await client.post("deposits", json_body={})
+
+    retry_policy = RetryPolicy(backoff_factor=0)
+    response = run_with_server(throttled, test, retry_policy=retry_policy)
+
+    assert response["method"] == "POST"
+    assert calls == ["POST", "POST"]
+
+
+def test_error_keeps_the_response_body():
+    async def invalid(request):
+        body = {"errors": [{"errorReason": "INVALID_LOAN_ACCOUNT_ID"}]}
+        return web.json_response(body, status=400)
+
+    async def test(client):
+        return await client.get("loans/1/schedule")
+
+    with pytest.raises(APIResponseError) as error:
+        run_with_server(invalid, test)
+
+    assert error.value.status == 400
+    assert error.value.body["errors"][0]["errorReason"] == "INVALID_LOAN_ACCOUNT_ID"
+
+
+def test_requires_an_open_session():
+    client = AsyncAPIClient(AUTH)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.get("loans"))
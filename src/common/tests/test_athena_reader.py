@@ -0,0 +1,112 @@
+import athena_reader
+import pandas as pd
+import pytest
+from awswrangler import exceptions
+
+
+@pytest.fixture
+def athena(monkeypatch):
+    """
+    Records the queries sent to Athena, every UNLOAD returns no row
+    """
+    queries = []
+
+    def read_sql_query(sql, unload_approach=False, **kwargs):
+        queries.append((sql, unload_approach))
+        if unload_approach:
+            raise exceptions.EmptyDataFrame("Query would return an empty dataframe.")
+        return pd.DataFrame({"id": pd.Series(dtype="Int64")})
+
+    monkeypatch.setenv("ATHENA_UNLOAD_PATH", "s3://bucket/athena_unload")
+    monkeypatch.setattr(athena_reader.wr.athena, "read_sql_query", read_sql_query)
+    monkeypatch.setattr(athena_reader.wr.s3, "delete_objects", lambda path: None)
+    return queries
+
+
+def test_empty_unload_only_reads_the_column_types(athena):
+    sql = "SELECT id FROM datalake_raw.clients -- ids\n;"
+
+    df = athena_reader.query_athena(sql)
+
+    assert df.empty and list(df.columns) == ["id"]
+    limit_sql = "SELECT * FROM (\nSELECT id FROM datalake_raw.clients -- ids\n) LIMIT 0"
+    assert athena == [(sql, True), (limit_sql, False)]
+
+
+def test_partition_predicate_starts_a_day_earlier():
+    assert athena_reader.partition_predicate("2024-03-01", "2024-03-05") == (
+        "date >= '20240229' AND date <= '20240305'"
+    )
+    assert athena_reader.partition_predicate() is None
+
+
+def test_normalize_sql_ignores_comments_and_spaces():
+    assert athena_reader.normalize_sql(
+        "SELECT id  -- the id\nFROM   datalake_raw.clients\n"
+    ) == athena_reader.normalize_sql("SELECT id FROM datalake_raw.clients")
+
+
+def test_get_tables():
+    sql = 'SELECT * FROM "datalake_raw"."Clients" c JOIN datalake_raw.loans l ON 1=1'
+
+    assert athena_reader.get_tables(sql) == [
+        ("datalake_raw", "clients"),
+        ("datalake_raw", "loans"),
+    ]
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    """
+    A local cache path, tables are fingerprinted on their generation only
+    """
+    monkeypatch.setenv("ATHENA_CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setenv("ATHENA_CACHE_TTL", "3600")
+    monkeypatch.setattr(athena_reader, "LOCAL_CACHE_DIR", str(tmp_path / "tmp"))
+
+    def get_table_fingerprint(database, table):
+        return str(athena_reader.get_table_generation(database, table))
+
+    monkeypatch.setattr(athena_reader, "get_table_fingerprint", get_table_fingerprint)
+
+
+def test_cache_key_changes_with_the_table_generation(cache):
+    sql = "SELECT id FROM datalake_raw.clients"
+    key = athena_reader.get_cache_key(sql, "datalake_raw", True)
+
+    assert key == athena_reader.get_cache_key(sql + "\n", "datalake_raw", True)
+    athena_reader.invalidate_tables(["Clients"])
+    assert key != athena_reader.get_cache_key(sql, "datalake_raw", True)
+    assert athena_reader.get_cache_key("SELECT 1", "datalake_raw", True) is None
+
+
+def test_read_athena_serves_cached_results(cache, monkeypatch):
+    queries = []
+
+    def query_athena(sql, database, workgroup, unload):
+        queries.append(sql)
+        return pd.DataFrame({"id": [len(queries)]})
+
+    monkeypatch.setattr(athena_reader, "query_athena", query_athena)
+    sql = "SELECT id FROM datalake_raw.clients"
+
+    assert athena_reader.read_athena(sql)["id"].tolist() == [1]
+    assert athena_reader.read_athena(sql)["id"].tolist() == [1]
+    assert athena_reader.read_athena(sql, cache_ttl=0)["id"].tolist() == [2]
+    athena_reader.invalidate_tables(["clients"])
+    assert athena_reader.read_athena(sql)["id"].tolist() == [3]
+
+
+def test_get_recent_partitions_falls_back_to_all(monkeypatch):
+    calls = []
+
+    partitions = {"s3://bucket/clients/date=20200101/": ["20200101"]}
+
+    def get_partitions(database, table, expression=None):
+        calls.append(expression)
+        return {} if expression else partitions
+
+    monkeypatch.setattr(athena_reader.wr.catalog, "get_partitions", get_partitions)
+
+    assert athena_reader.get_recent_partitions("datalake_raw", "clients") == partitions
+    assert calls[0].startswith("date >= '") and calls[1] is None
@@ -0,0 +1,180 @@
+import custom_fields
+import pandas as pd
+import pytest
+from state_store import LocalStateStore
+
+ENTRY = {
+    "table": "clients",
+    "slots": 2,
+    "columns": ["id", "encoded_key", "creation_date", "last_modified_date"],
+    "custom_field_ids": ["IBAN", "Fee_Override"],
+}
+FIELD_IDS = ENTRY["custom_field_ids"]
+
+
+def test_pivot_custom_fields_last_slot_wins():
+    df = pd.DataFrame(
+        {
+            "id": ["1", "2"],
+            "custom_fields_0_id": ["IBAN", "0"],
+            "custom_fields_0_value": ["GB01", "x"],
+            "custom_fields_1_id": ["IBAN", "Fee_Override"],
+            "custom_fields_1_value": ["GB02", "true"],
+        }
+    )
+
+    pivoted_df = custom_fields.pivot_custom_fields(df)
+
+    assert list(pivoted_df.columns) == ["id", "Fee_Override", "IBAN"]
+    assert pivoted_df["IBAN"].tolist() == ["GB02", "None"]
+    assert pivoted_df["Fee_Override"].tolist() == ["None", "true"]
+
+
+def test_merge_snapshot_replaces_changed_keys():
+    snapshot_df = pd.DataFrame({"encoded_key": ["a", "b"], "IBAN": ["GB01", "GB02"]})
+    changed_df = pd.DataFrame({"encoded_key": ["b", "c"], "Fee_Override": ["1", "2"]})
+
+    merged_df = custom_fields.merge_snapshot(
+        snapshot_df, changed_df, "encoded_key", ["IBAN", "Fee_Override"]
+    )
+
+    assert merged_df.to_dict("records") == [
+        {"encoded_key": "a", "IBAN": "GB01", "Fee_Override": "None"},
+        {"encoded_key": "b", "IBAN": "None", "Fee_Override": "1"},
+        {"encoded_key": "c", "IBAN": "None", "Fee_Override": "2"},
+    ]
+
+
+def test_drop_unset_rows():
+    df = pd.DataFrame(
+        {"encoded_key": ["a", "b"], "IBAN": ["None", "GB01"], "other": ["x", "None"]}
+    )
+
+    assert custom_fields.drop_unset_rows(df, ["IBAN", "Fee_Override"])[
+        "encoded_key"
+    ].tolist() == ["b"]
+
+
+def test_custom_fields_sql_filters_on_field_ids():
+    sql = custom_fields.custom_fields_sql("clients", ["IBAN"], 2, ["id"])
+
+    assert "custom_fields_0_id IN ('IBAN')\n   OR custom_fields_1_id IN ('IBAN')" in sql
+    # highest slot first, so that coalesce keeps the last slot
+    assert sql.index("custom_fields_1_id = 'IBAN'") < sql.index(
+        "custom_fields_0_id = 'IBAN'"
+    )
+
+
+def test_custom_fields_sql_without_field_filter():
+    sql = custom_fields.custom_fields_sql(
+        "clients", ["IBAN"], 2, ["id"], where="x > 1", with_field_only=False
+    )
+
+    assert sql.endswith("FROM datalake_raw.clients\nWHERE x > 1")
+
+
+def test_timestamp_literal_is_utc():
+    assert (
+        custom_fields.timestamp_literal("2024-01-01T02:00:00.5+02:00")
+        == "TIMESTAMP '2024-01-01 00:00:00.500000'"
+    )
+
+
+@pytest.mark.parametrize("pivot", ["athena", "pandas"])
+def test_get_sql_without_watermark(monkeypatch, tmp_path, pivot):
+    monkeypatch.setenv("CUSTOM_FIELDS_PIVOT", pivot)
+    sql_file = tmp_path / "clients_customfields.sql"
+    sql_file.write_text("SELECT * FROM datalake_raw.clients WHERE id = 1")
+    entry = dict(ENTRY, clients_customfields=str(sql_file))
+
+    sql = custom_fields.get_sql("clients_customfields", entry)
+
+    assert "last_modified_date >" not in sql
+    assert "FROM datalake_raw.clients" in sql
+
+
+@pytest.mark.parametrize("pivot", ["athena", "pandas"])
+def test_get_sql_with_watermark_reads_every_modified_row(monkeypatch, pivot):
+    monkeypatch.setenv("CUSTOM_FIELDS_PIVOT", pivot)
+
+    sql = custom_fields.get_sql("clients_customfields", ENTRY, "2024-01-02 10:00:00")
+
+    assert "IN ('IBAN'" not in sql
+    assert "date >= '20240101'" in sql
+    assert "last_modified_date > TIMESTAMP '2024-01-02 10:00:00.000000'" in sql
+
+
+@pytest.fixture
+def data_lake(monkeypatch):
+    """
+    Replaces the Athena read and the data lake read and write of custom_fields
+    """
+    lake = {"athena": [], "written": []}
+    monkeypatch.setenv("CUSTOM_FIELDS_PIVOT", "athena")
+    monkeypatch.setattr(
+        custom_fields, "read_athena", lambda sql, database: lake["athena"].pop(0)
+    )
+    monkeypatch.setattr(
+        custom_fields, "read_snapshot", lambda table_name: lake.get("snapshot")
+    )
+
+    def write_to_data_lake(df, table_name, dtype, columns_comments):
+        lake["written"].append(df)
+        return True
+
+    monkeypatch.setattr(custom_fields, "write_to_data_lake", write_to_data_lake)
+    return lake
+
+
+def test_update_custom_fields_without_watermark(data_lake, tmp_path):
+    state_store = LocalStateStore(str(tmp_path))
+    data_lake["athena"].append(
+        pd.DataFrame(
+            {
+                "encoded_key": ["a", "a"],
+                "last_modified_date": pd.to_datetime(["2024-01-01", "2024-01-02"]),
+                "iban": ["GB01", "GB02"],
+                "fee_override": ["None", "None"],
+            }
+        )
+    )
+
+    assert custom_fields.update_custom_fields(
+        "clients_customfields", ENTRY, {}, {}, state_store, field_ids=FIELD_IDS
+    )
+
+    assert data_lake["written"][0]["IBAN"].tolist() == ["GB02"]
+    assert state_store.get("watermarks/clients_customfields.json")["value"] == (
+        "2024-01-02 00:00:00"
+    )
+
+
+def test_update_custom_fields_merges_removed_fields(data_lake, tmp_path):
+    state_store = LocalStateStore(str(tmp_path))
+    state_store.put(
+        "watermarks/clients_customfields.json", {"value": "2024-01-01 00:00:00"}
+    )
+    data_lake["snapshot"] = pd.DataFrame(
+        {
+            "encoded_key": ["a", "b"],
+            "last_modified_date": pd.to_datetime(["2023-12-01", "2023-12-01"]),
+            "iban": ["GB01", "GB02"],
+            "fee_override": ["None", "true"],
+        }
+    )
+    data_lake["athena"].append(
+        pd.DataFrame(
+            {
+                "encoded_key": ["a"],
+                "last_modified_date": pd.to_datetime(["2024-01-02"]),
+                "iban": ["None"],
+                "fee_override": ["None"],
+            }
+        )
+    )
+
+    custom_fields.update_custom_fields(
+        "clients_customfields", ENTRY, {}, {}, state_store, field_ids=FIELD_IDS
+    )
+
+    assert data_lake["written"][0]["encoded_key"].tolist() == ["b"]
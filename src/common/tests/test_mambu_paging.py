@@ -0,0 +1,174 @@
+import itertools
+import json
+import random
+import time
+from datetime import datetime
+from datetime import timedelta
+from urllib.parse import parse_qs
+
+import mambu_paging
+import pytest
+
+START = datetime(2025, 1, 1)
+
+
+class FakeMambu:
+    """
+    Search endpoint over records, filtered by the BETWEEN criteria of the
+    payload and sorted by its sorting field, as Mambu does. Records sharing
+    the sorting value come in a different order on every request.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.payloads = []
+        self.random = random.Random(0)
+
+    def search(self, query, body):
+        payload = json.loads(body)
+        self.payloads.append(payload)
+        criteria = payload["filterCriteria"][0]
+        records = [
+            record
+            for record in self.records
+            if criteria["value"] <= record[criteria["field"]] <= criteria["secondValue"]
+        ]
+        if "sortingCriteria" in payload:
+            field = payload["sortingCriteria"]["field"]
+            self.random.shuffle(records)
+            records = sorted(records, key=lambda record: record[field])
+        params = parse_qs(query)
+        return records, {key: int(params[key][0]) for key in ("limit", "offset")}
+
+    def make_request(self, method, endpoint, query=None, body=None, **kwargs):
+        records, _ = self.search(query, body)
+        return [], {"items-total": str(len(records))}
+
+    def post(self, endpoint, body=None, query=None, **kwargs):
+        records, params = self.search(query, body)
+        return records[params["offset"] : params["offset"] + params["limit"]]
+
+
+def mambu_date(value: datetime) -> str:
+    return value.isoformat(timespec="milliseconds")
+
+
+def record(key, minutes):
+    return {
+        "encodedKey": key,
+        "lastModifiedDate": mambu_date(START + timedelta(minutes=minutes)),
+    }
+
+
+def test_plan_time_windows_bisects_dense_and_merges_sparse_windows():
+    # a burst of 6 records around minute 10 and one record every 100 minutes
+    records = [record(f"burst{i}", 10 + i / 10) for i in range(6)]
+    records += [record(f"sparse{i}", 100 * i + 50) for i in range(8)]
+    end_date = START + timedelta(minutes=800)
+
+    windows = mambu_paging.plan_time_windows(
+        FakeMambu(records), "loans:search", "lastModifiedDate", START, end_date, 4
+    )
+
+    assert windows[0][0] == START and windows[-1][1] == end_date
+    for (_, previous_end, _), (next_start, _, _) in zip(windows, windows[1:]):
+        assert next_start - previous_end == mambu_paging.WINDOW_GAP
+    assert sum(count for _, _, count in windows) == len(records)
+    # the burst is split, the sparse windows are merged back up to the target
+    assert all(count <= 4 for _, _, count in windows)
+    assert len(windows) == 4
+
+
+def test_plan_time_windows_without_a_total():
+    client = FakeMambu([])
+    client.make_request = lambda *args, **kwargs: ([], {})
+    end_date = START + timedelta(days=1)
+
+    windows = mambu_paging.plan_time_windows(
+        client, "loans:search", "lastModifiedDate", START, end_date, 4
+    )
+
+    assert windows == [(START, end_date, None)]
+
+
+def test_plan_time_windows_stops_bisecting_at_min_window():
+    records = [record(f"burst{i}", 10 + i / 100) for i in range(6)]
+    end_date = START + timedelta(minutes=20)
+
+    windows = mambu_paging.plan_time_windows(
+        FakeMambu(records), "loans:search", "lastModifiedDate", START, end_date, 4
+    )
+
+    assert [count for _, _, count in windows if count > 4] == [6]
+
+
+@pytest.mark.parametrize("limit", [2, 3, 10])
+def test_keyset_pages_return_every_record_once_with_ties(limit):
+    records = [record(f"a{i}", 1) for i in range(3)]
+    records += [record(f"b{i}", 2) for i in range(5)]
+    records += [record(f"c{i}", 3) for i in range(2)]
+    client = FakeMambu(records)
+
+    pages = list(
+        mambu_paging.iter_keyset_pages(
+            client,
+            "loans:search",
+            "lastModifiedDate",
+            mambu_date(START),
+            mambu_date(START + timedelta(minutes=10)),
+            limit=limit,
+        )
+    )
+
+    keys = [record["encodedKey"] for page in pages for record in page]
+    assert sorted(keys) == sorted(record["encodedKey"] for record in records)
+    sort_fields = {payload["sortingCriteria"]["field"] for payload in client.payloads}
+    assert ("encodedKey" in sort_fields) == (limit < 5)
+
+
+def scan_of(name, pages, delay=0.0):
+    def scan():
+        for page in range(pages):
+            time.sleep(delay)
+            yield [f"{name}{page}"]
+
+    return scan
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_fan_out_yields_pages_in_the_order_of_scans(concurrency):
+    # the first scan is the slowest, its pages still come first
+    scans = [scan_of("a", 3, 0.02), scan_of("b", 4), scan_of("c", 0), scan_of("d", 2)]
+
+    pages = list(mambu_paging.iter_fan_out(scans, concurrency, queue_pages=1))
+
+    assert [page[0] for page in pages] == "a0 a1 a2 b0 b1 b2 b3 d0 d1".split()
+
+
+def test_fan_out_raises_the_error_of_a_scan():
+    def failing_scan():
+        yield ["b0"]
+        raise ValueError("page 1 failed")
+
+    pages = mambu_paging.iter_fan_out([scan_of("a", 1), failing_scan], 2)
+
+    assert next(pages) == ["a0"]
+    assert next(pages) == ["b0"]
+    with pytest.raises(ValueError, match="page 1 failed"):
+        next(pages)
+
+
+def test_fan_out_stops_the_scans_when_the_consumer_stops():
+    scanned = []
+
+    def endless_scan():
+        for page in itertools.count():
+            scanned.append(page)
+            yield [page]
+
+    pages = mambu_paging.iter_fan_out([endless_scan, endless_scan], 2, queue_pages=1)
+    assert next(pages) == [0]
+    # returns once both scans gave up
+    pages.close()
+
+    assert len(scanned) <= 6
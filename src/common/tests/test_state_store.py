@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+from state_store import LocalStateStore
+from state_store import S3StateStore
+from state_store import get_state_store
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            error = {"Error": {"Code": "NoSuchKey", "Message": "Not found"}}
+            raise ClientError(error, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[(Bucket, Key)] = Body
+
+
+def test_local_state_store(tmp_path):
+    store = LocalStateStore(str(tmp_path))
+
+    assert store.get("watermarks/loans.json") is None
+    store.put("watermarks/loans.json", {"value": "2025-01-01"})
+    store.put("watermarks/loans.json", {"value": "2025-01-02"})
+
+    assert store.get("watermarks/loans.json") == {"value": "2025-01-02"}
+    assert [path.name for path in (tmp_path / "watermarks").iterdir()] == ["loans.json"]
+
+
+def test_s3_state_store_under_a_prefix():
+    s3_client = FakeS3()
+    store = S3StateStore("bucket", "/mambu_meta/state/", s3_client)
+
+    assert store.get("watermarks/loans.json") is None
+    store.put("watermarks/loans.json", {"value": "2025-01-01"})
+
+    assert store.get("watermarks/loans.json") == {"value": "2025-01-01"}
+    body = s3_client.objects[("bucket", "mambu_meta/state/watermarks/loans.json")]
+    assert json.loads(body) == {"value": "2025-01-01"}
+
+
+def test_s3_state_store_raises_other_errors():
+    s3_client = FakeS3()
+
+    def get_object(Bucket, Key):
+        error = {"Error": {"Code": "AccessDenied", "Message": "Denied"}}
+        raise ClientError(error, "GetObject")
+
+    s3_client.get_object = get_object
+
+    with pytest.raises(ClientError):
+        S3StateStore("bucket", s3_client=s3_client).get("watermarks/loans.json")
+
+
+def test_get_state_store(monkeypatch, tmp_path):
+    monkeypatch.setattr("state_store.boto3.client", lambda service: FakeS3())
+    monkeypatch.setenv("S3_META", "meta-bucket")
+    monkeypatch.delenv("STATE_STORE_PATH", raising=False)
+
+    default_store = get_state_store()
+    monkeypatch.setenv("STATE_STORE_PATH", str(tmp_path))
+
+    assert (default_store.bucket, default_store.prefix) == (
+        "meta-bucket",
+        "mambu_meta/state",
+    )
+    assert isinstance(get_state_store(), LocalStateStore)
+    assert get_state_store("s3://bucket").object_key("a.json") == "a.json"
@@ -9,9 +9,13 @@ from typing import Dict
 from typing import List
 from typing import Tuple
 
+from api_client import APIClient
 from awsglue.utils import getResolvedOptions
 from lambda_function import lambda_handler
+from mambu_paging import WINDOW_GAP
+from mambu_paging import plan_time_windows
 
+from utils import get_secret
 from utils import setup_logger
 
 ##########################################################
@@ -28,6 +32,9 @@ event = {
     "auto_schema": "False",  # Optional, True only if table is not in data_catalog.py
     "rename_columns": [],  # Optional, list of dicts [{"old_name": "new_name"}]
     "chunk_hours": 24,  # Optional, Int, default 24 per lambda_handler call
+    "chunk_records": 0,  # Optional, Int, POST only, sizes chunks adaptively to ~N records instead of chunk_hours
+    "concurrency": 1,  # Optional, Int, pages requested in parallel per chunk
+    "batch_rows": 100000,  # Optional, Int, records written to S3 per batch
 }
 ##########################################################
 # SAMPLE EVENTS (append start_date and end_date to the event below):
@@ -108,12 +115,13 @@ def setup_environment() -> bool:
     """
     try:
         args = getResolvedOptions(
-            sys.argv, ["MAMBU_SUBDOMAIN", "MAMBU_PASSWORD_NAME", "S3_RAW"]
+            sys.argv, ["MAMBU_SUBDOMAIN", "MAMBU_PASSWORD_NAME", "S3_RAW", "S3_META"]
         )
 
         os.environ["MAMBU_SUBDOMAIN"] = args["MAMBU_SUBDOMAIN"]
         os.environ["MAMBU_PASSWORD_NAME"] = args["MAMBU_PASSWORD_NAME"]
         os.environ["S3_RAW"] = args["S3_RAW"]
+        os.environ["S3_META"] = args["S3_META"]
 
         return True
     except Exception as e:
@@ -149,21 +157,37 @@ def parse_date_range(event: Dict) -> Tuple[datetime, datetime]:
         raise
 
 
-def process_data_in_chunks(
+def plan_chunks(
     event: Dict, start_date: datetime, end_date: datetime
-) -> List[Dict]:
+) -> List[Tuple[datetime, datetime]]:
     """
-    Process data in 24-hour chunks and track successes and failures.
-
-    Args:
-        event (Dict): The original event dictionary
-        start_date (datetime): Start date/time for processing
-        end_date (datetime): End date/time for processing
+    Split the date range in chunks, either of chunk_hours each or, when
+    chunk_records is set for a POST request, in adaptive windows of about
+    chunk_records records probed from Mambu.
     """
-    current_start = start_date
+    chunk_records = int(event.get("chunk_records", 0))
+    if chunk_records and event["request_type"].lower() == "post":
+        mambu_client = APIClient(
+            auth=get_secret(os.environ["MAMBU_PASSWORD_NAME"]),
+            base_url=f"https://{os.environ['MAMBU_SUBDOMAIN']}.mambu.com/api/",
+        )
+        windows = plan_time_windows(
+            mambu_client,
+            event["endpoint"],
+            event["cdc_field"],
+            start_date,
+            end_date,
+            chunk_records,
+            event.get("extra_params", ""),
+        )
+        logger.info(
+            f"Total duration to be processed in {len(windows)} chunks of up to {chunk_records} records"
+        )
+        return [(window_start, window_end) for window_start, window_end, _ in windows]
+
     chunk_size = int(event.get("chunk_hours", 24))
-    chunk_num = 1
-    all_chunks: List[Dict] = []
+    chunks = []
+    current_start = start_date
 
     # Calculate total duration for logging purposes
     total_duration = end_date - start_date
@@ -175,11 +199,38 @@ def process_data_in_chunks(
     while current_start < end_date:
         # (either 24 hours later or the final end date)
         current_end = min(current_start + timedelta(hours=chunk_size), end_date)
+        # Chunk bounds are inclusive, a chunk stops WINDOW_GAP before the next one
+        chunks.append(
+            (
+                current_start,
+                current_end if current_end == end_date else current_end - WINDOW_GAP,
+            )
+        )
+        current_start = current_end
 
+    return chunks
+
+
+def process_data_in_chunks(
+    event: Dict, start_date: datetime, end_date: datetime
+) -> List[Dict]:
+    """
+    Process data in chunks and track successes and failures.
+
+    Args:
+        event (Dict): The original event dictionary
+        start_date (datetime): Start date/time for processing
+        end_date (datetime): End date/time for processing
+    """
+    all_chunks: List[Dict] = []
+
+    for chunk_num, (current_start, current_end) in enumerate(
+        plan_chunks(event, start_date, end_date), start=1
+    ):
         chunk_info: Dict = {
             "chunk_num": chunk_num,
-            "start_date": current_start.strftime("%Y-%m-%d %H:%M:%S"),
-            "end_date": current_end.strftime("%Y-%m-%d %H:%M:%S"),
+            "start_date": current_start.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "end_date": current_end.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
         }
 
         logger.info(f"Processing chunk {chunk_num}: {current_start} to {current_end}")
@@ -204,9 +255,6 @@ def process_data_in_chunks(
 
         all_chunks.append(chunk_info)
 
-        current_start = current_end
-        chunk_num += 1
-
     return all_chunks
 
 
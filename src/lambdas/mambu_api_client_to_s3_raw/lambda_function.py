@@ -1,24 +1,34 @@
 import os
+import uuid
 from datetime import datetime
 from datetime import timezone
 
 import awswrangler as wr
+import pandas as pd
 from api_client import APIClient
+from athena_reader import invalidate_tables
 from data_catalog import schemas
+from state_store import get_state_store
 
-from utils import fetch_data_switch
+from utils import apply_schema
+from utils import camel_to_snake
 from utils import get_secret
-from utils import get_start_time_from_athena
+from utils import get_start_time
+from utils import iter_batches
+from utils import iter_data_switch
 from utils import process_dataframe
 from utils import setup_logger
+from utils import to_utc_isoformat
+from utils import update_watermark
 
 
 logger = setup_logger("mambu_api_client_lambda")
 
 
-def validate_event_inputs(event):
+def validate_event_inputs(event, state_store=None):
     """
     Validates and extracts inputs from the Lambda event payload.
+    Without start_date, the run starts from the table watermark in state_store.
     """
     required_keys = ["endpoint", "table_name", "request_type"]
     for key in required_keys:
@@ -32,26 +42,111 @@ def validate_event_inputs(event):
         "cdc_field": event.get("cdc_field", ""),
         "table_name": event["table_name"].lower(),
         "start_date": (
-            datetime.strptime(event.get("start_date"), "%Y-%m-%d %H:%M:%S")
-            .replace(tzinfo=timezone.utc)
-            .isoformat()
+            to_utc_isoformat(event["start_date"])
             if event.get("start_date")
-            else get_start_time_from_athena(
-                event["table_name"], event.get("cdc_field", "")
+            else get_start_time(
+                event["table_name"].lower(), event.get("cdc_field", ""), state_store
             )
         ),
         "end_date": (
-            datetime.strptime(event.get("end_date"), "%Y-%m-%d %H:%M:%S")
-            .replace(tzinfo=timezone.utc)
-            .isoformat()
+            to_utc_isoformat(event["end_date"])
             if event.get("end_date")
             else datetime.now(timezone.utc).replace(microsecond=0).isoformat()
         ),
         "auto_schema": event.get("auto_schema", "False").lower() == "true",
         "rename_columns": event.get("rename_columns", []),
+        "concurrency": int(event.get("concurrency", 1)),
+        "batch_rows": int(event.get("batch_rows", 100000)),
+        "window_records": int(event.get("window_records", 0)),
+        "pagination": event.get("pagination", "offset").lower(),
     }
 
 
+def stage_batch(df, staging_path, table_schema):
+    """
+    Writes a processed batch under the staging prefix of the run, outside the
+    catalog. Returns the written files with the types they were written with.
+    """
+    logger.info(f"Staging {len(df)} records.")
+    result = wr.s3.to_parquet(
+        df=df,
+        path=staging_path,
+        index=False,
+        dataset=True,
+        mode="append",
+        compression="snappy",
+        partition_cols=["date"],
+        dtype=table_schema,
+    )
+    columns_types, partitions_types = wr.catalog.extract_athena_types(
+        df=df, index=False, partition_cols=["date"], dtype=table_schema
+    )
+    return {
+        "paths": result["paths"],
+        "partitions_values": result["partitions_values"],
+        "columns_types": columns_types,
+        "partitions_types": partitions_types,
+    }
+
+
+def commit_staged(staged_batches, staging_path, path, table_name):
+    """
+    Moves the staged batches of a run to the raw table and registers their
+    columns and partitions in the catalog. Files staged before a column was
+    widened are rewritten with the final types first.
+    """
+    columns_types = {}
+    partitions_types = {}
+    for batch in staged_batches:
+        columns_types.update(batch["columns_types"])
+        partitions_types.update(batch["partitions_types"])
+
+    paths = []
+    partitions_values = {}
+    for batch in staged_batches:
+        changed_types = {
+            column: columns_types[column]
+            for column, dtype in batch["columns_types"].items()
+            if columns_types[column] != dtype
+        }
+        for file_path in batch["paths"]:
+            if changed_types:
+                logger.info(f"Rewriting {file_path} with types {changed_types}.")
+                staged_df = apply_schema(wr.s3.read_parquet(file_path), changed_types)
+                wr.s3.to_parquet(
+                    df=staged_df,
+                    path=file_path,
+                    index=False,
+                    compression="snappy",
+                    dtype={
+                        column: columns_types[column] for column in staged_df.columns
+                    },
+                )
+            paths.append(file_path)
+        for location, values in batch["partitions_values"].items():
+            partitions_values[location.replace(staging_path, path, 1)] = values
+
+    logger.info(f"Moving {len(paths)} staged files to {path}.")
+    wr.s3.copy_objects(paths=paths, source_path=staging_path, target_path=path)
+    wr.catalog.create_parquet_table(
+        database="datalake_raw",
+        table=table_name,
+        path=path,
+        columns_types=columns_types,
+        partitions_types=partitions_types,
+        compression="snappy",
+        mode="append",
+    )
+    wr.catalog.add_parquet_partitions(
+        database="datalake_raw",
+        table=table_name,
+        partitions_values=partitions_values,
+        compression="snappy",
+        columns_types=columns_types,
+    )
+    invalidate_tables([table_name])
+
+
 def lambda_handler(event, context):
     """
     Main Lambda handler function.
@@ -63,7 +158,9 @@ def lambda_handler(event, context):
         mambu_auth_path = os.environ["MAMBU_PASSWORD_NAME"]
         s3_raw = os.environ["S3_RAW"]
 
-        event = validate_event_inputs(event)
+        # Watermarks and inferred schemas are kept per table in the state store
+        state_store = get_state_store()
+        event = validate_event_inputs(event, state_store)
         logger.info(f"Received event:\n{event}")
 
         base_url = f"https://{mambu_subdomain}.mambu.com/api/"
@@ -75,11 +172,16 @@ def lambda_handler(event, context):
 
         # Step 2: Initialize API Client
         logger.info("Initialing API Client.")
-        mambu_client = APIClient(auth=get_secret(mambu_auth_path), base_url=base_url)
+        mambu_client = APIClient(
+            auth=get_secret(mambu_auth_path),
+            base_url=base_url,
+            pool_maxsize=max(10, event["concurrency"]),
+            max_in_flight=event["concurrency"],
+        )
         logger.info("API Client initialized!")
 
-        # Step 3: Fetch Data from API
-        response_df = fetch_data_switch(
+        # Step 3: Fetch Data from API, pages are grouped in batches of batch_rows
+        pages = iter_data_switch(
             mambu_client,
             event["endpoint"],
             event["request_type"],
@@ -87,43 +189,65 @@ def lambda_handler(event, context):
             event["cdc_field"],
             event["start_date"],
             event["end_date"],
+            event["concurrency"],
+            event["window_records"],
+            event["pagination"],
         )
 
-        # Step 4: Process DataFrame
-        if not response_df.empty:
-            response_df, table_schema = process_dataframe(
-                response_df,
-                event["cdc_field"],
-                event["rename_columns"],
-                event["auto_schema"],
-                event["table_name"],
-                schemas,
-            )
+        # Batches are staged under a run prefix and only moved to the table
+        # once every page is fetched, a failed run leaves nothing to duplicate
+        staging_path = f"s3://{s3_raw}/_staging/{event['table_name']}/{uuid.uuid4().hex}/"
+        staged_batches = []
+        records_count = 0
+        cdc_column = camel_to_snake(event["cdc_field"])
+        max_cdc_value = None
+        try:
+            for response_df in iter_batches(pages, event["batch_rows"]):
+                # Step 4: Process DataFrame, auto schemas are checked on every batch
+                response_df, table_schema = process_dataframe(
+                    response_df,
+                    event["cdc_field"],
+                    event["rename_columns"],
+                    event["auto_schema"],
+                    event["table_name"],
+                    schemas,
+                    state_store,
+                )
 
-            # Step 5: Load processed response to Athena
-            logger.info("Loading data to Athena.")
-            wr.s3.to_parquet(
-                df=response_df,
-                path=path,
-                index=False,
-                dataset=True,
-                database="datalake_raw",
-                table=event["table_name"],
-                mode="append",
-                schema_evolution=True,
-                compression="snappy",
-                partition_cols=["date"],
-                dtype=table_schema,
-            )
+                # Step 5: Stage processed batch
+                staged_batches.append(
+                    stage_batch(response_df, staging_path, table_schema)
+                )
+                records_count += len(response_df)
+                logger.info(f"Staged {records_count} records so far.")
+
+                if event["cdc_field"] and cdc_column in response_df.columns:
+                    batch_max_cdc_value = response_df[cdc_column].max()
+                    if pd.notna(batch_max_cdc_value) and (
+                        max_cdc_value is None or batch_max_cdc_value > max_cdc_value
+                    ):
+                        max_cdc_value = batch_max_cdc_value
+
+            # Step 6: Load the staged batches to Athena, then move the watermark
+            if staged_batches:
+                commit_staged(staged_batches, staging_path, path, event["table_name"])
+                logger.info(f"Loaded {records_count} records to Athena.")
+            if max_cdc_value is not None:
+                update_watermark(
+                    state_store, event["table_name"], event["cdc_field"], max_cdc_value
+                )
+        finally:
+            if staged_batches:
+                wr.s3.delete_objects(staging_path)
 
-        # Step 6: Return Response
+        # Step 7: Return Response
         response = {
             "table_name": event["table_name"],
             "endpoint": event["endpoint"],
             "cdc_field": event["cdc_field"],
             "start_date": event["start_date"],
             "end_date": event["end_date"],
-            "records_count": len(response_df),
+            "records_count": records_count,
         }
         logger.info(f"Lambda Response: {response}")
         return response
@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+import utils
+from state_store import LocalStateStore
+
+
+@pytest.mark.parametrize(
+    "values, athena_dtype",
+    [
+        (["1", "-2", "+3"], "int"),
+        (["1", str(2**40)], "bigint"),
+        (["0", "0.5", "1e3"], "double"),
+        (["0123", "45"], "string"),
+        (["-007"], "string"),
+        (["00.5"], "string"),
+        (["true", "False"], "boolean"),
+        (["2024-01-01", "2024-01-02"], "date"),
+        (["2024-01-01T10:00:00.000Z"], "timestamp"),
+        (["abc", "1"], "string"),
+    ],
+)
+def test_infer_athena_dtype(values, athena_dtype):
+    assert utils.infer_athena_dtype(pd.Series(values), "column") == athena_dtype
+
+
+def test_zero_padded_values_do_not_fit_numbers():
+    values = pd.Series(["0123"])
+
+    assert not utils.fits_athena_dtype(values, "int")
+    assert not utils.fits_athena_dtype(values, "double")
+    assert utils.fits_athena_dtype(pd.Series(["0", "12"]), "int")
+
+
+@pytest.mark.parametrize(
+    "cached_dtype, inferred_dtype, widened_dtype",
+    [
+        ("int", "bigint", "bigint"),
+        ("bigint", "double", "double"),
+        ("date", "timestamp", "timestamp"),
+        ("int", "string", "string"),
+        ("boolean", "int", "string"),
+    ],
+)
+def test_widen_athena_dtype(cached_dtype, inferred_dtype, widened_dtype):
+    assert utils.widen_athena_dtype(cached_dtype, inferred_dtype) == widened_dtype
+
+
+def test_get_cached_dtypes_widens_and_infers_new_columns(tmp_path):
+    schema_store = LocalStateStore(str(tmp_path))
+    schema_store.put("schemas/table.json", {"code": "int"})
+    df = pd.DataFrame({"code": ["0012", "7"], "amount": ["1.5", "2"]})
+
+    dtypes = utils.get_cached_dtypes(df, "table", schema_store)
+
+    assert dtypes == {"code": "string", "amount": "double"}
+    assert schema_store.get("schemas/table.json") == dtypes
+
+
+@pytest.mark.parametrize(
+    "value, utc_value",
+    [
+        ("2025-01-01", "2025-01-01T00:00:00+00:00"),
+        ("2025-01-01 10:00:00", "2025-01-01T10:00:00+00:00"),
+        ("2025-01-01T10:00:00+02:00", "2025-01-01T08:00:00+00:00"),
+        ("2025-01-01T10:00:00Z", "2025-01-01T10:00:00+00:00"),
+    ],
+)
+def test_to_utc_isoformat(value, utc_value):
+    assert utils.to_utc_isoformat(value) == utc_value
+
+
+def test_watermark_only_moves_forward_in_utc(tmp_path):
+    state_store = LocalStateStore(str(tmp_path))
+
+    utils.update_watermark(state_store, "loans", "lastModifiedDate", "2025-01-02")
+    utils.update_watermark(
+        state_store, "loans", "lastModifiedDate", "2025-01-02T01:00:00+02:00"
+    )
+
+    assert utils.get_watermark(state_store, "loans", "lastModifiedDate") == (
+        "2025-01-02T00:00:00+00:00"
+    )
+    utils.update_watermark(state_store, "loans", "lastModifiedDate", "2025-01-03")
+    assert utils.get_watermark(state_store, "loans", "lastModifiedDate") == (
+        "2025-01-03T00:00:00+00:00"
+    )
+    # a watermark of another cdc column is not used
+    assert utils.get_watermark(state_store, "loans", "creationDate") is None
+
+
+def test_start_time_from_the_watermark_before_athena(tmp_path, monkeypatch):
+    state_store = LocalStateStore(str(tmp_path))
+    utils.update_watermark(state_store, "loans", "lastModifiedDate", "2025-01-02")
+    monkeypatch.setattr(
+        utils, "get_start_time_from_athena", lambda table_name, cdc_field: "athena"
+    )
+
+    assert utils.get_start_time("loans", "lastModifiedDate", state_store) == (
+        "2025-01-02T00:00:00+00:00"
+    )
+    assert utils.get_start_time("clients", "lastModifiedDate", state_store) == "athena"
+    assert utils.get_start_time("loans", "lastModifiedDate") == "athena"
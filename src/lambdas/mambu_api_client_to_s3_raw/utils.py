@@ -1,4 +1,3 @@
-import ast
 import json
 import logging
 import re
@@ -7,12 +6,19 @@ from datetime import date
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
+from functools import partial
+from typing import Iterator
 from typing import Optional
+from typing import Tuple
 
 import awswrangler as wr
 import boto3
 import pandas as pd
-from api_client import APIClient
+from mambu_paging import create_endpoint_payload
+from mambu_paging import iter_fan_out
+from mambu_paging import iter_keyset_pages
+from mambu_paging import iter_pages
+from mambu_paging import plan_time_windows
 
 
 def setup_logger(
@@ -100,68 +106,170 @@ def get_secret(secret_name: str) -> str:
         ) from e
 
 
-def get_actual_dtypes(df: pd.DataFrame) -> dict:
+# Zero padded values like "0123" are ids or codes, they are kept as strings
+ZERO_PADDED = r"[+-]?0\d"
+
+
+def is_numeric(text_values: pd.Series) -> bool:
+    """
+    Whether all stripped text values are numbers without zero padding
+    """
+    if text_values.str.match(ZERO_PADDED).any():
+        return False
+    return bool(pd.to_numeric(text_values, errors="coerce").notna().all())
+
+
+def infer_athena_dtype(column_values: pd.Series, column_name: str) -> str:
+    """
+    Infers the athena dtype of a column's non null values with vectorized
+    boolean, numeric and timestamp checks, "string" when none of them fits.
+    """
+    if column_values.empty or column_name.lower() == "date":
+        return "string"
+
+    text_values = column_values.astype(str).str.strip()
+    if text_values.str.lower().isin(["true", "false"]).all():
+        return "boolean"
+
+    if is_numeric(text_values):
+        numeric_values = pd.to_numeric(text_values)
+        if text_values.str.fullmatch(r"[+-]?\d+").all():
+            if numeric_values.min() >= -(2**31) and numeric_values.max() <= (
+                2**31 - 1
+            ):
+                return "int"
+            return "bigint"
+        return "double"
+
+    # Only strings starting with a digit can be one of the accepted formats
+    if text_values.str.match(r"\d").all():
+        timestamp_values, unparsed = parse_iso_formats(text_values)
+        if not unparsed.any():
+            if timestamp_values.equals(timestamp_values.dt.normalize()):
+                return "date"
+            return "timestamp"
+
+    return "string"
+
+
+def get_actual_dtypes(df: pd.DataFrame, sample_size: int = 10000) -> dict:
     """Takes a target dataframe, returns the schemas dict
     to be used while creating aws glue table,
     data types references from https://docs.aws.amazon.com/athena/latest/ug/data-types.html
+
+    Types are inferred on a sample of at most sample_size non null values per
+    column. A sample can only prove a column is a string, so columns inferred
+    as any other type are confirmed on all their values.
     """
     result_dict = {}
     for column_name in df.columns:
         column_values = (
-            df[column_name].replace("None", None).replace("", None).dropna().astype(str)
+            df[column_name].replace("None", None).replace("", None).dropna()
         )
-        try:
-            if "date" != column_name.lower():
-                column_values = pd.Series(
-                    [
-                        ast.literal_eval(entry.capitalize())
-                        for entry in column_values.values
-                    ]
-                )
-            else:
-                raise Exception
+        if len(column_values) <= sample_size:
+            result_dict[column_name] = infer_athena_dtype(column_values, column_name)
+            continue
+
+        sample_values = column_values.sample(sample_size, random_state=0)
+        athena_dtype = infer_athena_dtype(sample_values, column_name)
+        if athena_dtype != "string":
+            logger.info(
+                f"Confirming {athena_dtype} dtype of {column_name} on {len(column_values)} values."
+            )
+            athena_dtype = infer_athena_dtype(column_values, column_name)
+        result_dict[column_name] = athena_dtype
 
-        except Exception:
-            try:
-                column_values = pd.Series(
-                    [pd.to_datetime(entry) for entry in column_values.values]
-                )
-            except Exception:
-                pass
+    return result_dict
 
-        try:
-            if pd.api.types.is_integer_dtype(column_values):
-                max_value = column_values.max()
-                if max_value >= -(2**31) and max_value <= (2**31 - 1):
-                    athena_dtype = "int"
-                else:
-                    athena_dtype = "bigint"
-            elif pd.api.types.is_float_dtype(column_values):
-                max_value = column_values.max()
-                if str(max_value.dtype) == "float32":
-                    athena_dtype = "float"
-                else:
-                    athena_dtype = "double"
-            elif pd.api.types.is_bool_dtype(column_values):
-                athena_dtype = "boolean"
-            elif (
-                pd.api.types.is_datetime64_any_dtype(column_values)
-                and column_name != "date"
-            ):
-                if column_values.equals(column_values.dt.normalize()):
-                    athena_dtype = "date"
-                else:
-                    athena_dtype = "timestamp"
 
-            else:
-                athena_dtype = "string"
+def fits_athena_dtype(column_values: pd.Series, athena_dtype: str) -> bool:
+    """
+    Whether all non null values of a column can be stored as athena_dtype,
+    with the same checks as infer_athena_dtype.
+    """
+    if column_values.empty or athena_dtype == "string":
+        return True
+
+    text_values = column_values.astype(str).str.strip()
+    if athena_dtype == "boolean":
+        return bool(text_values.str.lower().isin(["true", "false"]).all())
+    if athena_dtype in ("int", "bigint"):
+        if not is_numeric(text_values) or not text_values.str.fullmatch(
+            r"[+-]?\d+"
+        ).all():
+            return False
+        numeric_values = pd.to_numeric(text_values, errors="coerce")
+        if athena_dtype == "int":
+            return bool(
+                numeric_values.min() >= -(2**31) and numeric_values.max() <= 2**31 - 1
+            )
+        return bool(numeric_values.notna().all())
+    if athena_dtype == "double":
+        return is_numeric(text_values)
+    if athena_dtype in ("timestamp", "date"):
+        timestamp_values, unparsed = parse_iso_formats(text_values)
+        if unparsed.any():
+            return False
+        return athena_dtype == "timestamp" or timestamp_values.equals(
+            timestamp_values.dt.normalize()
+        )
+    return False
 
-        except Exception:
-            athena_dtype = "string"
 
-        result_dict[column_name] = athena_dtype
+def widen_athena_dtype(cached_dtype: str, inferred_dtype: str) -> str:
+    """
+    The narrowest athena dtype holding the values of both dtypes.
+    """
+    dtypes = {cached_dtype, inferred_dtype}
+    if len(dtypes) == 1:
+        return cached_dtype
+    if dtypes <= {"int", "bigint"}:
+        return "bigint"
+    if dtypes <= {"int", "bigint", "double"}:
+        return "double"
+    if dtypes <= {"date", "timestamp"}:
+        return "timestamp"
+    return "string"
+
+
+def get_cached_dtypes(df: pd.DataFrame, table_name: str, schema_store=None) -> dict:
+    """
+    Returns the auto schema of df, reusing the dtypes cached for table_name in
+    schema_store and inferring only the columns it does not know yet.
+    Cached dtypes are checked against the values of df, a column whose values
+    no longer fit is widened (int to bigint to double, date to timestamp, else
+    string) and the cache refreshed, instead of coercing its values.
+    """
+    cache_key = f"schemas/{table_name}.json"
+    cached_schema = (schema_store.get(cache_key) if schema_store else None) or {}
+    changed = False
+
+    for column in df.columns:
+        if column not in cached_schema:
+            continue
+        column_values = df[column].replace("None", None).replace("", None).dropna()
+        if fits_athena_dtype(column_values, cached_schema[column]):
+            continue
+        widened_dtype = widen_athena_dtype(
+            cached_schema[column], infer_athena_dtype(column_values, column)
+        )
+        logger.warning(
+            f"[WARNING] {column} values do not fit the cached {cached_schema[column]} "
+            f"dtype of {table_name}, widening it to {widened_dtype}."
+        )
+        cached_schema[column] = widened_dtype
+        changed = True
 
-    return result_dict
+    new_columns = [column for column in df.columns if column not in cached_schema]
+    if new_columns:
+        logger.info(f"Inferring dtypes of {len(new_columns)} columns for {table_name}.")
+        cached_schema.update(get_actual_dtypes(df[new_columns]))
+        changed = True
+
+    if changed and schema_store:
+        schema_store.put(cache_key, cached_schema)
+
+    return {column: cached_schema[column] for column in df.columns}
 
 
 def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
@@ -174,6 +282,9 @@ def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
 
     Returns:
         pd.DataFrame: DataFrame with data types specified in the schema.
+
+    Raises:
+        ValueError: When non null values do not fit a numeric or timestamp dtype.
     """
 
     # Mapping schema types to pandas dtypes
@@ -193,22 +304,36 @@ def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
             if dtype in ["timestamp", "date"] and column != "date":
                 df[column] = apply_iso_format(df[column])
             elif dtype in ["int", "bigint", "double"]:
-                df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0)
+                numeric_values = pd.to_numeric(df[column], errors="coerce")
+                # Only nulls default to 0, values that are not numbers fail the batch
+                invalid = numeric_values.isna() & ~df[column].isna()
+                invalid &= ~df[column].astype(str).str.strip().isin(["", "None"])
+                if invalid.any():
+                    raise ValueError(
+                        f"Error processing {invalid.sum()} values in {column}: "
+                        f"not {dtype}, first rows: {df[column][invalid].head(5).to_dict()}"
+                    )
+                df[column] = numeric_values.fillna(0)
             else:
                 df[column] = df[column].astype(pandas_dtype)
 
     return df
 
 
-def apply_iso_format(timestamp_column: pd.Series) -> pd.Series:
+MIN_TIMESTAMP = pd.Timestamp.min.tz_localize("UTC")
+MAX_TIMESTAMP = pd.Timestamp.max.tz_localize("UTC")
+
+
+def parse_iso_formats(timestamp_column: pd.Series) -> Tuple[pd.Series, pd.Series]:
     """
-    Apply ISO format to a timestamp column, trying multiple formats for each record.
+    Parse a timestamp column trying multiple formats.
 
-    Args:
-        timestamp_column (pd.Series): Series with timestamp data to be processed.
+    Each format is parsed over the whole column at once, later formats are only
+    tried on the rows the previous ones could not parse.
 
     Returns:
-        pd.Series: Series with ISO formatted timestamps.
+        Tuple[pd.Series, pd.Series]: UTC timestamps (NaT when unparsed) and
+        the mask of non null rows no format could parse.
     """
     # Define the list of date formats to try
     date_formats = [
@@ -219,19 +344,54 @@ def apply_iso_format(timestamp_column: pd.Series) -> pd.Series:
         "%Y-%d-%m %H:%M:%S",  # Ex: 2025-14-04 22:19:21
     ]
 
-    def parse_date(date_str):
-        for date_format in date_formats:
-            try:
-                return pd.to_datetime(
-                    date_str, format=date_format, utc=True, errors="raise"
-                )
-            except (ValueError, TypeError):
-                continue
-        raise ValueError(
-            f"Error processing date {date_str} in {timestamp_column.name}: Unable to parse date with provided formats"
+    result = pd.to_datetime(
+        pd.Series(pd.NaT, index=timestamp_column.index, name=timestamp_column.name),
+        utc=True,
+    )
+    remaining = timestamp_column.notna() & (timestamp_column.astype(str) != "")
+
+    for date_format in date_formats:
+        if not remaining.any():
+            break
+        parsed = pd.to_datetime(
+            timestamp_column[remaining],
+            format=date_format,
+            utc=True,
+            errors="coerce",
+        )
+        # years like 0123 parse but do not fit the nanosecond timestamps
+        parsed = parsed[parsed.between(MIN_TIMESTAMP, MAX_TIMESTAMP)]
+        result.loc[parsed.index] = parsed
+        remaining.loc[parsed.index] = False
+
+    return result, remaining
+
+
+def apply_iso_format(timestamp_column: pd.Series, errors: str = "raise") -> pd.Series:
+    """
+    Apply ISO format to a timestamp column, trying multiple formats.
+
+    Args:
+        timestamp_column (pd.Series): Series with timestamp data to be processed.
+        errors (str): "raise" to fail on unparseable rows, "coerce" to set them to NaT.
+
+    Returns:
+        pd.Series: Series with ISO formatted timestamps.
+    """
+    result, remaining = parse_iso_formats(timestamp_column)
+
+    if remaining.any():
+        unparseable = timestamp_column[remaining]
+        message = (
+            f"Error processing {len(unparseable)} dates in {timestamp_column.name}: "
+            f"Unable to parse dates with provided formats, first rows: "
+            f"{unparseable.head(5).to_dict()}"
         )
+        if errors == "raise":
+            raise ValueError(message)
+        logger.warning(message)
 
-    return timestamp_column.apply(parse_date)
+    return result
 
 
 def rename_df_columns(df: pd.DataFrame, columns_to_rename: dict):
@@ -263,70 +423,19 @@ def camel_to_snake_case(df):
     return df
 
 
-def fetch_all_pages(
-    mambu_client: APIClient,
-    endpoint: str,
-    request_type: str,
-    extra_params: str = "",
-    limit: int = 1000,
-    body: dict = None,
-):
+def iter_batches(pages: Iterator[list], batch_rows: int) -> Iterator[pd.DataFrame]:
     """
-    Fetch all pages of GL accounts for a specific type using a while loop.
-
-    Args:
-        mambu_client: The client instance used for making API calls.
-        endpoint (str): The API endpoint to query.
-        account_type (str): The type of GL account to fetch (e.g., ASSET, LIABILITY).
-        limit (int): The maximum number of records to fetch per API call.
-
-    Returns:
-        pd.DataFrame: A DataFrame containing all fetched records for the specified account type.
+    Group pages of records into DataFrames of at least batch_rows rows
+    (the last one may be smaller), batch_rows of 0 groups everything at once.
     """
-    offset = 0
-    accumulated_data = []
-    accumulated_count = 0
-
-    while True:
-        # Build the query for the current page
-        query = f"detailsLevel=FULL&limit={limit}&offset={offset}&{extra_params}"
-
-        if request_type == "post":
-            current_page_data = mambu_client.post(
-                endpoint=endpoint,
-                body=body,
-                query=query,
-                clean=True,
-                flatten=True,
-            )
-        else:
-            current_page_data = mambu_client.get(
-                endpoint=endpoint,
-                query=query,
-                clean=True,
-                flatten=True,
-            )
-
-        # Append the current page to the accumulated results
-        if current_page_data:
-            accumulated_data.extend(current_page_data)
-            received_count = len(current_page_data)
-        else:
-            received_count = 0
-
-        accumulated_count += received_count
-        logger.info(
-            f"Received {received_count} record, accumulated {accumulated_count} record."
-        )
-
-        # Break the loop if the number of rows in the current page is less than the limit
-        if received_count < limit:
-            break
-
-        # Increment the offset for the next page
-        offset += limit
-
-    return pd.DataFrame(accumulated_data)
+    batch = []
+    for page in pages:
+        batch.extend(page)
+        if batch_rows and len(batch) >= batch_rows:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
 
 
 def add_meta_columns(df: pd.DataFrame, cdc_field: str):
@@ -347,12 +456,17 @@ def process_dataframe(
     auto_schema: bool,
     table_name: str,
     schemas: dict,
+    schema_store=None,
 ):
     logger.info(f"Processing DataFrame for table: {table_name}")
     df = add_meta_columns(df, cdc_field)
     df = camel_to_snake_case(df)
     df = rename_df_columns(df, rename_columns)
-    table_schema = get_actual_dtypes(df) if auto_schema else schemas[table_name]
+    table_schema = (
+        get_cached_dtypes(df, table_name, schema_store)
+        if auto_schema
+        else schemas[table_name]
+    )
     df = apply_schema(df, table_schema)
     df.dropna(axis=1, how="all", inplace=True)
 
@@ -421,56 +535,100 @@ def get_start_time_from_athena(table_name: str, cdc_field: str):
             raise
 
 
-def create_payload(cdc_field, start_date, end_date):
+def get_watermark(state_store, table_name: str, cdc_field: str) -> Optional[str]:
+    """
+    Returns the latest cdc_field value loaded to the table as a Mambu compatible
+    string, None if no watermark was stored for it yet.
+    """
+    watermark = state_store.get(f"watermarks/{table_name}.json")
+    if not watermark or watermark.get("cdc_column") != camel_to_snake(cdc_field):
+        return None
+    logger.info(f"Latest {watermark['cdc_column']} from watermark: {watermark['value']}")
+    return watermark["value"]
+
+
+def update_watermark(state_store, table_name: str, cdc_field: str, value) -> None:
     """
-    Constructs the payload for Mambu API requests with filtering and sorting.
+    Stores value as the table watermark, unless the stored one is already later.
     """
-    payload = json.dumps(
+    value = pd.Timestamp(value)
+    value = (
+        value.tz_localize(timezone.utc)
+        if value.tzinfo is None
+        else value.tz_convert(timezone.utc)
+    )
+    current_value = get_watermark(state_store, table_name, cdc_field)
+    if current_value is not None and pd.Timestamp(current_value) >= value:
+        logger.info(f"Watermark of {table_name} is already at {current_value}.")
+        return
+
+    state_store.put(
+        f"watermarks/{table_name}.json",
         {
-            "filterCriteria": [
-                {
-                    "field": cdc_field,
-                    "operator": "BETWEEN",
-                    "value": start_date,
-                    "secondValue": end_date,
-                }
-            ],
-            "sortingCriteria": {
-                "field": cdc_field,
-                "order": "ASC",
-            },
-        }
+            "table_name": table_name,
+            "cdc_column": camel_to_snake(cdc_field),
+            "value": value.isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        },
+    )
+    logger.info(f"Watermark of {table_name} moved to {value.isoformat()}.")
+
+
+def to_utc_isoformat(value: str) -> str:
+    """
+    Converts an ISO 8601 date or datetime to UTC, naive values being taken as UTC.
+    """
+    value = datetime.fromisoformat(value)
+    value = (
+        value.replace(tzinfo=timezone.utc)
+        if value.tzinfo is None
+        else value.astimezone(timezone.utc)
     )
-    logger.info(f"Request payload: {payload}")
-    return payload
+    return value.isoformat()
 
 
-def fetch_gl_accounts(client, end_date, extra_params=""):
+def get_start_time(table_name: str, cdc_field: str, state_store=None):
+    """
+    Returns the start time of an incremental run from the table watermark,
+    querying the latest cdc_field value in Athena only when there is none.
+    """
+    if cdc_field and state_store:
+        start_time = get_watermark(state_store, table_name, cdc_field)
+        if start_time:
+            return start_time
+    return get_start_time_from_athena(table_name, cdc_field)
+
+
+def iter_gl_accounts(client, end_date, extra_params="", concurrency=1):
     """
     Special case: Fetches data for GL accounts by account types.
     """
     gl_account_types = ["ASSET", "LIABILITY", "EQUITY", "INCOME", "EXPENSE"]
-    combined_df = pd.DataFrame()
     end_date_obj = datetime.strptime(end_date.split("T")[0], "%Y-%m-%d")
     to_date = (end_date_obj - timedelta(days=1)).strftime("%Y-%m-%d")
 
-    for account_type in gl_account_types:
+    def scan_account_type(account_type):
         params = f"type={account_type}&to={to_date}&" + extra_params
         logger.info(f"Fetching GL account type: {account_type}")
-        account_df = fetch_all_pages(
+        for page in iter_pages(
             client,
             endpoint="glaccounts",
             request_type="get",
             extra_params=params,
-        )
-        combined_df = pd.concat([combined_df, account_df], ignore_index=True)
-
-    # Add meta field mentioning to_date used while extraction
-    combined_df["balance_to_date"] = to_date
-    return combined_df
+            concurrency=concurrency,
+        ):
+            # Add meta field mentioning to_date used while extraction
+            for record in page:
+                record["balance_to_date"] = to_date
+            yield page
+
+    yield from iter_fan_out(
+        [partial(scan_account_type, account_type) for account_type in gl_account_types],
+        concurrency,
+    )
 
 
-def fetch_loan_installments(client, extra_params=""):
+def iter_loan_installments(client, extra_params="", concurrency=1):
     """
     Special case: Fetches data for loan accounts installments by account state types.
     """
@@ -484,9 +642,8 @@ def fetch_loan_installments(client, extra_params=""):
         "CLOSED_WRITTEN_OFF",
         "CLOSED_REJECTED",
     ]
-    combined_df = pd.DataFrame()
 
-    for account_type in account_state_types:
+    def scan_account_state(account_type):
         params = (
             f"dueFrom=2022-01-01&dueTo=2122-01-01&accountState={account_type}&"
             + extra_params
@@ -494,52 +651,146 @@ def fetch_loan_installments(client, extra_params=""):
         logger.info(
             f"Fetching installments for loan account state type: {account_type}"
         )
-        account_df = fetch_all_pages(
+        return iter_pages(
             client,
             endpoint="installments",
             request_type="get",
             extra_params=params,
+            concurrency=concurrency,
         )
-        combined_df = pd.concat([combined_df, account_df], ignore_index=True)
 
-    return combined_df
+    yield from iter_fan_out(
+        [
+            partial(scan_account_state, account_type)
+            for account_type in account_state_types
+        ],
+        concurrency,
+    )
 
 
-def fetch_data_switch(
-    client, endpoint, request_type, extra_params, cdc_field, start_date, end_date
+def iter_data_switch(
+    client,
+    endpoint,
+    request_type,
+    extra_params,
+    cdc_field,
+    start_date,
+    end_date,
+    concurrency=1,
+    window_records=0,
+    pagination="offset",
 ):
     """
-    Fetches data from the Mambu API based on the endpoint and optional filters.
+    Yields pages of records from the Mambu API based on the endpoint and optional filters.
+    With window_records, search requests are split in adaptive time windows of
+    about window_records records, each paged from offset 0.
+    With pagination="keyset", search requests page on the cdc_field instead of
+    the offset (sequentially, concurrency is not used).
     """
     if request_type == "get":
         # Special case for glaccounts
         if endpoint == "glaccounts":
-            return fetch_gl_accounts(client, end_date, extra_params=extra_params)
+            yield from iter_gl_accounts(
+                client, end_date, extra_params=extra_params, concurrency=concurrency
+            )
         # Special case for loan installments
         elif endpoint == "installments":
-            return fetch_loan_installments(client, extra_params=extra_params)
+            yield from iter_loan_installments(
+                client, extra_params=extra_params, concurrency=concurrency
+            )
         else:
-            return fetch_all_pages(
-                client, endpoint=endpoint, request_type="get", extra_params=extra_params
+            yield from iter_pages(
+                client,
+                endpoint=endpoint,
+                request_type="get",
+                extra_params=extra_params,
+                concurrency=concurrency,
             )
 
     elif request_type == "post":
         if not cdc_field:
             raise ValueError("cdc_field is required for Post request.")
-        payload = create_payload(cdc_field, start_date, end_date)
+        if pagination == "keyset" and endpoint == "creditarrangements:search":
+            raise ValueError(
+                f"Keyset pagination requires sorting, not supported by {endpoint}."
+            )
 
-        # Special case for creditarrangements
-        if endpoint == "creditarrangements:search":
-            payload_dict = json.loads(payload)
-            del payload_dict["sortingCriteria"]
-            payload = json.dumps(payload_dict)
+        if window_records:
+            windows = plan_time_windows(
+                client,
+                endpoint,
+                cdc_field,
+                datetime.fromisoformat(start_date),
+                datetime.fromisoformat(end_date),
+                window_records,
+                extra_params,
+            )
+            windows = [
+                (
+                    window_start.isoformat(timespec="milliseconds"),
+                    window_end.isoformat(timespec="milliseconds"),
+                )
+                for window_start, window_end, _ in windows
+            ]
+        else:
+            windows = [(start_date, end_date)]
+
+        for window_start, window_end in windows:
+            if pagination == "keyset":
+                yield from iter_keyset_pages(
+                    client,
+                    endpoint=endpoint,
+                    cdc_field=cdc_field,
+                    start_date=window_start,
+                    end_date=window_end,
+                    extra_params=extra_params,
+                )
+                continue
 
-        return fetch_all_pages(
-            client,
-            endpoint=endpoint,
-            request_type="post",
-            body=payload,
-            extra_params=extra_params,
-        )
+            yield from iter_pages(
+                client,
+                endpoint=endpoint,
+                request_type="post",
+                body=create_endpoint_payload(
+                    endpoint, cdc_field, window_start, window_end
+                ),
+                extra_params=extra_params,
+                concurrency=concurrency,
+            )
     else:
         raise ValueError("request_type is not supported, use get or post.")
+
+
+def fetch_data_switch(
+    client,
+    endpoint,
+    request_type,
+    extra_params,
+    cdc_field,
+    start_date,
+    end_date,
+    concurrency=1,
+    window_records=0,
+    pagination="offset",
+):
+    """
+    Fetches data from the Mambu API based on the endpoint and optional filters.
+    """
+    return pd.DataFrame(
+        [
+            record
+            for page in iter_data_switch(
+                client,
+                endpoint,
+                request_type,
+                extra_params,
+                cdc_field,
+                start_date,
+                end_date,
+                concurrency,
+                window_records,
+                pagination,
+            )
+            for record in page
+        ]
+    )
@@ -1,5 +1,17 @@
 config = {
     "clients_customfields": {
         "clients_customfields": "clients_customfields.sql",
+        # pivoted in Athena with custom_fields.custom_fields_sql
+        "table": "clients",
+        "slots": 4,
+        "columns": ["id", "encoded_key", "creation_date", "last_modified_date"],
+        "custom_field_ids": [
+            "CC_AccNoOrIBAN",
+            "CC_BicOrRoutingCode",
+            "_CC_contactId",
+            "_CC_subAccountId",
+            "Fee_Override",
+            "Override_Expiry_Date",
+        ],
     }
 }
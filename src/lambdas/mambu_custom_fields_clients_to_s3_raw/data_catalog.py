@@ -3,6 +3,7 @@ column_comments = {
         "id": "The id of the loan, can be generated and customized, unique",
         "encoded_key": "The encoded key of the loan account, auto generated, unique",
         "creation_date": "The Date of creation for this wise customfields",
+        "last_modified_date": "The last modified date of the record",
         "Card_originalAmount": "The original amount",
         "Card_originalCurrencyCode": "The original Currency Code",
         "Card_settlementAmount": "Amount used for settlement with payment processor",
@@ -18,6 +19,7 @@ schemas = {
         "id": "string",
         "encoded_key": "string",
         "creation_date": "timestamp",
+        "last_modified_date": "timestamp",
         "_CC_contactId": "string",
         "CC_AccNoOrIBAN": "string",
         "CC_BicOrRoutingCode": "string",
@@ -0,0 +1,58 @@
+import os
+
+import custom_fields
+import lambda_function
+import pandas as pd
+import pytest
+
+import config
+
+TABLE_NAME = next(iter(config.config))
+FIELD_ID = config.config[TABLE_NAME]["custom_field_ids"][0]
+LAMBDA_DIR = os.path.dirname(os.path.abspath(lambda_function.__file__))
+
+
+@pytest.fixture
+def data_lake(monkeypatch, tmp_path):
+    """
+    Replaces the Athena reads and the data lake writes of the custom fields
+    """
+    lake = {"sql": [], "written": {}}
+    monkeypatch.chdir(LAMBDA_DIR)
+    monkeypatch.setenv("STATE_STORE_PATH", str(tmp_path))
+
+    def read_athena(sql, database):
+        lake["sql"].append(sql)
+        return pd.DataFrame(
+            {
+                "id": ["1"],
+                "encoded_key": ["a"],
+                "creation_date": pd.to_datetime(["2024-01-01"]),
+                "last_modified_date": pd.to_datetime(["2024-01-02"]),
+                "custom_fields_0_id": [FIELD_ID],
+                "custom_fields_0_value": ["value"],
+                FIELD_ID.lower(): ["value"],
+            }
+        )
+
+    def write_to_data_lake(df, table_name, dtype, columns_comments):
+        lake["written"][table_name] = df
+        return True
+
+    monkeypatch.setattr(custom_fields, "read_athena", read_athena)
+    monkeypatch.setattr(custom_fields, "write_to_data_lake", write_to_data_lake)
+    monkeypatch.setattr(custom_fields, "read_snapshot", lambda table_name: None)
+    return lake
+
+
+
+@pytest.mark.parametrize("mode", ["full", "incremental"])
+@pytest.mark.parametrize("pivot", ["athena", "pandas"])
+def test_lambda_handler_without_watermark(data_lake, monkeypatch, mode, pivot):
+    monkeypatch.setenv("CUSTOM_FIELDS_MODE", mode)
+    monkeypatch.setenv("CUSTOM_FIELDS_PIVOT", pivot)
+
+    assert lambda_function.lambda_handler({}, None)
+
+    assert "last_modified_date >" not in data_lake["sql"][0]
+    assert data_lake["written"][TABLE_NAME][FIELD_ID].tolist() == ["value"]
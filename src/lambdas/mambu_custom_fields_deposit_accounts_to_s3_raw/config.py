@@ -1,5 +1,20 @@
 config = {
     "deposit_accounts_customfields": {
         "deposit_accounts_customfields": "deposit_accounts_customfields.sql",
+        # pivoted in Athena with custom_fields.custom_fields_sql
+        "table": "deposit_accounts",
+        "slots": 4,
+        "columns": ["id", "encoded_key", "creation_date", "last_modified_date"],
+        "custom_field_ids": [
+            "CBS_accountNumber",
+            "CBS_assignedDepositUser",
+            "CBS_ibanDeposit",
+            "CBS_mandatesDetails",
+            "CBS_sortCode",
+            "CBS_virtualAccountId",
+            "FTD_CLOSING_BALANCE",
+            "FTD_CLOSING_PROFIT",
+            "term_id",
+        ],
     }
 }
@@ -3,6 +3,7 @@ column_comments = {
         "id": "The id of the loan, can be generated and customized, unique",
         "encoded_key": "The encoded key of the loan account, auto generated, unique",
         "creation_date": "The Date of creation for this wise customfields",
+        "last_modified_date": "The last modified date of the record",
         "CBS_accountNumber": "The clear bank set account number",
         "CBS_assignedDepositUser": "The clear bank set assigned deposit user",
         "CBS_ibanDeposit": "The clear bank set IBAN Deposit",
@@ -20,6 +21,7 @@ schemas = {
         "id": "string",
         "encoded_key": "string",
         "creation_date": "timestamp",
+        "last_modified_date": "timestamp",
         "CBS_accountNumber": "string",
         "CBS_assignedDepositUser": "string",
         "CBS_ibanDeposit": "string",
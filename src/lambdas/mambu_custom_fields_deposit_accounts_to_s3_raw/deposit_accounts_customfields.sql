@@ -3,6 +3,7 @@
 SELECT id
     ,encoded_key
     ,creation_date
+    ,last_modified_date
     ,custom_fields_0_id
     ,custom_fields_0_value
     ,custom_fields_1_id
@@ -7,18 +7,44 @@ import sys
 import time
 from datetime import date
 from datetime import datetime
+from datetime import timezone
 
 import awswrangler as wr
 import boto3
 import data_catalog
 import pandas as pd
-from flatten_json import flatten
+from jsonl_reader import iter_jsonl_chunks
+from mambu_extractor import extract_stream
+from mambu_extractor import get_mambu_client
 from selective_copy import selective_copy
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 sys.path.append(os.path.abspath("../"))
 
+SELECTED_COLUMNS = [
+    "id",
+    "encoded_key",
+    "custom_fields_0_id",
+    "custom_fields_0_field_set_id",
+    "custom_fields_0_value",
+    "custom_fields_1_field_set_id",
+    "custom_fields_1_id",
+    "custom_fields_1_value",
+    "custom_fields_2_field_set_id",
+    "custom_fields_2_id",
+    "custom_fields_2_value",
+    "custom_fields_3_field_set_id",
+    "custom_fields_3_id",
+    "custom_fields_3_value",
+    "custom_fields_4_field_set_id",
+    "custom_fields_4_id",
+    "custom_fields_4_value",
+]
+
+# Columns read from the Singer output, to filter and select the custom fields
+READ_COLUMNS = ["transaction_details_transaction_channel_id"] + SELECTED_COLUMNS
+
 
 def get_secret(secret_name):
     """
@@ -126,77 +152,60 @@ def parse(mambudb_streams):
             # Check if file exists
             mambu_file = glob.glob("{0}*.jsonl".format(mambudb_stream))
 
-            # Parse file that was produced with Singer (tap-mambu and target-jsonl)
+            # Parse file that was produced with Singer (tap-mambu and target-jsonl),
+            # chunks are filtered as they are read so only the selection is kept
             if len(mambu_file) > 0:
-                filename = mambu_file[0]
-                data = []
-                with open(filename) as f:
-                    for line in f:
-                        data.append(flatten(json.loads(line)))
-
-                # fix issue that data wrangler cannot write empty dicts or lists to parquet in S3
-                for i, item in enumerate(data):
-                    for col in item:
-                        if data[i][col] in [{}, []]:
-                            data[i][col] = ""
-
-                # create pandas dataframe
-                input_df = pd.DataFrame(data)
-                # Define static vars
-                input_df["date"] = date.today().strftime("%Y%m%d")
-                input_df["timestamp_extracted"] = datetime.utcnow()
-
-        input_df_filtered = input_df.loc[
-            (
-                (
-                    input_df.transaction_details_transaction_channel_id
-                    == "Wise_Local_Payments"
-                )
-                | (
-                    input_df.transaction_details_transaction_channel_id.str.startswith(
-                        "Card_", na=False
-                    )
-                )
-                | (
-                    input_df.transaction_details_transaction_channel_id
-                    == "Paymentology-FastLite"
+                input_df = pd.concat(
+                    [
+                        select_custom_fields(chunk)
+                        for chunk in iter_jsonl_chunks(
+                            mambu_file[0], columns=READ_COLUMNS
+                        )
+                    ],
+                    ignore_index=True,
                 )
-            )
-            & (input_df.custom_fields_0_id.str.len() > 0)
-        ]
 
-        input_df_selection = input_df_filtered[
-            [
-                "id",
-                "encoded_key",
-                "custom_fields_0_id",
-                "custom_fields_0_field_set_id",
-                "custom_fields_0_value",
-                "custom_fields_1_field_set_id",
-                "custom_fields_1_id",
-                "custom_fields_1_value",
-                "custom_fields_2_field_set_id",
-                "custom_fields_2_id",
-                "custom_fields_2_value",
-                "custom_fields_3_field_set_id",
-                "custom_fields_3_id",
-                "custom_fields_3_value",
-                "custom_fields_4_field_set_id",
-                "custom_fields_4_id",
-                "custom_fields_4_value",
-                "date",
-                "timestamp_extracted",
-            ]
-        ]
-        print("Pandas DF shape:  %s", input_df_selection.shape)
-
-        return input_df_selection, mambu_streams_status
+        # Define static vars
+        input_df["date"] = date.today().strftime("%Y%m%d")
+        input_df["timestamp_extracted"] = datetime.utcnow()
+        print("Pandas DF shape:  %s", input_df.shape)
+
+        return input_df, mambu_streams_status
     except Exception as e:
         logger.error("Pandas DF:  %s", input_df)
         logger.error("Exception occurred in parse:  %s", e)
         return e
 
 
+def select_custom_fields(input_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep the Wise and card transactions with custom fields,
+    and select their custom field columns
+    :param input_df: The flattened deposit transactions
+    :return: The filtered and selected dataframe
+    """
+    input_df_filtered = input_df.loc[
+        (
+            (
+                input_df.transaction_details_transaction_channel_id
+                == "Wise_Local_Payments"
+            )
+            | (
+                input_df.transaction_details_transaction_channel_id.str.startswith(
+                    "Card_", na=False
+                )
+            )
+            | (
+                input_df.transaction_details_transaction_channel_id
+                == "Paymentology-FastLite"
+            )
+        )
+        & (input_df.custom_fields_0_id.str.len() > 0)
+    ]
+
+    return input_df_filtered[SELECTED_COLUMNS].copy()
+
+
 def generate_tap_config(filepath):
     """
     Creates a JSON file which acts as input to tap mambu commands
@@ -225,7 +234,43 @@ def generate_tap_config(filepath):
         return False
 
 
+def extract_mambu(mambudb_streams):
+    """
+    Extract the streams in process with the Mambu API client,
+    same window as the Singer tap config
+    :param mambudb_streams: A dict of mambu streams info
+    :return: The filtered and selected dataframe
+    """
+    mambu_client = get_mambu_client(get_secret(os.environ.get("MAMBU_PASSWORD_NAME")))
+    input_df = pd.DataFrame()
+    for mambudb_stream in mambudb_streams.keys():
+        logger.info("Extracting Mambu Stream:  %s", mambudb_stream)
+        input_df = pd.concat(
+            [
+                select_custom_fields(chunk)
+                for chunk in extract_stream(
+                    mambu_client,
+                    mambudb_stream,
+                    datetime(2021, 1, 1, tzinfo=timezone.utc),
+                    columns=READ_COLUMNS,
+                )
+            ],
+            ignore_index=True,
+        )
+
+    # Define static vars
+    input_df["date"] = date.today().strftime("%Y%m%d")
+    input_df["timestamp_extracted"] = datetime.utcnow()
+    return input_df
+
+
 def get_mambu(mambudb_streams):
+    if os.environ.get("MAMBU_EXTRACTOR", "api") != "singer":
+        print("extracting mambu data...")
+        df = extract_mambu(mambudb_streams)
+        print("Extraction finished successfully!")
+        return df
+
     print("generating state...")
     state = {"bookmarks": {"clients": "2020-01-01T00:00:00Z"}}
     mambu_statefile = "state.json"
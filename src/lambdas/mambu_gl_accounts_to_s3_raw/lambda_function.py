@@ -4,16 +4,23 @@ import logging
 import os
 import subprocess
 import time
+import uuid
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
+from itertools import chain
 from typing import Dict
 
 import awswrangler as wr
 import boto3
 import data_catalog
 import pandas as pd
-from flatten_json import flatten
+from athena_reader import invalidate_tables
+from athena_reader import read_athena
+from jsonl_reader import iter_jsonl_chunks
+from mambu_extractor import extract_stream
+from mambu_extractor import get_mambu_client
 from selective_copy import selective_copy
 
 logger = logging.getLogger()
@@ -188,14 +195,15 @@ def cleanup_dir(dir):
         return e
 
 
-def write_to_s3(mambudb_streams, input_df, mambudb_stream):
+def write_to_s3(mambudb_streams, input_df, mambudb_stream, staging_path):
     """
-    Writes mambu data to the data lake
+    Stages a chunk of mambu data under the staging path of the run, outside
+    the catalog, see swap_staged
     :param mambudb_streams: A dict of mambu streams info
     :param input_df: the data in the form of a pandas dataframe
-    :param path: The s3 path to write to
     :param mambudb_stream: The mambu stream for this iteration
-    :return: The result of the specified action.
+    :param staging_path: The s3 path to stage to
+    :return: The staged files, partitions and athena types of the chunk
     """
     logger.info("Processing Mambu Stream for an Athena write:  %s", mambudb_stream)
 
@@ -210,32 +218,74 @@ def write_to_s3(mambudb_streams, input_df, mambudb_stream):
             input_df[col] = pd.to_datetime(
                 input_df[col], format="%Y-%m-%dT%H:%M:%S.%fZ"
             )
-    # custom_field_sets is a metadata table
-    if mambudb_stream == "gl_accounts":
-        path = "s3://" + os.environ["S3_RAW"] + "/" + mambudb_stream + "/"
-        logger.info("Uploading to S3 location:  %s", path)
-        res = wr.s3.to_parquet(
-            df=input_df,
-            path=path,
-            index=False,
-            dataset=True,
-            database="datalake_raw",
-            table=mambudb_stream,
-            mode="overwrite_partitions",
-            schema_evolution=True,
-            compression="snappy",
-            partition_cols=mambudb_streams[mambudb_stream],
-            dtype=data_catalog.schemas[mambudb_stream],
-            glue_table_settings=wr.typing.GlueTableSettings(
-                columns_comments=data_catalog.column_comments[mambudb_stream]
-            ),
-        )
 
-    logger.info("Write to Athena complete!")
+    logger.info("Staging to S3 location:  %s", staging_path)
+    res = wr.s3.to_parquet(
+        df=input_df,
+        path=staging_path,
+        index=False,
+        dataset=True,
+        mode="append",
+        compression="snappy",
+        partition_cols=mambudb_streams[mambudb_stream],
+        dtype=data_catalog.schemas[mambudb_stream],
+    )
+    res["columns_types"], res["partitions_types"] = wr.catalog.extract_athena_types(
+        df=input_df,
+        index=False,
+        partition_cols=mambudb_streams[mambudb_stream],
+        dtype=data_catalog.schemas[mambudb_stream],
+    )
+    logger.info("Staging complete!")
 
     return res
 
 
+def swap_staged(mambudb_stream, staged_chunks, staging_path):
+    """
+    Replaces the partitions written by the staged chunks of a run with them,
+    then registers the columns and partitions in the catalog
+    :param staged_chunks: The results of write_to_s3
+    """
+    path = "s3://" + os.environ["S3_RAW"] + "/" + mambudb_stream + "/"
+    columns_types = {}
+    partitions_types = {}
+    partitions_values = {}
+    for staged_chunk in staged_chunks:
+        columns_types.update(staged_chunk["columns_types"])
+        partitions_types.update(staged_chunk["partitions_types"])
+        for location, values in staged_chunk["partitions_values"].items():
+            partitions_values[location.replace(staging_path, path, 1)] = values
+
+    logger.info("Replacing %s partitions at:  %s", len(partitions_values), path)
+    for location in partitions_values:
+        wr.s3.delete_objects(location)
+    wr.s3.copy_objects(
+        paths=[file for staged_chunk in staged_chunks for file in staged_chunk["paths"]],
+        source_path=staging_path,
+        target_path=path,
+    )
+    wr.catalog.create_parquet_table(
+        database="datalake_raw",
+        table=mambudb_stream,
+        path=path,
+        columns_types=columns_types,
+        partitions_types=partitions_types,
+        compression="snappy",
+        columns_comments=data_catalog.column_comments[mambudb_stream],
+        mode="append",
+    )
+    wr.catalog.add_parquet_partitions(
+        database="datalake_raw",
+        table=mambudb_stream,
+        partitions_values=partitions_values,
+        compression="snappy",
+        columns_types=columns_types,
+    )
+    invalidate_tables([mambudb_stream])
+    logger.info("Write to Athena complete!")
+
+
 def get_athena_df(sql_file):
     """
     Retrieve a dataset from athena based on input SQL file
@@ -245,12 +295,7 @@ def get_athena_df(sql_file):
 
     logger.info("Reading data from Athena...")
     try:
-        athena_df = wr.athena.read_sql_query(
-            sql=sql,
-            database="datalake_raw",
-            workgroup="datalake_workgroup",
-            ctas_approach=False,
-        )
+        athena_df = read_athena(sql)
     except Exception as e:
         logger.error("Exception occurred:  %s", e)
         return False
@@ -286,6 +331,94 @@ def fix_for_users(input_df: pd.DataFrame):
     return input_df
 
 
+def write_stream_df(
+    mambudb_streams: Dict,
+    input_df: pd.DataFrame,
+    mambudb_stream,
+    staging_path,
+):
+    """
+    Add static columns to the records of a stream and stage them
+    :return: The staged chunk, see write_to_s3, or False
+    """
+    logger.info("Pandas DF shape:  %s", input_df.shape)
+
+    # Define static vars
+    input_df["date"] = date.today().strftime("%Y%m%d")
+    input_df["timestamp_extracted"] = datetime.utcnow()
+
+    try:
+        return write_to_s3(mambudb_streams, input_df, mambudb_stream, staging_path)
+    except Exception as e:
+        logger.error("Pandas DF:  %s", input_df)
+        logger.error("Exception occurred:  %s", e)
+        return False
+
+
+def write_stream_chunks(mambudb_streams: Dict, chunks, mambudb_stream) -> bool:
+    """
+    Stages the chunks of a stream, then swaps them in for today's partition
+    once all of them are written, so a failed chunk leaves the table untouched
+    and the state is not moved
+    :param chunks: An iterator of DataFrames
+    :return: Whether the write succeeded
+    """
+    staging_path = (
+        "s3://"
+        + os.environ["S3_RAW"]
+        + f"/_staging/{mambudb_stream}/{uuid.uuid4().hex}/"
+    )
+    staged_chunks = []
+    try:
+        for input_df in chunks:
+            staged_chunk = write_stream_df(
+                mambudb_streams, input_df, mambudb_stream, staging_path
+            )
+            if staged_chunk is False:
+                return False
+            staged_chunks.append(staged_chunk)
+
+        swap_staged(mambudb_stream, staged_chunks, staging_path)
+        logger.info("Upload to Athena complete.")
+        return True
+    except Exception as e:
+        logger.error("Exception occurred:  %s", e)
+        return False
+    finally:
+        if staged_chunks:
+            wr.s3.delete_objects(staging_path)
+
+
+def extract_write_to_athena(mambudb_streams: Dict):
+    """
+    Extract each selected stream in process with the Mambu API client,
+    same window as the Singer state, and write to athena/glue
+    :param mambudb_streams: A dict of mambu streams info
+    :return: The result of the specified action.
+    """
+    mambu_streams_status = dict.fromkeys(mambudb_streams.keys(), None)
+    mambu_client = get_mambu_client(get_secret(os.environ["MAMBU_PASSWORD_NAME"]))
+
+    for mambudb_stream in mambudb_streams.keys():
+        logger.info("Processing Mambu Stream:  %s", mambudb_stream)
+        chunks = extract_stream(
+            mambu_client, mambudb_stream, datetime(2020, 1, 1, tzinfo=timezone.utc)
+        )
+        input_df = next(chunks)
+        if input_df.empty:
+            logger.info(
+                "Mambu did not return any new data, continuing to the next configured stream"
+            )
+            mambu_streams_status[mambudb_stream] = False
+            continue
+
+        mambu_streams_status[mambudb_stream] = write_stream_chunks(
+            mambudb_streams, chain([input_df], chunks), mambudb_stream
+        )
+
+    return mambu_streams_status
+
+
 def parse_write_to_athena(mambudb_streams: Dict):
     """
     Create a loop for each selected stream,
@@ -294,7 +427,6 @@ def parse_write_to_athena(mambudb_streams: Dict):
     :return: The result of the specified action.
     """
     mambu_streams_status = dict.fromkeys(mambudb_streams.keys(), None)
-    input_df = pd.DataFrame()
 
     for mambudb_stream in mambudb_streams.keys():
         logger.info("Processing Mambu Stream:  %s", mambudb_stream)
@@ -303,36 +435,11 @@ def parse_write_to_athena(mambudb_streams: Dict):
         mambu_file = glob.glob("{0}*.jsonl".format(mambudb_stream))
         # Parse file that was produced with Singer (tap-mambu and target-jsonl)
         if len(mambu_file) > 0:
-            filename = mambu_file[0]
-            data = []
-            with open(filename) as f:
-                for line in f:
-                    data.append(flatten(json.loads(line)))
-
-            # fix issue that data wrangler cannot write empty dicts or lists to parquet in S3
-            for i, item in enumerate(data):
-                for col in item:
-                    if data[i][col] in [{}, []]:
-                        data[i][col] = ""
-
-            # create pandas dataframe
-            input_df = pd.DataFrame(data)
-            logger.info("Pandas DF shape:  %s", input_df.shape)
-
-            # Define static vars
-            input_df["date"] = date.today().strftime("%Y%m%d")
-            input_df["timestamp_extracted"] = datetime.utcnow()
-
-            try:
-                # Write to S3 Raw, also creates Glue catalog entry and updates Athena table
-                res = write_to_s3(mambudb_streams, input_df, mambudb_stream)
-                logger.info("Result:  %s", res)
-                logger.info("Upload to Athena complete.")
-                mambu_streams_status[mambudb_stream] = True
-            except Exception as e:
-                logger.error("Pandas DF:  %s", input_df)
-                logger.error("Exception occurred:  %s", e)
-                mambu_streams_status[mambudb_stream] = False
+            # parsed and staged in bounded chunks, today's partition is only
+            # replaced once every chunk is written
+            mambu_streams_status[mambudb_stream] = write_stream_chunks(
+                mambudb_streams, iter_jsonl_chunks(mambu_file[0]), mambudb_stream
+            )
         else:
             logger.info(
                 "Singer did not return any new data, continuing to the next configured stream"
@@ -419,6 +526,16 @@ def lambda_handler(event, context):
     # Name of mambudb stream and the partition cols for each stream in Athena
     mambudb_streams = {"gl_accounts": ["date"]}
 
+    if os.environ.get("MAMBU_EXTRACTOR", "api") != "singer":
+        # In-process extraction, no Singer state or /tmp files involved
+        mambu_streams_status = extract_write_to_athena(mambudb_streams)
+        logger.info("Mambu streams status:  %s", mambu_streams_status)
+        end = time.time()
+        logger.info(
+            f"Total minutes taken for this Lambda to run: {float((end - begin)/60):.2f}"
+        )
+        return True
+
     # Prep steps
     mambu_statefile = "state.json"
     s3 = boto3.client("s3")
@@ -0,0 +1,16 @@
+SELECT DISTINCT id
+FROM "datalake_raw"."loan_accounts"
+WHERE last_modified_date > TIMESTAMP '{loan_accounts_last_modified_date_from}'
+    AND last_modified_date <= TIMESTAMP '{loan_accounts_last_modified_date_to}'
+    AND {loan_accounts_last_modified_date_partitions}
+UNION
+SELECT DISTINCT la.id
+FROM "datalake_raw"."loan_accounts" la
+JOIN (
+    SELECT parent_account_key, creation_date
+    FROM "datalake_raw"."loan_transactions"
+    WHERE {loan_transactions_creation_date_partitions}
+) lt
+    ON lt.parent_account_key = la.encoded_key
+WHERE lt.creation_date > TIMESTAMP '{loan_transactions_creation_date_from}'
+    AND lt.creation_date <= TIMESTAMP '{loan_transactions_creation_date_to}'
@@ -73,3 +73,13 @@ schemas = {
         "fee_details": "string",
     },
 }
+
+# Same installments, hash-bucketed by loan_account_id instead of one partition per loan
+column_comments["loan_accounts_installments_bucketed"] = {
+    **column_comments["loan_accounts_installments"],
+    "bucket": "Hash bucket of the loan account, see installments/bucket_index.json",
+}
+schemas["loan_accounts_installments_bucketed"] = {
+    **schemas["loan_accounts_installments"],
+    "bucket": "int",
+}
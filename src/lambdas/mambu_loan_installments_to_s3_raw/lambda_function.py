@@ -1,7 +1,10 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import awswrangler as wr
@@ -9,12 +12,28 @@ import boto3
 import data_catalog
 import pandas as pd
 import requests
+from async_api_client import APIResponseError
+from async_api_client import AsyncAPIClient
+from athena_reader import invalidate_tables
+from athena_reader import partition_predicate
+from athena_reader import read_athena
 from flatten_json import flatten
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from state_store import get_state_store
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+INSTALLMENTS_WATERMARK_KEY = "watermarks/loan_accounts_installments.json"
+INSTALLMENTS_BUCKET_INDEX_KEY = "installments/bucket_index.json"
+# Columns of the installments watermark, see loan_accounts_watermark.sql
+WATERMARK_COLUMNS = (
+    "loan_accounts_last_modified_date",
+    "loan_transactions_creation_date",
+)
+
 
 def camel_to_snake(column_name):
     """
@@ -25,16 +44,10 @@ def camel_to_snake(column_name):
     )
 
 
-def write_to_data_lake(input_df, table_name):
+def fix_timestamp_columns(input_df, table_name):
     """
-    Writes mambu data to the data lake
-    :param input_df: the data in the form of a pandas dataframe
-    :param mambudb_stream: The mambu stream for this iteration
-    :return: The result of the specified action.
+    Fix for timestamp format coming from Mambu
     """
-    logger.info("Processing Mambu Stream for an Athena write:  %s", table_name)
-
-    # fix for timestamp format coming from Mambu
     timestamp_cols = {
         k: v
         for (k, v) in data_catalog.schemas[table_name].items()
@@ -47,6 +60,110 @@ def write_to_data_lake(input_df, table_name):
             # input_df[col], format="%Y-%m-%dT%H:%M:%S", utc=True
             # )
             input_df[col] = pd.to_datetime(input_df[col], format="ISO8601", utc=True)
+    return input_df
+
+
+def get_bucket(loan_account_id, bucket_count: int) -> int:
+    """
+    Stable hash bucket of a loan account id, the same across runs and processes
+    """
+    digest = hashlib.md5(str(loan_account_id).encode("utf-8")).hexdigest()
+    return int(digest, 16) % bucket_count
+
+
+def assign_buckets(state_store, loan_account_ids, bucket_count: int) -> dict:
+    """
+    Returns the bucket of each loan account id from the persisted index,
+    hashing and storing the ids it does not know yet. Loans keep their bucket
+    when bucket_count changes.
+    """
+    index = state_store.get(INSTALLMENTS_BUCKET_INDEX_KEY) or {"buckets": {}}
+    buckets = index["buckets"]
+    new_ids = [
+        str(loan_account_id)
+        for loan_account_id in loan_account_ids
+        if str(loan_account_id) not in buckets
+    ]
+    if new_ids:
+        buckets.update(
+            {
+                loan_account_id: get_bucket(loan_account_id, bucket_count)
+                for loan_account_id in new_ids
+            }
+        )
+        index["bucket_count"] = bucket_count
+        state_store.put(INSTALLMENTS_BUCKET_INDEX_KEY, index)
+        logger.info("Assigned buckets to %s new loan accounts.", len(new_ids))
+    return buckets
+
+
+def write_bucketed_to_data_lake(input_df, table_name, buckets: dict):
+    """
+    Writes installments to the data lake with one partition per hash bucket.
+    Only the buckets of the loans in input_df are rewritten, keeping the rows
+    of the other loans already stored in them.
+    :param buckets: loan account id to bucket index
+    :return: The result of the specified action.
+    """
+    logger.info("Processing Mambu Stream for an Athena write:  %s", table_name)
+    input_df = fix_timestamp_columns(input_df, table_name)
+    input_df["bucket"] = input_df["loan_account_id"].astype(str).map(buckets)
+    changed_buckets = set(input_df["bucket"].unique().tolist())
+
+    path = "s3://" + os.environ["S3_RAW"] + "/" + table_name + "/"
+    logger.info(
+        "Rewriting %s buckets at S3 location:  %s", len(changed_buckets), path
+    )
+    try:
+        try:
+            existing_df = wr.s3.read_parquet(
+                path=path,
+                dataset=True,
+                partition_filter=lambda partition: int(partition["bucket"])
+                in changed_buckets,
+            )
+            existing_df["bucket"] = existing_df["bucket"].astype(int)
+            existing_df = existing_df[
+                ~existing_df["loan_account_id"].isin(input_df["loan_account_id"])
+            ]
+            input_df = pd.concat([existing_df, input_df], ignore_index=True)
+        except wr.exceptions.NoFilesFound:
+            logger.info("No existing files in the changed buckets.")
+
+        res = wr.s3.to_parquet(
+            df=input_df,
+            path=path,
+            index=False,
+            dataset=True,
+            database="datalake_raw",
+            table=table_name,
+            mode="overwrite_partitions",
+            schema_evolution=True,
+            compression="snappy",
+            partition_cols=["bucket"],
+            dtype=data_catalog.schemas[table_name],
+            glue_table_settings=wr.typing.GlueTableSettings(
+                columns_comments=data_catalog.column_comments[table_name]
+            ),
+        )
+        invalidate_tables([table_name])
+        logger.info("Write to Athena complete!")
+
+        return res
+    except Exception as e:
+        logger.error("Exception occurred:  %s", e)
+        return False
+
+
+def write_to_data_lake(input_df, table_name):
+    """
+    Writes mambu data to the data lake
+    :param input_df: the data in the form of a pandas dataframe
+    :param mambudb_stream: The mambu stream for this iteration
+    :return: The result of the specified action.
+    """
+    logger.info("Processing Mambu Stream for an Athena write:  %s", table_name)
+    input_df = fix_timestamp_columns(input_df, table_name)
 
     path = "s3://" + os.environ["S3_RAW"] + "/" + table_name + "/"
     logger.info("Uploading to S3 location:  %s", path)
@@ -67,6 +184,7 @@ def write_to_data_lake(input_df, table_name):
                 columns_comments=data_catalog.column_comments[table_name]
             ),
         )
+        invalidate_tables([table_name])
         logger.info("Write to Athena complete!")
 
         return res
@@ -75,21 +193,19 @@ def write_to_data_lake(input_df, table_name):
         return False
 
 
-def get_athena_df(sql_file: str):
+def get_athena_df(sql_file: str, **sql_params):
     """
-    Retrieve a dataset from athena based on input SQL file
+    Retrieve a dataset from athena based on input SQL file,
+    formatted with sql_params when given
     """
     logger.info(f"Executing {sql_file} ....")
     sql = sql_file.read()
+    if sql_params:
+        sql = sql.format(**sql_params)
 
     logger.info("Reading data from Athena...")
     try:
-        athena_df = wr.athena.read_sql_query(
-            sql=sql,
-            database="datalake_raw",
-            workgroup="datalake_workgroup",
-            ctas_approach=False,
-        )
+        athena_df = read_athena(sql)
     except Exception as e:
         logger.error("Exception occurred:  %s", e)
         return False
@@ -133,50 +249,219 @@ def get_installments_df(installments_data):
     return df
 
 
-def get_installments_from_mambu(loan_account_ids_df):
+def get_loan_account_ids(state_store, full_refresh: bool = False):
     """
-    Store all installments in a pandas dataframe
+    Loan account ids to refresh: all of them on a full refresh or without a
+    watermark, else only loans modified or with new transactions since the
+    last successful run, plus the ones that failed in it. With a watermark,
+    only the date partitions extracted since it are scanned.
+    :return: (loan account ids df, watermark to store after a successful run)
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/vnd.mambu.v2+json",
+    watermark = None if full_refresh else state_store.get(INSTALLMENTS_WATERMARK_KEY)
+    if watermark and any(
+        str(watermark.get(column)) in ("None", "NaT") for column in WATERMARK_COLUMNS
+    ):
+        watermark = None
+    partitions = {
+        f"{column}_partitions": (
+            partition_predicate(watermark[column]) if watermark else "TRUE"
+        )
+        for column in WATERMARK_COLUMNS
     }
+
+    watermark_df = get_athena_df(open("loan_accounts_watermark.sql", "r"), **partitions)
+    if watermark_df is False:
+        raise RuntimeError("Failed to read the loan accounts watermark from Athena.")
+    # No row in the scanned partitions keeps the previous watermark
+    new_watermark = {
+        column: (
+            str(watermark_df[column].iloc[0])
+            if pd.notna(watermark_df[column].iloc[0]) or not watermark
+            else watermark[column]
+        )
+        for column in WATERMARK_COLUMNS
+    }
+
+    if not watermark:
+        logger.info("Full refresh of all loan accounts.")
+        loan_account_ids_df = get_athena_df(open("loan_account_ids.sql", "r"))
+    else:
+        logger.info("Incremental refresh since %s.", watermark)
+        loan_account_ids_df = get_athena_df(
+            open("changed_loan_account_ids.sql", "r"),
+            **partitions,
+            **{f"{column}_from": watermark[column] for column in new_watermark},
+            **{f"{column}_to": value for column, value in new_watermark.items()},
+        )
+        if loan_account_ids_df is not False:
+            retry_ids = watermark.get("failed_loan_account_ids", [])
+            loan_account_ids = loan_account_ids_df["id"].tolist() + retry_ids
+            loan_account_ids_df = pd.DataFrame(
+                {"id": list(dict.fromkeys(loan_account_ids))}
+            )
+
+    if loan_account_ids_df is False:
+        raise RuntimeError("Failed to read loan account ids from Athena.")
+    return loan_account_ids_df, new_watermark
+
+
+def get_mambu_session(max_workers: int):
+    """
+    Session with a connection pool sized for max_workers threads, retrying
+    throttled and failed requests with exponential backoff.
+    """
+    retry = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_workers, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.headers.update(
+        {
+            "Content-Type": "application/json",
+            "Accept": "application/vnd.mambu.v2+json",
+        }
+    )
+    session.auth = HTTPBasicAuth(
+        os.environ["MAMBU_USERNAME"],
+        get_secret(os.environ["MAMBU_PASSWORD_NAME"]),
+    )
+    return session
+
+
+def get_loan_account_installments(session, loan_account_id, timeout: float = 60):
+    """
+    Fetch the schedule of a loan account, giving up on the request after
+    timeout seconds.
+    :return: (installments df, None) or (None, failure reason)
+    """
+    response = {}
+    try:
+        res = session.get(
+            "https://{0}.mambu.com/api/loans/{1}/schedule?detailsLevel=FULL".format(
+                os.environ["MAMBU_SUBDOMAIN"], loan_account_id
+            ),
+            timeout=timeout,
+        )
+        response = res.json()
+        loan_account_installments_df = get_installments_df(response["installments"])
+    except Exception as e:
+        errors = response.get("errors", []) if isinstance(response, dict) else []
+        reasons = [error.get("errorReason", str(error)) for error in errors]
+        return None, ", ".join(reasons) if reasons else repr(e)
+
+    loan_account_installments_df["loan_account_id"] = loan_account_id
+    loan_account_installments_df["timestamp_extracted"] = datetime.utcnow()
+    return loan_account_installments_df, None
+
+
+async def get_loan_account_installments_async(client, loan_account_id):
+    """
+    Fetch the schedule of a loan account with the AsyncAPIClient.
+    :return: (installments df, None) or (None, failure reason)
+    """
+    try:
+        response = await client.get(
+            f"loans/{loan_account_id}/schedule", query="detailsLevel=FULL"
+        )
+        loan_account_installments_df = get_installments_df(response["installments"])
+    except APIResponseError as e:
+        errors = e.body.get("errors", []) if isinstance(e.body, dict) else []
+        reasons = [error.get("errorReason", str(error)) for error in errors]
+        return None, ", ".join(reasons) if reasons else repr(e)
+    except Exception as e:
+        return None, repr(e)
+
+    loan_account_installments_df["loan_account_id"] = loan_account_id
+    loan_account_installments_df["timestamp_extracted"] = datetime.utcnow()
+    return loan_account_installments_df, None
+
+
+async def fetch_installments_async(
+    loan_accounts_ids, max_in_flight: int, timeout: float = 60
+):
+    """
+    Fetch the schedules of loan_accounts_ids with up to max_in_flight requests
+    in flight on one event loop, each request timing out after timeout seconds.
+    :return: (installments df, failure reason) per loan account, in order
+    """
+    async with AsyncAPIClient(
+        auth={
+            "username": os.environ["MAMBU_USERNAME"],
+            "password": get_secret(os.environ["MAMBU_PASSWORD_NAME"]),
+        },
+        base_url=f"https://{os.environ['MAMBU_SUBDOMAIN']}.mambu.com/api/",
+        max_in_flight=max_in_flight,
+        timeout=timeout,
+    ) as client:
+        return await asyncio.gather(
+            *(
+                get_loan_account_installments_async(client, loan_account_id)
+                for loan_account_id in loan_accounts_ids
+            )
+        )
+
+
+def get_installments_from_mambu(loan_account_ids_df, max_workers: int = 16):
+    """
+    Store all installments in a pandas dataframe, fetching up to max_workers
+    loan account schedules concurrently: on a thread pool, or on an event loop
+    with the AsyncAPIClient when MAMBU_HTTP_CLIENT is "asyncio". Requests time
+    out after MAMBU_REQUEST_TIMEOUT seconds.
+    :return: (installments df, {failed loan account id: reason})
+    """
     loan_accounts_ids = loan_account_ids_df["id"].tolist()
     output_list_of_dfs = []
-    mambu_secret = get_secret(os.environ["MAMBU_PASSWORD_NAME"])
-    for loan_account_id in loan_accounts_ids:
-        try:
-            res = requests.get(
-                "https://{0}.mambu.com/api/loans/{1}/schedule?detailsLevel=FULL".format(
-                    os.environ["MAMBU_SUBDOMAIN"], loan_account_id
-                ),
-                headers=headers,
-                auth=HTTPBasicAuth(
-                    os.environ["MAMBU_USERNAME"],
-                    mambu_secret,
-                ),
-            )
-            loan_account_installments_df = get_installments_df(
-                res.json()["installments"]
+    failed_ids = {}
+    timeout = float(os.environ.get("MAMBU_REQUEST_TIMEOUT", 60))
+
+    if os.environ.get("MAMBU_HTTP_CLIENT", "threads") == "asyncio":
+        results = asyncio.run(
+            fetch_installments_async(loan_accounts_ids, max_workers, timeout)
+        )
+    else:
+        session = get_mambu_session(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    lambda loan_account_id: get_loan_account_installments(
+                        session, loan_account_id, timeout
+                    ),
+                    loan_accounts_ids,
+                )
             )
-            loan_account_installments_df["loan_account_id"] = loan_account_id
-            loan_account_installments_df["timestamp_extracted"] = datetime.utcnow()
+
+    for loan_account_id, (loan_account_installments_df, reason) in zip(
+        loan_accounts_ids, results
+    ):
+        if reason is None:
             output_list_of_dfs.append(loan_account_installments_df)
-        except Exception as e:
-            logger.warn("Loan account id:  %s", loan_account_id)
-            errors = res.json()["errors"]
-            for error in errors:
-                if error["errorReason"] == "INVALID_LOAN_ACCOUNT_ID":
-                    logger.warn(
-                        "Loan account is invalid, please cross check in Mambu UI."
-                    )
-                else:
-                    logger.error("Exception occurred:  %s", e)
-                    logger.error(errors)
-                    logger.error(res.json())
             continue
 
-    return pd.concat(output_list_of_dfs)
+        failed_ids[loan_account_id] = reason
+        if reason == "INVALID_LOAN_ACCOUNT_ID":
+            logger.warning(
+                "Loan account %s is invalid, please cross check in Mambu UI.",
+                loan_account_id,
+            )
+        else:
+            logger.error("Loan account id %s failed:  %s", loan_account_id, reason)
+
+    logger.info(
+        "Fetched %s loan accounts, %s failed.",
+        len(output_list_of_dfs),
+        len(failed_ids),
+    )
+    if not output_list_of_dfs:
+        return pd.DataFrame(), failed_ids
+    return pd.concat(output_list_of_dfs), failed_ids
 
 
 def camel_to_snake_case(all_installments_df):
@@ -202,24 +487,69 @@ def lambda_handler(event, context):
     """
     begin = time.time()
 
+    state_store = get_state_store()
+
     logger.info("Getting loan account ids..")
-    loan_account_ids_df = get_athena_df(open("loan_account_ids.sql", "r"))
-    logger.info("Loan account ids loaded.")
+    loan_account_ids_df, new_watermark = get_loan_account_ids(
+        state_store, str(event.get("full_refresh", "False")).lower() == "true"
+    )
+    logger.info("%s loan account ids loaded.", len(loan_account_ids_df))
 
     logger.info("Getting installment data for loan accounts retrieved.")
-    all_installments_df = get_installments_from_mambu(loan_account_ids_df)
+    all_installments_df, failed_ids = (
+        get_installments_from_mambu(
+            loan_account_ids_df, int(os.environ.get("MAMBU_MAX_WORKERS", 16))
+        )
+        if len(loan_account_ids_df)
+        else (pd.DataFrame(), {})
+    )
     all_installments_snake_case = camel_to_snake_case(all_installments_df)
     logger.info("Installment data retrieved and parsed.")
 
     logger.info("Writing to data lake...")
-    res = write_to_data_lake(all_installments_snake_case, "loan_accounts_installments")
+    if all_installments_snake_case.empty:
+        res = False
+    elif os.environ.get("INSTALLMENTS_LAYOUT", "loan_account") == "bucketed":
+        buckets = assign_buckets(
+            state_store,
+            all_installments_snake_case["loan_account_id"].unique(),
+            int(os.environ.get("INSTALLMENTS_BUCKET_COUNT", 64)),
+        )
+        res = write_bucketed_to_data_lake(
+            all_installments_snake_case, "loan_accounts_installments_bucketed", buckets
+        )
+    else:
+        res = write_to_data_lake(
+            all_installments_snake_case, "loan_accounts_installments"
+        )
     if res:
         logger.info("Data Lake write complete. Result:  %s", res)
+    elif all_installments_snake_case.empty and not len(loan_account_ids_df):
+        logger.info("No loan account changed since the last run.")
     else:
         logger.error("Please investigate...")
 
+    # Next run resumes from this one, retrying the loan accounts that failed
+    if res or not len(loan_account_ids_df):
+        state_store.put(
+            INSTALLMENTS_WATERMARK_KEY,
+            {
+                **new_watermark,
+                "failed_loan_account_ids": [
+                    loan_account_id
+                    for loan_account_id, reason in failed_ids.items()
+                    if reason != "INVALID_LOAN_ACCOUNT_ID"
+                ],
+            },
+        )
+
     end = time.time()
     logger.info(
         f"Total minutes taken for this Lambda to run: {float((end - begin)/60):.2f}"
     )
-    return True
+    return {
+        "loan_accounts_count": len(loan_account_ids_df),
+        "installments_count": len(all_installments_df),
+        "failed_loan_account_ids": failed_ids,
+        "write_succeeded": bool(res),
+    }
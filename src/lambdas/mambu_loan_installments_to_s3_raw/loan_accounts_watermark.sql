@@ -0,0 +1,3 @@
+SELECT
+    (SELECT MAX(last_modified_date) FROM "datalake_raw"."loan_accounts" WHERE {loan_accounts_last_modified_date_partitions}) AS loan_accounts_last_modified_date,
+    (SELECT MAX(creation_date) FROM "datalake_raw"."loan_transactions" WHERE {loan_transactions_creation_date_partitions}) AS loan_transactions_creation_date
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the Lambda package holds the lambda directory and the src/common modules
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, "..", "..", "common"))
+sys.path.insert(0, LAMBDA_DIR)
@@ -0,0 +1,75 @@
+import asyncio
+
+import lambda_function
+import requests
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from async_api_client import AsyncAPIClient
+
+
+async def schedule(request):
+    """
+    Mambu schedule of loan account 1, any other loan account is invalid
+    """
+    if request.match_info["loan_account_id"] != "1":
+        body = {"errors": [{"errorCode": 4, "errorReason": "INVALID_LOAN_ACCOUNT_ID"}]}
+        return web.json_response(body, status=400)
+    installments = [{"encodedKey": "a", "number": "1", "interest": {"amount": {}}}]
+    return web.json_response({"installments": installments})
+
+
+def fetch_installments(loan_account_ids):
+    async def main():
+        app = web.Application()
+        app.router.add_get("/loans/{loan_account_id}/schedule", schedule)
+        async with TestServer(app) as server:
+            async with AsyncAPIClient(
+                {"username": "user", "password": "secret"},
+                base_url=str(server.make_url("/")),
+            ) as client:
+                return await asyncio.gather(
+                    *(
+                        lambda_function.get_loan_account_installments_async(
+                            client, loan_account_id
+                        )
+                        for loan_account_id in loan_account_ids
+                    )
+                )
+
+    return asyncio.run(main())
+
+
+def test_get_loan_account_installments_async():
+    (installments_df, reason), (invalid_df, invalid_reason) = fetch_installments(
+        ["1", "2"]
+    )
+
+    assert reason is None
+    assert installments_df["encodedKey"].tolist() == ["a"]
+    assert installments_df["interest_amount"].tolist() == [""]
+    assert installments_df["loan_account_id"].tolist() == ["1"]
+    assert invalid_df is None
+    assert invalid_reason == "INVALID_LOAN_ACCOUNT_ID"
+
+
+
+class TimingOutSession:
+    def __init__(self):
+        self.timeouts = []
+
+    def get(self, url, timeout=None):
+        self.timeouts.append(timeout)
+        raise requests.exceptions.ReadTimeout("Read timed out.")
+
+
+def test_get_loan_account_installments_times_out(monkeypatch):
+    monkeypatch.setenv("MAMBU_SUBDOMAIN", "bank")
+    session = TimingOutSession()
+
+    installments_df, reason = lambda_function.get_loan_account_installments(
+        session, "1", timeout=5
+    )
+
+    assert session.timeouts == [5]
+    assert installments_df is None
+    assert "ReadTimeout" in reason
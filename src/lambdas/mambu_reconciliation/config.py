@@ -2,7 +2,6 @@ mambudb_streams = {
     "deposit_transactions": {
         "partition_cols": ["date"],
         "reconcile_sql_path": "mambu_deposit_transactions_reconcile.sql",
-        "backfill_sql_path": "mambu_deposit_transactions_ids.sql",
         "schema": {
             "reconciliation_date": "date",
             "source_min_id_for_date": "int",
@@ -20,7 +19,32 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_rowcount_for_date"],
-        "processing_function": "process_deposit_transactions",
+        "missing_ids": {
+            "table": "deposit_transactions",
+            "id_column": "id",
+            "date_column": "creation_date",
+        },
+        "hash_diff": {
+            "table": "deposit_transactions",
+            "key": "id",
+            "date_column": "creation_date",
+            "columns": ["encoded_key", "amount", "currency_code", "type"],
+            "decimals": {"amount": 2},
+        },
+        "aggregation": {
+            "date_column": "creation_date",
+            "casts": {"id": "int", "amount": "float"},
+            "group_by": ["currency_code", "type"],
+            "metrics": {
+                "source_currency_type_transactions_total_for_date": ("id", "size"),
+                "source_sum_amount_for_currency_and_date": ("amount", "sum"),
+            },
+            "date_metrics": {
+                "source_min_id_for_date": ("id", "min"),
+                "source_max_id_for_date": ("id", "max"),
+                "source_total_rowcount_for_date": ("id", "size"),
+            },
+        },
     },
     "gl_journal_entries": {
         "partition_cols": ["date"],
@@ -34,7 +58,20 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_rowcount_for_date"],
-        "processing_function": "process_gl_journal_entries",
+        "hash_diff": {
+            "table": "gl_journal_entries",
+            "key": "entry_id",
+            "date_column": "creation_date",
+            "columns": ["transaction_id", "gl_account_encoded_key", "amount", "type"],
+            "decimals": {"amount": 2},
+        },
+        "aggregation": {
+            "date_column": "creation_date",
+            "metrics": {
+                "source_total_gl_journal_entries_for_date": ("entry_id", "nunique"),
+                "source_total_rowcount_for_date": ("entry_id", "size"),
+            },
+        },
     },
     "clients": {
         "partition_cols": ["date"],
@@ -48,7 +85,19 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_clients_for_date"],
-        "processing_function": "process_clients",
+        "hash_diff": {
+            "table": "clients",
+            "key": "id",
+            "date_column": "last_modified_date",
+            "columns": ["encoded_key", "state"],
+        },
+        "aggregation": {
+            "date_column": "last_modified_date",
+            "metrics": {
+                "source_total_clients_for_date": ("id", "nunique"),
+                "source_total_rowcount_for_date": ("id", "size"),
+            },
+        },
     },
     "deposit_accounts": {
         "partition_cols": ["date"],
@@ -62,7 +111,24 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_deposit_accounts_for_date"],
-        "processing_function": "process_deposit_accounts",
+        "hash_diff": {
+            "table": "deposit_accounts",
+            "key": "id",
+            "date_column": "creation_date",
+            "columns": [
+                "encoded_key",
+                "account_state",
+                "currency_code",
+                "product_type_key",
+            ],
+        },
+        "aggregation": {
+            "date_column": "creation_date",
+            "metrics": {
+                "source_total_deposit_accounts_for_date": ("id", "nunique"),
+                "source_total_rowcount_for_date": ("id", "size"),
+            },
+        },
     },
     "gl_accounts": {
         "partition_cols": ["date"],
@@ -76,7 +142,13 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_gl_accounts_for_date"],
-        "processing_function": "process_gl_accounts",
+        "aggregation": {
+            "date_column": None,
+            "metrics": {
+                "source_total_gl_accounts_for_date": ("gl_code", "nunique"),
+                "source_total_rowcount_for_date": ("gl_code", "size"),
+            },
+        },
     },
     "users": {
         "partition_cols": ["date"],
@@ -90,7 +162,19 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_users_for_date"],
-        "processing_function": "process_users",
+        "hash_diff": {
+            "table": "users",
+            "key": "id",
+            "date_column": "last_modified_date",
+            "columns": ["encoded_key"],
+        },
+        "aggregation": {
+            "date_column": "last_modified_date",
+            "metrics": {
+                "source_total_users_for_date": ("id", "nunique"),
+                "source_total_rowcount_for_date": ("id", "size"),
+            },
+        },
     },
     "loan_accounts": {
         "partition_cols": ["date"],
@@ -104,7 +188,19 @@ mambudb_streams = {
             "timestamp_extracted": "timestamp",
         },
         "columns_to_check": ["total_loan_accounts_for_date"],
-        "processing_function": "process_loan_accounts",
+        "hash_diff": {
+            "table": "loan_accounts",
+            "key": "id",
+            "date_column": "last_modified_date",
+            "columns": ["encoded_key"],
+        },
+        "aggregation": {
+            "date_column": "last_modified_date",
+            "metrics": {
+                "source_total_loan_accounts_for_date": ("id", "nunique"),
+                "source_total_rowcount_for_date": ("id", "size"),
+            },
+        },
     },
     # "loan_transactions": {
     #     "partition_cols": ["date"],
@@ -118,6 +214,12 @@ mambudb_streams = {
     #         "timestamp_extracted": "timestamp",
     #     },
     #     "columns_to_check": ["total_loan_transactions_for_date"],
-    #     "processing_function": "process_loan_transactions",
+    #     "aggregation": {
+    #         "date_column": "creation_date",
+    #         "metrics": {
+    #             "source_total_loan_transactions_for_date": ("id", "nunique"),
+    #             "source_total_rowcount_for_date": ("id", "size"),
+    #         },
+    #     },
     # },
 }
@@ -0,0 +1,235 @@
+import hashlib
+import logging
+from datetime import date
+from decimal import Decimal
+from decimal import ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from athena_reader import partition_predicate
+from athena_reader import read_athena
+
+logger = logging.getLogger()
+
+# Buckets are compared from the coarsest level down, only mismatching buckets
+# of a level are queried at the next one
+BUCKET_LEVELS = {"day": 10, "hour": 13}
+
+DIFF_COLUMNS = ["bucket", "key", "issue"]
+
+
+def rows_sql(spec: dict, buckets: list) -> str:
+    """
+    Athena rows of the buckets with their hour, key and md5 digest.
+    Buckets are all of the same level, i.e. days or hours.
+    Digests are computed over the key and spec["columns"] as strings
+    joined by "|", NULL being "". Numeric columns listed in spec["decimals"]
+    are formatted with that many decimals first, see format_decimals. Hours are "YYYY-MM-DDTHH" strings
+    for string and timestamp date columns. Rows are extracted on the day
+    they are created or later, so only the date partitions since the
+    first bucket are read.
+    """
+    decimals = spec.get("decimals", {})
+    values = ", ".join(
+        (
+            f"coalesce(CAST(TRY_CAST({column} AS decimal(38, {decimals[column]})) AS varchar), '')"
+            if column in decimals
+            else f"coalesce(CAST({column} AS varchar), '')"
+        )
+        for column in [spec["key"]] + spec["columns"]
+    )
+    hour = f"replace(substr(CAST({spec['date_column']} AS varchar), 1, 13), ' ', 'T')"
+    bucket_list = ", ".join(f"'{bucket}'" for bucket in buckets)
+    return f"""
+SELECT  CAST({spec["key"]} AS varchar) AS key
+       ,hour
+       ,md5(to_utf8(concat_ws('|', {values}))) AS digest
+FROM
+(
+	SELECT  *
+	       ,{hour} AS hour
+	FROM datalake_raw.{spec["table"]}
+	WHERE {partition_predicate(min(buckets)[:10])}
+)
+WHERE substr(hour, 1, {len(buckets[0])}) IN ({bucket_list})"""
+
+
+def target_buckets_sql(spec: dict, buckets: list, level: str) -> str:
+    """
+    Athena hashes of the level buckets under buckets,
+    the count and two 32 bit sums of the row digests
+    """
+    return f"""
+SELECT  substr(hour, 1, {BUCKET_LEVELS[level]}) AS bucket
+       ,COUNT(*) AS row_count
+       ,SUM(from_big_endian_32(substr(digest, 1, 4))) AS hash_high
+       ,SUM(from_big_endian_32(substr(digest, 5, 4))) AS hash_low
+FROM ({rows_sql(spec, buckets)})
+GROUP BY substr(hour, 1, {BUCKET_LEVELS[level]})"""
+
+
+def target_rows_sql(spec: dict, buckets: list) -> str:
+    """
+    Athena rows of the buckets, digests as hex like source_digests
+    """
+    return f"""
+SELECT  key
+       ,hour
+       ,to_hex(digest) AS digest
+FROM ({rows_sql(spec, buckets)})"""
+
+
+def format_decimals(column: pd.Series, scale: int) -> pd.Series:
+    """
+    Numbers as the strings of CAST(TRY_CAST(x AS decimal(38, scale)) AS varchar),
+    i.e. 100 and "100.0" both become "100.00" with a scale of 2. Rounds half
+    up from the shortest repr of floats, like Athena casts doubles.
+    """
+    quantum = Decimal(1).scaleb(-scale)
+
+    def format_decimal(value):
+        if pd.isna(value) or value == "":
+            return None
+        number = Decimal(str(value)).quantize(quantum, rounding=ROUND_HALF_UP)
+        # Athena has no negative zero
+        return str(abs(number) if number.is_zero() else number)
+
+    return column.map(format_decimal, na_action="ignore").astype(object)
+
+
+def source_digests(input_df: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    """
+    Source rows with the same hour, key and digest as rows_sql, and the
+    two signed 32 bit halves of the digest which bucket hashes sum up
+    """
+    values = input_df[[spec["key"]] + spec["columns"]].astype(object)
+    for column, scale in spec.get("decimals", {}).items():
+        values[column] = format_decimals(values[column], scale)
+    values = values.where(values.notna(), "").astype(str)
+    digests = [
+        hashlib.md5("|".join(row).encode("utf-8")).digest()
+        for row in values.itertuples(index=False, name=None)
+    ]
+    return pd.DataFrame(
+        {
+            "key": values[spec["key"]].to_numpy(),
+            "hour": input_df[spec["date_column"]]
+            .astype(str)
+            .str.slice(0, BUCKET_LEVELS["hour"])
+            .to_numpy(),
+            "digest": [digest.hex().upper() for digest in digests],
+            "hash_high": [int.from_bytes(d[:4], "big", signed=True) for d in digests],
+            "hash_low": [int.from_bytes(d[4:8], "big", signed=True) for d in digests],
+        }
+    )
+
+
+def source_buckets(digests_df: pd.DataFrame, level: str) -> pd.DataFrame:
+    """
+    Source bucket hashes, same aggregation as target_buckets_sql
+    """
+    return digests_df.groupby(
+        digests_df["hour"].str.slice(0, BUCKET_LEVELS[level]).rename("bucket")
+    ).agg(
+        row_count=("key", "size"),
+        hash_high=("hash_high", "sum"),
+        hash_low=("hash_low", "sum"),
+    )
+
+
+def mismatching_buckets(source_df: pd.DataFrame, target_df: pd.DataFrame) -> list:
+    """
+    Buckets whose count or hashes differ, or which are missing on one side
+    """
+    target_df = target_df.set_index("bucket")[["row_count", "hash_high", "hash_low"]]
+    compared = source_df.join(target_df, how="outer", rsuffix="_target")
+    matches = (
+        (compared["row_count"] == compared["row_count_target"])
+        & (compared["hash_high"] == compared["hash_high_target"])
+        & (compared["hash_low"] == compared["hash_low_target"])
+    )
+    return sorted(compared.index[~matches])
+
+
+def diff_rows(source_rows: pd.DataFrame, target_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Classifies the keys of mismatching buckets:
+    - missing: in Mambu but not in the data lake, or some of its versions
+    - extra: in the data lake but not in Mambu, or some of its versions
+    - mutated: versions on both sides which do not match
+    - duplicated: same versions, more times in the data lake than in Mambu
+    """
+    source_counts = source_rows.groupby(["hour", "key", "digest"]).size()
+    target_counts = target_rows.groupby(["hour", "key", "digest"]).size()
+    counts = pd.concat(
+        [source_counts.rename("source"), target_counts.rename("target")], axis=1
+    ).fillna(0)
+    counts["source_only"] = (counts["source"] > 0) & (counts["target"] == 0)
+    counts["target_only"] = (counts["target"] > 0) & (counts["source"] == 0)
+    counts["duplicated"] = (counts["source"] > 0) & (
+        counts["target"] > counts["source"]
+    )
+
+    keys = counts.groupby(level=["hour", "key"]).agg(
+        source=("source", "sum"),
+        target=("target", "sum"),
+        source_only=("source_only", "any"),
+        target_only=("target_only", "any"),
+        duplicated=("duplicated", "any"),
+    )
+    issues = np.select(
+        [
+            keys["target"] == 0,
+            keys["source"] == 0,
+            keys["source_only"] & keys["target_only"],
+            keys["source_only"],
+            keys["target_only"],
+            keys["duplicated"],
+        ],
+        ["missing", "extra", "mutated", "missing", "extra", "duplicated"],
+        default="",
+    )
+
+    diff_df = keys.assign(issue=issues).reset_index()
+    diff_df = diff_df[diff_df["issue"] != ""]
+    return diff_df.rename(columns={"hour": "bucket"})[DIFF_COLUMNS].reset_index(
+        drop=True
+    )
+
+
+def hash_diff(input_df: pd.DataFrame, spec: dict, read_sql=read_athena) -> pd.DataFrame:
+    """
+    Finds missing, extra, duplicated and mutated rows between the Mambu records
+    and the data lake, comparing day then hour bucket hashes and fetching the
+    rows of mismatching hours only. Today is left out as it is still loading.
+    :param input_df: The Mambu records, before any processing
+    :param spec: The "hash_diff" of the stream in config.mambudb_streams
+    :param read_sql: Function running a query on Athena
+    :return: DataFrame of bucket (hour), key and issue
+    """
+    digests_df = source_digests(input_df, spec)
+    digests_df = digests_df[digests_df["hour"] < date.today().isoformat()]
+    if digests_df.empty:
+        return pd.DataFrame(columns=DIFF_COLUMNS)
+
+    buckets = sorted(digests_df["hour"].str.slice(0, BUCKET_LEVELS["day"]).unique())
+    for level in BUCKET_LEVELS:
+        # Only the rows under the mismatching buckets of the previous level
+        digests_df = digests_df[
+            digests_df["hour"].str.slice(0, len(buckets[0])).isin(buckets)
+        ]
+        target_df = read_sql(target_buckets_sql(spec, buckets, level))
+        buckets = mismatching_buckets(source_buckets(digests_df, level), target_df)
+        logger.info(
+            f"{spec['table']}: {len(buckets)} mismatching {level} buckets {buckets[:10]}"
+        )
+        if not buckets:
+            return pd.DataFrame(columns=DIFF_COLUMNS)
+
+    source_rows = digests_df[digests_df["hour"].isin(buckets)]
+    target_rows = read_sql(target_rows_sql(spec, buckets))
+    diff_df = diff_rows(source_rows, target_rows)
+    logger.info(
+        f"{spec['table']}: {diff_df['issue'].value_counts().to_dict()} rows differ"
+    )
+    return diff_df
@@ -1,27 +1,42 @@
+import fnmatch
 import glob
 import json
 import logging
 import os
-import subprocess
-import sys
 import shutil
-import fnmatch
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 
 import awswrangler as wr
 import boto3
 import data_catalog
 import numpy as np
 import pandas as pd
-from flatten_json import flatten
+from athena_reader import LOCAL_CACHE_DIR
+from athena_reader import invalidate_tables
+from athena_reader import read_athena
+from athena_reader import select_sql
+from hash_diff import hash_diff
+from jsonl_reader import read_jsonl
+from mambu_extractor import extract_stream
+from mambu_extractor import get_mambu_client
+from missing_ids import contains_ids
+from missing_ids import find_missing_ids
+from missing_ids import to_ranges
 
 import config
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Singer runs share state.json and the catalog files in the working dir
+SINGER_LOCK = threading.Lock()
+
 
 def selective_copy(src_dir, dest_dir, patterns=("*.py", "*.json","*.sql")):
     """
@@ -174,6 +189,20 @@ def mambu_fetch(
         return e
 
 
+def clean_tmp_dir(tmp_dir="/tmp/", keep=(LOCAL_CACHE_DIR,)):
+    """
+    Removes the contents of tmp_dir left by a previous invocation, except the
+    paths in keep
+    """
+    for entry in os.scandir(tmp_dir):
+        if entry.path in keep:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
+
+
 def cleanup_dir(dir):
     """
     Since AWS Lambda might re-use the same context on each invocation
@@ -196,248 +225,69 @@ def cleanup_dir(dir):
         return e
 
 
-def process_deposit_transactions(
-    input_df: pd.DataFrame, athena_df: pd.DataFrame
-) -> pd.DataFrame:
-    # Calculate data points from source
-    input_df["creation_date"] = pd.to_datetime(input_df["creation_date"])
-    input_df["date"] = input_df["creation_date"].dt.date
-    input_df["amount"] = input_df["amount"].astype(float)
-    # Max id
-    input_df["id"] = input_df["id"].astype(int)
-    df2 = input_df.groupby(["date"], as_index=False)["id"].max()
-    df2.rename(columns={"id": "source_max_id_for_date"}, inplace=True)
-    # Min id
-    df1 = input_df.groupby(["date"], as_index=False)["id"].min()
-    df1.rename(columns={"id": "source_min_id_for_date"}, inplace=True)
-    # Currency code
-    df_currencies_types = input_df.value_counts(
-        subset=["date", "currency_code", "type"]
-    ).to_frame(name="source_currency_type_transactions_total_for_date")
-    df_currencies_types.reset_index(inplace=True)
-    # Amount total
-    df_amounts = input_df.groupby(["date", "currency_code", "type"], as_index=False)[
-        "amount"
-    ].sum()
-    df_amounts.rename(
-        columns={"amount": "source_sum_amount_for_currency_and_date"}, inplace=True
-    )
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-
-    # Prepare mambu df
-    mambu_source_df = df1.merge(df2, left_on="date", right_on="date")
-    mambu_source_df = mambu_source_df.merge(
-        df_currencies_types, left_on="date", right_on="date"
-    )
-    mambu_source_df = mambu_source_df.merge(
-        df_amounts,
-        left_on=["date", "currency_code", "type"],
-        right_on=["date", "currency_code", "type"],
-    )
-    mambu_source_df = mambu_source_df.merge(
-        df_rowcount, left_on=["date"], right_on=["date"]
-    )
-    mambu_source_df["date"] = pd.to_datetime(mambu_source_df["date"])
-
-    # Merge and prepare final table
-    full_df = mambu_source_df.merge(
-        athena_df,
-        left_on=["date", "currency_code", "type"],
-        right_on=["date", "currency_code", "type"],
-    )
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
-
-    return full_df
-
-
-def process_clients(input_df: pd.DataFrame, athena_df: pd.DataFrame) -> pd.DataFrame:
-    input_df["last_modified_date"] = pd.to_datetime(input_df["last_modified_date"])
-    input_df["date"] = input_df["last_modified_date"].dt.date
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    # client count per creation date
-    df_clientcount = input_df.groupby(["date"], as_index=False)["id"].nunique()
-    df_clientcount.rename(columns={"id": "source_total_clients_for_date"}, inplace=True)
-
-    # Prepare mambu df
-    mambu_source_df = df_clientcount.merge(df_rowcount, left_on="date", right_on="date")
-
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
-
-    return full_df
-
-
-def process_loan_accounts(
-    input_df: pd.DataFrame, athena_df: pd.DataFrame
-) -> pd.DataFrame:
-    input_df["last_modified_date"] = pd.to_datetime(input_df["last_modified_date"])
-    input_df["date"] = input_df["last_modified_date"].dt.date
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    # loan accounts count per creation date
-    df_loan_account_count = input_df.groupby(["date"], as_index=False)["id"].nunique()
-    df_loan_account_count.rename(
-        columns={"id": "source_total_loan_accounts_for_date"}, inplace=True
-    )
-
-    # Prepare mambu df
-    mambu_source_df = df_loan_account_count.merge(
-        df_rowcount, left_on="date", right_on="date"
-    )
-
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
-
-    return full_df
-
-
-def process_loan_transactions(
-    input_df: pd.DataFrame, athena_df: pd.DataFrame
-) -> pd.DataFrame:
-    input_df["creation_date"] = pd.to_datetime(input_df["creation_date"])
-    input_df["date"] = input_df["creation_date"].dt.date
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    # loan transactions count per creation date
-    df_loan_transactions_count = input_df.groupby(["date"], as_index=False)[
-        "id"
-    ].nunique()
-    df_loan_transactions_count.rename(
-        columns={"id": "source_total_loan_transactions_for_date"}, inplace=True
-    )
-
-    # Prepare mambu df
-    mambu_source_df = df_loan_transactions_count.merge(
-        df_rowcount, left_on="date", right_on="date"
-    )
-
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
+# Aggregations which can be rolled up from group_by level to date level
+ROLLUPS = {"min": "min", "max": "max", "sum": "sum", "size": "sum", "count": "sum"}
 
-    return full_df
-
-
-def process_gl_journal_entries(
-    input_df: pd.DataFrame, athena_df: pd.DataFrame
-) -> pd.DataFrame:
-    input_df["creation_date"] = pd.to_datetime(input_df["creation_date"])
-    input_df["date"] = input_df["creation_date"].dt.date
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    df_grouped = input_df.groupby(["date"], as_index=False)["entry_id"].nunique()
-    df_grouped.rename(
-        columns={"entry_id": "source_total_gl_journal_entries_for_date"}, inplace=True
-    )
-
-    # Prepare mambu df
-    mambu_source_df = df_grouped.merge(df_rowcount, left_on="date", right_on="date")
-
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
-
-    return full_df
 
+def aggregate_source(input_df: pd.DataFrame, aggregation: dict) -> pd.DataFrame:
+    """
+    Computes the source data points of a stream in a single grouped pass,
+    as declared in the "aggregation" of config.mambudb_streams:
+    - date_column: the records are reconciled on its date, yesterday if None
+    - casts: columns cast in place before aggregating, i.e. {"id": "int"}
+    - group_by: extra keys under the date
+    - metrics: {output_column: (input_column, aggregation)} per date and group_by
+    - date_metrics: metrics per date only, rolled up from the group_by level
+    input_df is modified in place (date column, casts), as the backfill reuses it.
+    """
+    if aggregation["date_column"] is None:
+        input_df["date"] = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+    else:
+        date_column = aggregation["date_column"]
+        input_df[date_column] = pd.to_datetime(input_df[date_column])
+        input_df["date"] = input_df[date_column].dt.date
+    for column, dtype in aggregation.get("casts", {}).items():
+        input_df[column] = input_df[column].astype(dtype)
+
+    group_by = aggregation.get("group_by", [])
+    date_metrics = aggregation.get("date_metrics", {})
+    if not group_by:
+        return input_df.groupby(["date"], as_index=False).agg(
+            **aggregation["metrics"], **date_metrics
+        )
 
-def process_deposit_accounts(
-    input_df: pd.DataFrame, athena_df: pd.DataFrame
-) -> pd.DataFrame:
-    input_df["creation_date"] = pd.to_datetime(input_df["creation_date"])
-    input_df["date"] = input_df["creation_date"].dt.date
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    # deposit account count per creation date
-    df_deposit_account_count = input_df.groupby(["date"], as_index=False)[
-        "id"
-    ].nunique()
-    df_deposit_account_count.rename(
-        columns={"id": "source_total_deposit_accounts_for_date"}, inplace=True
-    )
+    for output_column, (_, func) in date_metrics.items():
+        if func not in ROLLUPS:
+            raise ValueError(
+                f"{output_column}: {func} cannot be rolled up from {group_by} to date"
+            )
 
-    # Prepare mambu df
-    mambu_source_df = df_deposit_account_count.merge(
-        df_rowcount, left_on="date", right_on="date"
+    # Rows with empty group_by keys still count at date level
+    source_df = input_df.groupby(["date"] + group_by, as_index=False, dropna=False).agg(
+        **aggregation["metrics"], **date_metrics
     )
-
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
-
-    return full_df
+    for output_column, (_, func) in date_metrics.items():
+        source_df[output_column] = source_df.groupby("date")[output_column].transform(
+            ROLLUPS[func]
+        )
+    return source_df.dropna(subset=group_by).reset_index(drop=True)
 
 
-def process_gl_accounts(
-    input_df: pd.DataFrame, athena_df: pd.DataFrame
+def aggregate_stream(
+    input_df: pd.DataFrame, athena_df: pd.DataFrame, mambu_stream: str
 ) -> pd.DataFrame:
-    input_df["date"] = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
-
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    # gl account count per creation date
-    df_gl_account_count = input_df.groupby(["date"], as_index=False)[
-        "gl_code"
-    ].nunique()
-    df_gl_account_count.rename(
-        columns={"gl_code": "source_total_gl_accounts_for_date"}, inplace=True
-    )
+    """
+    Joins the source data points of a stream with the Athena side,
+    on the reconciliation date and group_by keys
+    """
+    aggregation = config.mambudb_streams[mambu_stream]["aggregation"]
+    mambu_source_df = aggregate_source(input_df, aggregation)
 
-    # Prepare mambu df
-    mambu_source_df = df_gl_account_count.merge(
-        df_rowcount, left_on="date", right_on="date"
+    mambu_source_df["date"] = pd.to_datetime(mambu_source_df["date"])
+    athena_df["date"] = pd.to_datetime(athena_df["date"])
+    full_df = mambu_source_df.merge(
+        athena_df, on=["date"] + aggregation.get("group_by", [])
     )
-
-    mambu_source_df.date = pd.to_datetime(mambu_source_df.date)
-    athena_df.date = pd.to_datetime(athena_df.date)
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
-    full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
-    full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
-
-    return full_df
-
-
-def process_users(input_df: pd.DataFrame, athena_df: pd.DataFrame) -> pd.DataFrame:
-    input_df["last_modified_date"] = pd.to_datetime(input_df["last_modified_date"])
-    input_df["date"] = input_df["last_modified_date"].dt.date
-    # Rowcount per creation date
-    df_rowcount = input_df.value_counts(subset=["date"]).to_frame(
-        name="source_total_rowcount_for_date"
-    )
-    df_rowcount.reset_index(inplace=True)
-    # user count per creation date
-    df_usercount = input_df.groupby(["date"], as_index=False)["id"].nunique()
-    df_usercount.rename(columns={"id": "source_total_users_for_date"}, inplace=True)
-
-    # Prepare mambu df
-    mambu_source_df = df_usercount.merge(df_rowcount, left_on="date", right_on="date")
-
-    full_df = mambu_source_df.merge(athena_df, left_on=["date"], right_on=["date"])
     full_df.rename(columns={"date": "reconciliation_date"}, inplace=True)
     full_df["reconciliation_date"] = full_df["reconciliation_date"].astype(str)
 
@@ -473,21 +323,13 @@ def debug_write_to_s3(
     s3_resource.meta.client.upload_file(tmp_path, s3_bucket, fallback_path)
 
 
-def filter_mambu(mambu_df):
+def filter_mambu(mambu_df, id_column="id", date_column="creation_date"):
     """
-    Get only yesterday's data
+    Get only yesterday's ids
     """
-    mambu_df_selected = mambu_df[["id", "creation_date"]]
-    mambu_df_selected["creation_date"] = pd.to_datetime(
-        mambu_df_selected["creation_date"]
-    )
-    mambu_df_selected["creation_date"] = mambu_df_selected["creation_date"].dt.date
+    created = pd.to_datetime(mambu_df[date_column]).dt.date
     filter_date = date.today() - timedelta(days=1)
-    mambu_df_selected = mambu_df_selected[
-        mambu_df_selected["creation_date"] == filter_date
-    ]
-    mambu_df_selected["id"] = mambu_df_selected["id"].astype(np.int64)
-    return mambu_df_selected
+    return mambu_df.loc[created == filter_date, id_column].astype(np.int64)
 
 
 def write_to_s3_raw(input_df, mambudb_stream):
@@ -541,82 +383,98 @@ def write_to_s3_raw(input_df, mambudb_stream):
             columns_comments=data_catalog.column_comments[mambudb_stream]
         ),
     )
+    invalidate_tables([mambudb_stream])
 
     return res
 
 
-def backfill_late_settled_deposit_transactions(
+def backfill_missing_ids(
     processed_df, mambu_stream, input_df, athena_ids_yesterday_df=False, local=False
 ):
-    # check counts function if stream is dep transactions
-    if mambu_stream == "deposit_transactions":
-        # only read from athena if executing in lambda
-        if not local:
-            sql_file = open(
-                config.mambudb_streams[mambu_stream]["backfill_sql_path"], "r"
-            )
-            athena_ids_yesterday_df = get_athena_df(sql_file)
-        # get counts but don't raise error alarm, hence 3rd argument
-        count_check = check_counts(
-            processed_df, "deposit_transactions", "fix_deposit_transactions", None
-        )
-        # if counts don't match
-        if count_check == -1:
-            logger.info("Missing transactions detected.")
-            # then get missing ids with notebook code
-            mambu_df_filtered = filter_mambu(input_df)
-            athena_ids_yesterday_df["id"] = athena_ids_yesterday_df["id"].astype(
-                np.int64
-            )
-            merged = mambu_df_filtered.merge(
-                athena_ids_yesterday_df,
-                how="outer",
-                left_on="id",
-                right_on="id",
-                indicator=True,
-            )
-            logger.info(f"Merged: {merged}")
-            filtered_df = merged.query("_merge=='left_only'")
-            missing_ids = filtered_df["id"].tolist()
-            if missing_ids == []:
-                logger.info("No missing transactions detected.")
-                return False, None
-            logger.info(f"Missing ids: {missing_ids}")
-            # based on missing ids get mambu rows in a pandas df
-            mambu_missing_ids_df = input_df.query("id in @missing_ids")
-            # only write to s3 if executing lambda
-            if not local:
-                # append mode in datalake raw for pandas df
-                mambu_missing_ids_df["date"] = date.today().strftime("%Y%m%d")
-                mambu_missing_ids_df["timestamp_extracted"] = datetime.utcnow()
-                mambu_missing_ids_df["creation_date"] = pd.to_datetime(
-                    mambu_missing_ids_df["creation_date"], format="%Y-%m-%d %H:%M:%S"
-                ).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-                res = write_to_s3_raw(mambu_missing_ids_df, "deposit_transactions")
-                logger.info(f"Upload complete: {res}")
-            return True, mambu_missing_ids_df
-        elif count_check == 0:
-            logger.info("No missing transactions detected.")
-            return False, None
-    else:
+    """
+    For streams with a "missing_ids" entry in config, i.e. late settled deposit
+    transactions not picked up by the live feed ETL: when counts do not match,
+    yesterday's Mambu ids missing in Athena are found on sorted id arrays and
+    their rows are appended to datalake raw.
+    :return: Whether ids were backfilled, and the backfilled rows
+    """
+    missing_ids_config = config.mambudb_streams[mambu_stream].get("missing_ids")
+    if missing_ids_config is None:
         return False, None
 
+    # only read from athena if executing in lambda
+    if not local:
+        athena_ids_yesterday_df = get_athena_ids(missing_ids_config)
+    if athena_ids_yesterday_df is False:
+        logger.error("Could not read the Athena ids, skipping the backfill.")
+        return False, None
+    # get counts but don't raise error alarm, hence 3rd argument
+    count_check = check_counts(processed_df, mambu_stream, "backfill_missing_ids", None)
+    if count_check == 0:
+        logger.info("No missing ids detected.")
+        return False, None
+
+    logger.info("Missing ids detected.")
+    id_column = missing_ids_config["id_column"]
+    date_column = missing_ids_config["date_column"]
+    missing_ids = find_missing_ids(
+        filter_mambu(input_df, id_column, date_column),
+        athena_ids_yesterday_df[id_column],
+    )
+    if len(missing_ids) == 0:
+        logger.info("No missing ids detected.")
+        return False, None
+    logger.info(f"Missing {len(missing_ids)} ids in ranges: {to_ranges(missing_ids)}")
+
+    # based on missing ids get mambu rows in a pandas df
+    mambu_missing_ids_df = input_df[
+        contains_ids(input_df[id_column].astype(np.int64), missing_ids)
+    ].copy()
+    # only write to s3 if executing lambda
+    if not local:
+        # append mode in datalake raw for pandas df
+        mambu_missing_ids_df["date"] = date.today().strftime("%Y%m%d")
+        mambu_missing_ids_df["timestamp_extracted"] = datetime.utcnow()
+        mambu_missing_ids_df[date_column] = pd.to_datetime(
+            mambu_missing_ids_df[date_column], format="%Y-%m-%d %H:%M:%S"
+        ).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        res = write_to_s3_raw(mambu_missing_ids_df, mambu_stream)
+        logger.info(f"Upload complete: {res}")
+    return True, mambu_missing_ids_df
+
+
+def get_athena_ids(missing_ids_config):
+    """
+    Yesterday's distinct ids in Athena, reading only the id column of the
+    date partitions since yesterday
+    """
+    yesterday = date.today() - timedelta(days=1)
+    created = f"CAST({missing_ids_config['date_column']} AS varchar)"
+    sql = select_sql(
+        missing_ids_config["table"],
+        columns=[missing_ids_config["id_column"]],
+        where=f"substr({created}, 1, 10) = '{yesterday.isoformat()}'",
+        date_from=yesterday,
+        distinct=True,
+    )
+    return get_athena_sql_df(sql)
+
 
 def get_athena_df(sql_file):
     """
     Retrieve a dataset from athena based on input SQL file
     """
     logger.info(f"Executing {sql_file} ....")
-    sql = sql_file.read()
+    return get_athena_sql_df(sql_file.read())
+
 
+def get_athena_sql_df(sql):
+    """
+    Retrieve a dataset from athena, the result is unloaded to Parquet
+    """
     logger.info("Reading data from Athena...")
     try:
-        athena_df = wr.athena.read_sql_query(
-            sql=sql,
-            database="datalake_raw",
-            workgroup="datalake_workgroup",
-            ctas_approach=False,
-        )
+        athena_df = read_athena(sql)
     except Exception as e:
         logger.error("Exception occurred:  %s", e)
         return False
@@ -626,35 +484,81 @@ def get_athena_df(sql_file):
     return athena_df
 
 
-def create_reconciliation_status(athena_df, mambu_stream):
+def write_hash_diff(input_df: pd.DataFrame, mambu_stream: str):
+    """
+    Writes the missing, extra, duplicated and mutated rows of a stream
+    found with hash_diff to mambu_<stream>_hash_diff
+    """
+    try:
+        diff_df = hash_diff(input_df, config.mambudb_streams[mambu_stream]["hash_diff"])
+    except Exception as e:
+        logger.error(f"Hash diff failed for {mambu_stream}: {e}")
+        return False
+
+    if diff_df.empty:
+        logger.info(f"{mambu_stream}: hash diff found no differences.")
+        return True
+
+    diff_df["timestamp_extracted"] = datetime.utcnow()
+    path = (
+        "s3://"
+        + os.environ["S3_RECONCILIATION"]
+        + "/"
+        + f"mambu_{mambu_stream}_hash_diff"
+        + "/"
+    )
+    create_database_if_not_exists("datalake_reconciliation")
+    try:
+        logger.info("Uploading to S3 location:  %s", path)
+        wr.s3.to_csv(
+            df=diff_df,
+            path=path,
+            index=False,
+            dataset=True,
+            database="datalake_reconciliation",
+            table=f"mambu_{mambu_stream}_hash_diff",
+            mode="append",
+            schema_evolution="true",
+            dtype={
+                "bucket": "string",
+                "key": "string",
+                "issue": "string",
+                "timestamp_extracted": "timestamp",
+            },
+        )
+    except Exception as e:
+        logger.error("Exception occurred:  %s", e)
+        return False
+    return True
+
+
+def create_reconciliation_status(athena_df, mambu_stream, input_df=None):
     """
     Creates a new table that has data points comparison
     between Mambu and Data Lake(Athena)
+    :param input_df: Records extracted in process, read from the Singer output if None
     """
-    # Parse file that was produced with Singer (tap-mambu and target-jsonl)
-    mambu_file = glob.glob(f"{mambu_stream}*.jsonl")
-    if len(mambu_file) > 0:
-        filename = mambu_file[0]
-        data = []
-        with open(filename) as f:
-            for line in f:
-                data.append(flatten(json.loads(line)))
-        # create pandas dataframe
-        input_df = pd.DataFrame(data)
-    else:
+    if input_df is None:
+        # Parse file that was produced with Singer (tap-mambu and target-jsonl)
+        mambu_file = glob.glob(f"{mambu_stream}*.jsonl")
+        if len(mambu_file) > 0:
+            # create pandas dataframe, parsed in bounded chunks
+            input_df = read_jsonl(mambu_file[0])
+        else:
+            return False
+    elif input_df.empty:
         return False
 
-    # process dataframe with the processing function defined in config
+    # row level diff, before the aggregation casts input_df in place
+    if "hash_diff" in config.mambudb_streams[mambu_stream]:
+        write_hash_diff(input_df, mambu_stream)
+
+    # aggregate dataframe as declared in config
     logger.info(f"Calculating {mambu_stream} reconciliation table....")
-    processed_df = getattr(
-        sys.modules[__name__],
-        config.mambudb_streams[mambu_stream]["processing_function"],
-    )(input_df, athena_df)
+    processed_df = aggregate_stream(input_df, athena_df, mambu_stream)
 
     # This is for late settled transactions that are not picked up from live feed ETL: https://bb-2.atlassian.net/browse/NM-8763
-    backfill_result = backfill_late_settled_deposit_transactions(
-        processed_df, mambu_stream, input_df
-    )
+    backfill_result = backfill_missing_ids(processed_df, mambu_stream, input_df)
 
     # This block is only to execute if missing ids were backfilled for dep transactions
     if backfill_result[0]:
@@ -662,11 +566,11 @@ def create_reconciliation_status(athena_df, mambu_stream):
         logger.info(f"Repeating reconciliation for {mambu_stream}!")
         sql_file = open(config.mambudb_streams[mambu_stream]["reconcile_sql_path"], "r")
         athena_totals_after_backfill_df = get_athena_df(sql_file)
-        # override processed_df
-        processed_df = getattr(
-            sys.modules[__name__],
-            config.mambudb_streams[mambu_stream]["processing_function"],
-        )(input_df, athena_totals_after_backfill_df)
+        # override processed_df, keeping the first one if the query failed
+        if athena_totals_after_backfill_df is not False:
+            processed_df = aggregate_stream(
+                input_df, athena_totals_after_backfill_df, mambu_stream
+            )
 
     # setup timestamp column
     now = datetime.utcnow()
@@ -712,7 +616,8 @@ def create_database_if_not_exists(database_name: str) -> dict:
     """
 
     if database_name not in wr.catalog.databases().values:
-        res = wr.catalog.create_database(database_name)
+        # exist_ok since streams reconciled in parallel may race here
+        res = wr.catalog.create_database(database_name, exist_ok=True)
 
         return res
 
@@ -766,8 +671,17 @@ def check_counts(
             return 0
 
 
-def process_stream(mambu_stream):
-    logger.info(f"Running for {mambu_stream}...")
+def use_singer() -> bool:
+    """
+    Whether streams are fetched with the Singer tap instead of the in-process extractor
+    """
+    return os.environ.get("MAMBU_EXTRACTOR", "api") == "singer"
+
+
+def singer_fetch_stream(mambu_stream):
+    """
+    Download a stream for reconciliation with tap-mambu and target-jsonl
+    """
     # for gl_accounts we get the full table, therefore reconcile since beginning of capturing data at nomo
     if mambu_stream == "gl_accounts":
         state = {
@@ -788,33 +702,99 @@ def process_stream(mambu_stream):
 
     # Download mambudb streams and convert to json
     mambu_statefile = "state.json"
-    with open(mambu_statefile, "w") as statefile:
-        json.dump(state, statefile)
-    mambu_fetch_status = mambu_fetch(mambu_statefile, mambu_stream)
+    with SINGER_LOCK:
+        with open(mambu_statefile, "w") as statefile:
+            json.dump(state, statefile)
+        return mambu_fetch(mambu_statefile, mambu_stream)
+
+
+def api_fetch_stream(mambu_stream) -> pd.DataFrame:
+    """
+    Extract a stream for reconciliation in process, same windows as the Singer states
+    """
+    if mambu_stream == "gl_accounts":
+        start_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    else:
+        start_date = datetime.combine(
+            date.today() - timedelta(1), datetime.min.time(), tzinfo=timezone.utc
+        )
+    mambu_client = get_mambu_client(get_secret(os.environ["MAMBU_PASSWORD_NAME"]))
+    # The hash diff and aggregations need the whole stream, chunks are joined
+    return pd.concat(
+        extract_stream(mambu_client, mambu_stream, start_date), ignore_index=True
+    )
+
+
+def fetch_stream(mambu_stream):
+    """
+    Fetch the Mambu side of a stream
+    :return: The in-process records (None with Singer) and the fetch status
+    """
+    if use_singer():
+        return None, singer_fetch_stream(mambu_stream)
+    return api_fetch_stream(mambu_stream), True
+
 
-    # Run Athena queries
-    sql_file = open(config.mambudb_streams[mambu_stream]["reconcile_sql_path"], "r")
-    logger.info(f"Sql file  {sql_file}")
-    athena_df = get_athena_df(sql_file)
+def process_stream(mambu_stream):
+    logger.info(f"Running for {mambu_stream}...")
+    # The Mambu fetch and the Athena query of a stream run at the same time
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        mambu_future = executor.submit(fetch_stream, mambu_stream)
+
+        # Run Athena queries
+        sql_file = open(config.mambudb_streams[mambu_stream]["reconcile_sql_path"], "r")
+        logger.info(f"Sql file  {sql_file}")
+        athena_df = get_athena_df(sql_file)
+
+        input_df, mambu_fetch_status = mambu_future.result()
 
-    if mambu_fetch_status and not athena_df.empty:
-        return create_reconciliation_status(athena_df, mambu_stream)
+    # get_athena_df returns False when the Athena query failed
+    if mambu_fetch_status and athena_df is not False and not athena_df.empty:
+        return create_reconciliation_status(athena_df, mambu_stream, input_df)
     else:
         return "No reconciliation for {0}".format(mambu_stream)
 
 
-def main_routine():
+def reconcile_streams(mambu_streams, max_concurrency=4):
+    """
+    Process mambu streams for reconciliation, max_concurrency streams at a time.
+    Every stream runs to completion, the first failure is raised afterwards.
+    :param mambu_streams: Names of streams in config.mambudb_streams
+    :param max_concurrency: Maximum number of streams processed at the same time
+    :return: Dict of stream name to reconciliation result
+    """
+    # Resolve credentials once, before threads create clients from the default session
+    boto3.client("athena")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = {
+            mambu_stream: executor.submit(process_stream, mambu_stream)
+            for mambu_stream in mambu_streams
+        }
+
+    results = {}
+    errors = []
+    for mambu_stream, future in futures.items():
+        try:
+            results[mambu_stream] = future.result()
+        except Exception as e:
+            logger.error(f"Reconciliation failed for {mambu_stream}: {e}")
+            errors.append(e)
+        logger.info(f"Finished running for {mambu_stream}...")
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def main_routine(max_concurrency=4):
     """
     Process each mambu stream for reconciliation
     """
     generate_tap_config("tap_config.json")
-    return_res = []
-    for mambu_stream in config.mambudb_streams.keys():
-        res = process_stream(mambu_stream)
-        return_res.append(res)
-
-    logger.info(f"Finished running for {mambu_stream}...")
-    return return_res
+    return list(
+        reconcile_streams(config.mambudb_streams.keys(), max_concurrency).values()
+    )
 
 
 def lambda_handler(event, context):
@@ -825,10 +805,14 @@ def lambda_handler(event, context):
     :param context: The context in which the function is called.
     :return: The result of the specified action.
     """
-    mambu_stream = event["mambu_stream"]
+    # One stream, a list of streams or "all" of config.mambudb_streams
+    mambu_streams = event.get("mambu_streams", [event.get("mambu_stream")])
+    if mambu_streams == "all":
+        mambu_streams = list(config.mambudb_streams.keys())
+    max_concurrency = int(event.get("max_concurrency", 4))
 
-    # Cleanup of tmp dir due to Lambda caching
-    shutil.rmtree("/tmp/", ignore_errors=True)
+    # Cleanup of tmp dir due to Lambda caching, the Athena results cache is kept
+    clean_tmp_dir()
 
     # Change dir since Singer requires a dir that is writable;
     # only /tmp is; and there isn't a way to overwrite target-jsonl destination dir
@@ -838,18 +822,33 @@ def lambda_handler(event, context):
     selective_copy(os.getcwd(), "/tmp/")
     os.chdir("/tmp/")
 
-    # Get Singer filesfrom S3 to /tmp/
-    s3 = boto3.client("s3")
-    s3_bucket_name = os.environ["S3_META"]
-    try:
-        s3.download_file(s3_bucket_name, "mambu_meta/config/config.json", "config.json")
-    except Exception as e:
-        logger.error("Exception occurred:  %s", e)
-        return False
-    logger.info("Downloaded Mambu state S3.")
-
-    # Generate config and run stream
-    generate_tap_config("tap_config.json")
-    result = process_stream(mambu_stream)
-    logger.info("Finished reconciliation for stream: %s", mambu_stream)
-    return {"status": "done", "stream": mambu_stream, "result": str(result)}
+    if use_singer():
+        # Get Singer filesfrom S3 to /tmp/
+        s3 = boto3.client("s3")
+        s3_bucket_name = os.environ["S3_META"]
+        try:
+            s3.download_file(
+                s3_bucket_name, "mambu_meta/config/config.json", "config.json"
+            )
+        except Exception as e:
+            logger.error("Exception occurred:  %s", e)
+            return False
+        logger.info("Downloaded Mambu state S3.")
+
+        # Generate config
+        generate_tap_config("tap_config.json")
+
+    # Run streams
+    results = reconcile_streams(mambu_streams, max_concurrency)
+    logger.info("Finished reconciliation for streams: %s", mambu_streams)
+    if "mambu_stream" in event and "mambu_streams" not in event:
+        return {
+            "status": "done",
+            "stream": event["mambu_stream"],
+            "result": str(results[event["mambu_stream"]]),
+        }
+    return {
+        "status": "done",
+        "streams": mambu_streams,
+        "results": {stream: str(result) for stream, result in results.items()},
+    }
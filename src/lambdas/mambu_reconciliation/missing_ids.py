@@ -0,0 +1,44 @@
+from typing import List
+from typing import Tuple
+
+import numpy as np
+
+
+def to_sorted_ids(ids) -> np.ndarray:
+    """
+    Unique int64 ids in ascending order, from any array-like of numeric ids
+    """
+    return np.unique(np.asarray(ids, dtype=np.int64))
+
+
+def contains_ids(ids, sorted_ids: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the ids found in sorted_ids, with a binary search per id
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    positions = np.searchsorted(sorted_ids, ids)
+    positions[positions == len(sorted_ids)] = 0
+    return sorted_ids[positions] == ids
+
+
+def find_missing_ids(source_ids, target_ids) -> np.ndarray:
+    """
+    Sorted ids of the source which are not in the target
+    """
+    source_ids = to_sorted_ids(source_ids)
+    return source_ids[~contains_ids(source_ids, to_sorted_ids(target_ids))]
+
+
+def to_ranges(sorted_ids: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Run-length encodes sorted unique ids as inclusive (first, last) ranges,
+    i.e. [1, 2, 3, 7, 9, 10] -> [(1, 3), (7, 7), (9, 10)]
+    """
+    if len(sorted_ids) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(sorted_ids) != 1)
+    firsts = np.concatenate(([sorted_ids[0]], sorted_ids[breaks + 1]))
+    lasts = np.concatenate((sorted_ids[breaks], [sorted_ids[-1]]))
+    return [(int(first), int(last)) for first, last in zip(firsts, lasts)]
@@ -0,0 +1,102 @@
+import hashlib
+import re
+
+import pandas as pd
+from hash_diff import diff_rows
+from hash_diff import format_decimals
+from hash_diff import hash_diff
+from hash_diff import source_buckets
+from hash_diff import source_digests
+
+SPEC = {
+    "table": "deposit_transactions",
+    "key": "id",
+    "date_column": "creation_date",
+    "columns": ["amount", "type"],
+    "decimals": {"amount": 2},
+}
+
+
+def transactions(*rows):
+    return pd.DataFrame(rows, columns=["id", "creation_date", "amount", "type"])
+
+
+def test_format_decimals_like_athena():
+    column = pd.Series([100, "100.0", 0.125, -0.001, 2.675, None, ""], dtype=object)
+
+    formatted = format_decimals(column, 2).tolist()
+
+    assert formatted[:5] == ["100.00", "100.00", "0.13", "0.00", "2.68"]
+    assert pd.isna(formatted[5]) and pd.isna(formatted[6])
+
+
+def test_source_digests_match_the_athena_digest():
+    input_df = transactions((1, "2025-01-01T10:30:00", 5, None))
+
+    digests_df = source_digests(input_df, SPEC)
+
+    digest = hashlib.md5(b"1|5.00|").digest()
+    assert digests_df["hour"].tolist() == ["2025-01-01T10"]
+    assert digests_df["digest"].tolist() == [digest.hex().upper()]
+    assert digests_df["hash_high"].tolist() == [
+        int.from_bytes(digest[:4], "big", signed=True)
+    ]
+
+
+def test_diff_rows_classifies_keys():
+    source_rows = pd.DataFrame(
+        {
+            "hour": ["h"] * 4,
+            "key": ["missing", "mutated", "duplicated", "same"],
+            "digest": ["a", "b", "c", "d"],
+        }
+    )
+    target_rows = pd.DataFrame(
+        {
+            "hour": ["h"] * 5,
+            "key": ["extra", "mutated", "duplicated", "duplicated", "same"],
+            "digest": ["e", "B", "c", "c", "d"],
+        }
+    )
+
+    diff_df = diff_rows(source_rows, target_rows)
+
+    assert dict(zip(diff_df["key"], diff_df["issue"])) == {
+        "duplicated": "duplicated",
+        "extra": "extra",
+        "missing": "missing",
+        "mutated": "mutated",
+    }
+
+
+def test_hash_diff_only_reads_the_rows_of_mismatching_hours():
+    source_df = transactions(
+        (1, "2025-01-01T10:00:00", 5, "DEPOSIT"),
+        (2, "2025-01-01T11:00:00", 7, "DEPOSIT"),
+        (3, "2025-01-02T09:00:00", 1, "FEE"),
+    )
+    # the data lake misses id 2
+    target_digests = source_digests(source_df[source_df["id"] != 2], SPEC)
+    queries = []
+
+    def read_sql(sql):
+        """
+        Target rows or bucket hashes under the buckets of the query
+        """
+        queries.append(sql)
+        buckets = re.search(r"IN \((.*?)\)", sql).group(1).replace("'", "").split(", ")
+        rows = target_digests[
+            target_digests["hour"].str.slice(0, len(buckets[0])).isin(buckets)
+        ]
+        if "GROUP BY" not in sql:
+            return rows
+        level = "hour" if "substr(hour, 1, 13) AS bucket" in sql else "day"
+        return source_buckets(rows, level).reset_index()
+
+    diff_df = hash_diff(source_df, SPEC, read_sql=read_sql)
+
+    assert diff_df.to_dict("records") == [
+        {"bucket": "2025-01-01T11", "key": "2", "issue": "missing"}
+    ]
+    assert len(queries) == 3
+    assert "IN ('2025-01-01')" in queries[1]
@@ -0,0 +1,14 @@
+import lambda_function
+import pandas as pd
+
+
+def test_backfill_is_skipped_when_the_athena_ids_cannot_be_read(monkeypatch):
+    monkeypatch.setattr(lambda_function, "get_athena_ids", lambda config: False)
+    monkeypatch.setattr(lambda_function, "check_counts", lambda *args: 1)
+    input_df = pd.DataFrame({"id": [1, 2], "creation_date": ["2025-01-01"] * 2})
+
+    result = lambda_function.backfill_missing_ids(
+        pd.DataFrame(), "deposit_transactions", input_df
+    )
+
+    assert result == (False, None)
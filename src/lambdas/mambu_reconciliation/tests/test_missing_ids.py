@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from missing_ids import contains_ids
+from missing_ids import find_missing_ids
+from missing_ids import to_ranges
+
+
+def test_find_missing_ids_ignores_order_and_duplicates():
+    missing_ids = find_missing_ids([9, 3, 1, 3, 7, 2, 10], ["2", "9", "11"])
+
+    assert missing_ids.tolist() == [1, 3, 7, 10]
+
+
+def test_find_missing_ids_with_an_empty_target():
+    assert find_missing_ids([2, 1], []).tolist() == [1, 2]
+    assert find_missing_ids([], [1]).tolist() == []
+
+
+def test_contains_ids_past_the_last_target_id():
+    mask = contains_ids([0, 5, 6, 20], np.array([5, 6, 10]))
+
+    assert mask.tolist() == [False, True, True, False]
+
+
+@pytest.mark.parametrize(
+    "sorted_ids, ranges",
+    [
+        ([], []),
+        ([4], [(4, 4)]),
+        ([1, 2, 3, 7, 9, 10], [(1, 3), (7, 7), (9, 10)]),
+    ],
+)
+def test_to_ranges(sorted_ids, ranges):
+    assert to_ranges(np.array(sorted_ids, dtype=np.int64)) == ranges
@@ -19,6 +19,15 @@ resource "aws_s3_object" "api_client_backfill_lambda_to_s3_raw" {
   etag   = filemd5("../src/lambdas/mambu_api_client_to_s3_raw/${each.value}")
 }
 
+resource "aws_s3_object" "api_client_backfill_common_to_s3_raw" {
+  for_each = toset(["state_store.py", "mambu_paging.py", "api_client.py", "athena_reader.py"])
+
+  bucket = local.glue_assets_bucket_name
+  key    = "${local.project_name}/scripts/mambu_api_client_backfill_to_s3_raw/${each.value}"
+  source = "../src/common/${each.value}"
+  etag   = filemd5("../src/common/${each.value}")
+}
+
 resource "aws_glue_job" "api_client_backfill_to_s3_raw" {
   name         = "${local.prefix}-api-client-backfill-to-s3-raw"
   description  = "AWS Glue Job"
@@ -42,6 +51,7 @@ resource "aws_glue_job" "api_client_backfill_to_s3_raw" {
     "--enable-glue-datacatalog"          = "true"
 
     "--S3_RAW"              = local.raw_datalake_bucket_name
+    "--S3_META"             = local.meta_datalake_bucket_name
     "--MAMBU_SUBDOMAIN"     = local.lambda_mambu_env_vars.MAMBU_SUBDOMAIN
     "--MAMBU_PASSWORD_NAME" = local.lambda_mambu_env_vars.MAMBU_PASSWORD_NAME
 
@@ -53,6 +63,10 @@ resource "aws_glue_job" "api_client_backfill_to_s3_raw" {
       [
         for file in fileset("../src/lambdas/mambu_api_client_to_s3_raw/", "*.py") :
         "s3://${local.glue_assets_bucket_name}/${local.project_name}/scripts/mambu_api_client_backfill_to_s3_raw/${file}"
+      ],
+      [
+        for file in aws_s3_object.api_client_backfill_common_to_s3_raw :
+        "s3://${local.glue_assets_bucket_name}/${file.key}"
       ]
     ))
   }
@@ -13,6 +13,10 @@ module "lambda_mambu_api_client_to_s3_raw" {
   memory_size   = 6144
 
   source_path = [
+    "../src/common/state_store.py",
+    "../src/common/mambu_paging.py",
+    "../src/common/api_client.py",
+    "../src/common/athena_reader.py",
     {
       path             = "${path.module}/../src/lambdas/mambu_api_client_to_s3_raw",
       pip_requirements = true,
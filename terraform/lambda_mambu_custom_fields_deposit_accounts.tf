@@ -10,6 +10,9 @@ module "lambda_mambu_custom_fields_deposit_accounts_to_s3_raw" {
   layers        = [local.lambda_layer_aws_wrangler_arn]
 
   source_path = [
+    "../src/common/athena_reader.py",
+    "../src/common/custom_fields.py",
+    "../src/common/state_store.py",
     "${path.module}/../src/lambdas/mambu_custom_fields_deposit_accounts_to_s3_raw/lambda_function.py",
     "${path.module}/../src/lambdas/mambu_custom_fields_deposit_accounts_to_s3_raw/config.py",
     "${path.module}/../src/lambdas/mambu_custom_fields_deposit_accounts_to_s3_raw/data_catalog.py",
@@ -17,8 +20,11 @@ module "lambda_mambu_custom_fields_deposit_accounts_to_s3_raw" {
   ]
 
   environment_variables = {
-    S3_RAW           = local.raw_datalake_bucket_name,
-    MAMBU_USER_AGENT = "ahmed.hadi@nomo.tech" # TODO: Review this
+    S3_RAW             = local.raw_datalake_bucket_name,
+    S3_META            = local.meta_datalake_bucket_name,
+    ATHENA_UNLOAD_PATH = "s3://${local.athena_results_bucket_name}/athena_unload",
+    MAMBU_USER_AGENT   = "ahmed.hadi@nomo.tech" # TODO: Review this
+    CUSTOM_FIELDS_MODE = "incremental"
   }
 
   hash_extra   = "${local.prefix}-custom-fields-deposit-acc-to-s3-raw"
@@ -14,6 +14,10 @@ module "lambda_mambu_deposit_custom_fields_to_s3_raw" {
 
   source_path = [
     "../src/common/selective_copy.py",
+    "../src/common/jsonl_reader.py",
+    "../src/common/mambu_extractor.py",
+    "../src/common/mambu_paging.py",
+    "../src/common/api_client.py",
     {
       path             = "${path.module}/../src/lambdas/mambu_deposit_custom_fields_to_s3_raw",
       pip_requirements = true,
@@ -13,7 +13,13 @@ module "lambda_mambu_gl_accounts_to_s3_raw" {
   memory_size   = 10240
 
   source_path = [
+    "../src/common/athena_reader.py",
     "../src/common/selective_copy.py",
+    "../src/common/state_store.py",
+    "../src/common/jsonl_reader.py",
+    "../src/common/mambu_extractor.py",
+    "../src/common/mambu_paging.py",
+    "../src/common/api_client.py",
     {
       path             = "${path.module}/../src/lambdas/mambu_gl_accounts_to_s3_raw",
       pip_requirements = true,
@@ -13,6 +13,10 @@ module "lambda_loan_accounts_installments_to_s3_raw" {
   memory_size   = 10240
 
   source_path = [
+    "../src/common/api_client.py",
+    "../src/common/async_api_client.py",
+    "../src/common/athena_reader.py",
+    "../src/common/state_store.py",
     {
       path             = "${path.module}/../src/lambdas/mambu_loan_installments_to_s3_raw",
       pip_requirements = true,
@@ -22,7 +26,12 @@ module "lambda_loan_accounts_installments_to_s3_raw" {
   environment_variables = merge(
     local.lambda_mambu_env_vars,
     {
-      MAMBU_USER_AGENT = "tap-mambu andreas.adamides@bb2.tech",
+      MAMBU_USER_AGENT          = "tap-mambu andreas.adamides@bb2.tech",
+      MAMBU_MAX_WORKERS         = 16,
+      MAMBU_HTTP_CLIENT         = "threads", # or "asyncio"
+      MAMBU_REQUEST_TIMEOUT     = 60,
+      INSTALLMENTS_LAYOUT       = "loan_account", # or "bucketed"
+      INSTALLMENTS_BUCKET_COUNT = 64,
     }
   )
 
@@ -16,7 +16,13 @@
 #   layers        = [local.lambda_layer_aws_wrangler_python310_arn, module.tap_mambu.lambda_layer_arn]
 
 #   source_path = [
+#     "../src/common/athena_reader.py",
 #     "../src/common/selective_copy.py",
+#     "../src/common/state_store.py",
+#     "../src/common/jsonl_reader.py",
+#     "../src/common/mambu_extractor.py",
+#     "../src/common/mambu_paging.py",
+#     "../src/common/api_client.py",
 #     {
 #       path             = "${path.module}/../src/lambdas/mambu_reconciliation",
 #       pip_requirements = true,
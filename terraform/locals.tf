@@ -12,6 +12,8 @@ locals {
   lambda_mambu_env_vars = {
     S3_RAW              = local.raw_datalake_bucket_name,
     S3_META             = local.meta_datalake_bucket_name,
+    ATHENA_UNLOAD_PATH  = "s3://${local.athena_results_bucket_name}/athena_unload",
+    ATHENA_CACHE_TTL    = 3600,
     MAMBU_SUBDOMAIN     = var.mambu_subdomain,
     MAMBU_USERNAME      = "blme_s3_exports",
     MAMBU_USER_AGENT    = var.mambu_user_agent,